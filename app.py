@@ -4,13 +4,19 @@ from datetime import datetime
 import pandas as pd
 
 # Local imports
-from data_fetcher import fetch_all_assets
+from refresher import BACKGROUND_REFRESH, read_snapshot, start_background_refresher
+from data_fetcher import fetch_all_assets, iter_collect_assets, parse_watchlist_text
+from quotes import quotes_to_frame
 from news import display_finance_news
 from chat import chat_interface
 from budgeting import budgeting_tool
+from backtest import backtest_tool
 from vectorstore_utils import create_or_load_vectorstore
-from data_fetcher import get_top_movers
-from technical_analysis import parse_technical_indicators
+from data_fetcher import get_top_movers, get_quota_status
+from technical_analysis import RSI_PERIOD, batch_technical_indicators
+from screener import ScreenerError, screen
+from resample import INTERVALS
+from risk import TRADING_DAYS, WINDOWS, correlation_heatmap, risk_report
 #from data_fetcher import AV_API_KEY
 
 import os
@@ -31,9 +37,15 @@ if 'chat_history' not in st.session_state:
 if 'vector_store' not in st.session_state:
     st.session_state['vector_store'] = None
 
+# Keep the watchlist warm in the background (one thread per server process)
+if BACKGROUND_REFRESH:
+    start_background_refresher()
+
 if 'asset_data' not in st.session_state:
-    st.session_state['asset_data'] = []
-    st.session_state['asset_data_timestamp'] = None
+    # Start from whatever the refresher last wrote, so the Assets tab isn't empty on first load
+    snapshot = read_snapshot()
+    st.session_state['asset_data'] = snapshot['rows'] if snapshot else []
+    st.session_state['asset_data_timestamp'] = snapshot['timestamp'] if snapshot else None
 
 # Main Title
 st.markdown("# Welcome to Your Personal Finance Assistant 💰")
@@ -51,19 +63,36 @@ with col2:
     else:
         st.write("**Data not loaded.**")
     if st.button("Update Data"):
-        with st.spinner("Fetching assets from Alpha Vantage..."):
-            st.session_state['asset_data'] = fetch_all_assets()
-            st.session_state['asset_data_timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        snapshot = read_snapshot() if BACKGROUND_REFRESH else None
+        if snapshot:
+            # The refresher owns the network; just nudge it and show its latest snapshot
+            start_background_refresher().wake()
+            st.session_state['asset_data'] = snapshot['rows']
+            st.session_state['asset_data_timestamp'] = snapshot['timestamp']
+            age = datetime.now() - datetime.strptime(snapshot['timestamp'], '%Y-%m-%d %H:%M:%S')
+            minutes = max(int(age.total_seconds() // 60), 0)
+            st.info(f"Showing the latest background snapshot, taken {minutes} min ago. "
+                    "A refresh of any stale entries has been requested; press Update Data again shortly to see it.")
+        else:
+            with st.spinner("Fetching assets from Alpha Vantage..."):
+                st.session_state['asset_data'] = fetch_all_assets()
+                st.session_state['asset_data_timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             st.success("Asset data updated successfully!")
+    quota = get_quota_status()
+    if quota['daily_limit']:
+        st.caption(f"Alpha Vantage calls today: {quota['used_today']}/{quota['daily_limit']}")
+    else:
+        st.caption(f"Alpha Vantage calls today: {quota['used_today']}")
 
 # Sidebar
 with st.sidebar:
     st.header("User Settings")
 
     # Process Documents
+    full_rebuild = st.checkbox("Rebuild from scratch", help="Re-embed every document instead of only new or changed ones")
     if st.button("Process Documents for Vector Store"):
         with st.spinner('Processing documents...'):
-            st.session_state['vector_store'] = create_or_load_vectorstore(force_recreate=True)
+            st.session_state['vector_store'] = create_or_load_vectorstore(force_recreate=True, full_rebuild=full_rebuild)
             st.success("Vector store created/updated.")
 
     # Financial Data Input
@@ -81,6 +110,13 @@ with st.sidebar:
             st.session_state['financial_data'] = financial_data_input
             st.success("Financial data updated.")
 
+# Numeric asset frame; formatting happens only here, in the column config, so sorting stays numeric
+ASSET_COLUMN_CONFIG = {
+    "Price": st.column_config.NumberColumn("Current Price", format="%g"),
+    "Change %": st.column_config.NumberColumn("Price Change (Today)", format="%.2f%%"),
+    "As Of": st.column_config.DateColumn("As Of"),
+}
+
 # Tabs
 tab1, tab2, tab3, tab4 = st.tabs(["News", "Assets", "Chat", "Tools"])
 
@@ -91,20 +127,97 @@ with tab1:
 # 2) Assets
 with tab2:
     st.header("Asset Data")
+
+    with st.expander("Custom Watchlist"):
+        watchlist_text = st.text_area(
+            "Instruments",
+            help="Stock tickers as-is, forex as fx:EUR/USD or fx:EURUSD, crypto as crypto:BTC/USD or crypto:BTCUSD; "
+                 "separated by commas or spaces."
+        )
+        fetch_watchlist = st.button("Fetch Watchlist")
+
+    table_slot = st.empty()
+    watchlist, invalid = parse_watchlist_text(watchlist_text) if fetch_watchlist else ({}, [])
+    if invalid:
+        st.warning(f"Skipped unrecognised entries: {', '.join(invalid)}. "
+                   "Use fx:EUR/USD or crypto:BTC/USD for currency pairs.")
+    if any(watchlist.values()):
+        # Large watchlists stream in shard by shard; redraw the table as rows arrive
+        progress = st.progress(0.0, text="Fetching watchlist...")
+        streamed = []
+        for update in iter_collect_assets(watchlist):
+            streamed.extend(update.rows)
+            for message in update.errors:
+                st.error(message)
+            if streamed:
+                table_slot.dataframe(quotes_to_frame(streamed), hide_index=True, column_config=ASSET_COLUMN_CONFIG)
+            progress.progress(update.done / max(update.total, 1), text=f"Fetched {update.done}/{update.total}")
+        progress.empty()
+        st.session_state['asset_data'] = streamed
+        st.session_state['asset_data_timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
     if st.session_state['asset_data']:
-        df = pd.DataFrame(st.session_state['asset_data'])
-        st.dataframe(df)
-
-        # Simple technical indicator parse or usage
-        st.subheader("Technical Indicators Example")
-        if st.button("Parse Tech Indicators for 1st Asset"):
-            first_ticker = df.iloc[0]['Ticker']
-            st.write(f"Parsing indicators for {first_ticker} ...")
-            indicators_dict = parse_technical_indicators(first_ticker)
-            st.write(indicators_dict)
+        df = quotes_to_frame(st.session_state['asset_data'])
+        table_slot.dataframe(df, hide_index=True, column_config=ASSET_COLUMN_CONFIG)
+
+        # Indicators for every stock in the table, computed together over one symbols x dates panel
+        st.subheader("Technical Indicators")
+        rsi_col, interval_col = st.columns(2)
+        rsi_period = rsi_col.number_input("RSI period", min_value=2, max_value=100, value=RSI_PERIOD, step=1)
+        indicator_interval = interval_col.selectbox("Timeframe", INTERVALS, help="Resampled from the cached daily bars")
+        if st.button("Compute Indicators for Stocks"):
+            stock_tickers = df.loc[df['Asset Class'] == 'Stock', 'Ticker'].tolist()
+            if stock_tickers:
+                with st.spinner(f"Computing indicators for {len(stock_tickers)} stocks..."):
+                    indicator_table = batch_technical_indicators(stock_tickers, int(rsi_period), indicator_interval)
+                st.dataframe(indicator_table, column_config={"As Of": st.column_config.DateColumn("As Of")})
+            else:
+                st.info("No stocks in the current asset table.")
+
+        # Rolling volatility, downside deviation, beta and correlations for the same stocks
+        st.subheader("Risk")
+        risk_window = st.selectbox("Window (trading days)", WINDOWS, index=WINDOWS.index(60))
+        if st.button("Compute Risk for Stocks"):
+            stock_tickers = df.loc[df['Asset Class'] == 'Stock', 'Ticker'].tolist()
+            if stock_tickers:
+                with st.spinner(f"Computing {risk_window}-day risk for {len(stock_tickers)} stocks..."):
+                    risk_table, corr, vol_history = risk_report(stock_tickers, int(risk_window))
+                if risk_table.empty:
+                    st.info("No price history available for these stocks.")
+                else:
+                    st.dataframe(risk_table, hide_index=True,
+                                 column_config={"As Of": st.column_config.DateColumn("As Of")})
+                    if len(corr) > 1:
+                        st.pyplot(correlation_heatmap(corr))
+                    st.line_chart(vol_history.tail(5 * TRADING_DAYS).dropna(how="all"))
+            else:
+                st.info("No stocks in the current asset table.")
     else:
         st.info("No asset data loaded. Click 'Update Data' at the top right to load data.")
 
+    # Screen every cached daily history for a condition, e.g. oversold stocks with a fresh MACD cross
+    with st.expander("Technical Screener"):
+        screen_condition = st.text_input(
+            "Condition",
+            value="RSI(14) < 30 and CROSSED_ABOVE(MACD(), MACD_SIGNAL(), 3)",
+            help="Indicators: RSI, SMA, EMA, MACD, MACD_SIGNAL, MACD_HIST, BB_UPPER, BB_MIDDLE, BB_LOWER, "
+                 "STOCHRSI_K, STOCHRSI_D, ATR, OBV; prices: OPEN, HIGH, LOW, CLOSE, VOLUME; "
+                 "helpers: CROSSED_ABOVE(a, b, bars), CROSSED_BELOW(a, b, bars), AGO(x, bars); combine with and/or/not."
+        )
+        screen_rank = st.text_input("Rank by", value="RSI(14)")
+        screen_descending = st.checkbox("Highest first", value=False)
+        if st.button("Run Screener"):
+            try:
+                with st.spinner("Screening cached histories..."):
+                    matches = screen(screen_condition, rank_by=screen_rank, descending=screen_descending)
+            except ScreenerError as e:
+                st.error(f"Invalid screener condition: {e}")
+            else:
+                if matches.empty:
+                    st.info("No cached symbol matches the condition.")
+                else:
+                    st.dataframe(matches, hide_index=True, column_config={"As Of": st.column_config.DateColumn("As Of")})
+
     # Crypto top movers
     st.subheader("Top Cryptocurrency Movers (24h Change)")
     top_movers = get_top_movers()
@@ -120,5 +233,6 @@ with tab3:
 # 4) Tools
 with tab4:
     budgeting_tool()
+    backtest_tool()
 
 st.write("\n\n---\n\n**Alpha Vantage API Key Used:**", AV_API_KEY)
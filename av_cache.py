@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import time
+import pickle
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+CACHE_DIR = os.getenv("FINBOT_CACHE_DIR", os.path.join(".cache", "alphavantage"))
+
+# Columns kept for every daily series. "date" is datetime64[D], the rest float64.
+SERIES_COLUMNS = ("open", "high", "low", "close", "volume")
+
+NEW_YORK = ZoneInfo("America/New_York")
+
+# While a market is trading (or a bar is still being finalised) we refetch at most this often.
+LIVE_TTL = timedelta(minutes=15)
+# Monthly/raw payloads such as ALL_COMMODITIES barely move within a day.
+SLOW_TTL = timedelta(hours=24)
+
+FX_FUNCTIONS = {"FX_DAILY"}
+CRYPTO_FUNCTIONS = {"DIGITAL_CURRENCY_DAILY"}
+SLOW_FUNCTIONS = {"ALL_COMMODITIES"}
+
+
+class CacheKey(NamedTuple):
+    function: str
+    symbol: str
+    market: Optional[str] = None
+    interval: str = "daily"
+    # Anything else that changes the response, e.g. "10-close" for an RSI(10) on closes
+    params: str = ""
+
+    def filename(self, ext: str) -> str:
+        parts = [self.function, self.symbol, self.market or "-", self.interval]
+        if self.params:
+            parts.append(self.params)
+        return os.path.join(CACHE_DIR, f"{_safe_name(parts)}.{ext}")
+
+
+def _safe_name(parts: list) -> str:
+    return "__".join(re.sub(r"[^A-Za-z0-9.\-]", "_", p) for p in parts)
+
+
+def _next_equity_open(now_ny: datetime) -> datetime:
+    """
+    Next 09:30 New York open strictly after now_ny, skipping weekends.
+    Exchange holidays are not modelled; on those days we just refetch once and get the same bar.
+    """
+    candidate = now_ny.replace(hour=9, minute=30, second=0, microsecond=0)
+    if candidate <= now_ny:
+        candidate += timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+def _next_fx_open(now_ny: datetime) -> datetime:
+    """FX trades from Sunday 17:00 to Friday 17:00 New York time."""
+    days_until_sunday = (6 - now_ny.weekday()) % 7
+    sunday = now_ny + timedelta(days=days_until_sunday)
+    return sunday.replace(hour=17, minute=0, second=0, microsecond=0)
+
+
+def expires_at(function: str, fetched_at: float) -> float:
+    """
+    Work out when an entry fetched at `fetched_at` (epoch seconds) goes stale.
+    Bars fetched while the market is closed stay valid until the next session opens,
+    so a weekend or overnight refresh never costs an API call.
+    """
+    fetched_ny = datetime.fromtimestamp(fetched_at, NEW_YORK)
+
+    if function in FX_FUNCTIONS:
+        weekday, hour = fetched_ny.weekday(), fetched_ny.hour
+        weekend = weekday == 5 or (weekday == 4 and hour >= 17) or (weekday == 6 and hour < 17)
+        if weekend:
+            return _next_fx_open(fetched_ny).timestamp()
+        return fetched_at + LIVE_TTL.total_seconds()
+
+    if function in CRYPTO_FUNCTIONS:
+        return fetched_at + LIVE_TTL.total_seconds()
+
+    if function in SLOW_FUNCTIONS:
+        return fetched_at + SLOW_TTL.total_seconds()
+
+    # Everything else (equity series and indicators computed on them) follows the US session
+    if fetched_ny.weekday() < 5:
+        session_open = fetched_ny.replace(hour=9, minute=30, second=0, microsecond=0)
+        # Give Alpha Vantage an hour after the 16:00 close to publish the final daily bar
+        settled = fetched_ny.replace(hour=17, minute=0, second=0, microsecond=0)
+        if session_open <= fetched_ny < settled:
+            return fetched_at + LIVE_TTL.total_seconds()
+    return _next_equity_open(fetched_ny).timestamp()
+
+
+def is_fresh(function: str, fetched_at: float, now: Optional[float] = None) -> bool:
+    now = time.time() if now is None else now
+    return now < expires_at(function, fetched_at)
+
+
+def cached_symbols(function: str) -> list:
+    """Symbols with a daily series on disk for `function` (as spelled in their cache file names)."""
+    prefix, suffix = f"{function}__", "__-__daily.npz"
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return []
+    return sorted(n[len(prefix):-len(suffix)] for n in names if n.startswith(prefix) and n.endswith(suffix))
+
+
+def load_series(key: CacheKey, allow_stale: bool = False) -> Optional[dict]:
+    """
+    Return the cached series for `key` as a dict of numpy columns, or None on a miss.
+    Stale entries count as a miss unless allow_stale is set.
+    """
+    path = key.filename("npz")
+    try:
+        with np.load(path) as npz:
+            fetched_at = float(npz["fetched_at"])
+            if not allow_stale and not is_fresh(key.function, fetched_at):
+                return None
+            series = {"date": npz["date"]}
+            for col in SERIES_COLUMNS:
+                series[col] = npz[col]
+            series["fetched_at"] = fetched_at
+            return series
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb", **kwargs):
+    """
+    Open a uniquely named temp file next to `path` and move it over `path` once the block finishes,
+    so readers never see a half-written entry and concurrent writers (threads or processes) never share a temp file.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_series(key: CacheKey, series: dict) -> None:
+    """
+    Write a parsed series to its own compressed .npz file.
+    Written to a temp file first so readers never see a half-written cache entry.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    columns = {col: np.asarray(series[col], dtype=np.float64) for col in SERIES_COLUMNS}
+    # Given a file object rather than a name, savez doesn't append ".npz" to the temp file
+    with atomic_write(key.filename("npz")) as f:
+        np.savez_compressed(
+            f,
+            date=np.asarray(series["date"], dtype="datetime64[D]"),
+            fetched_at=np.float64(series.get("fetched_at", time.time())),
+            **columns,
+        )
+
+
+def merge_series(stored: dict, update: dict):
+    """
+    Merge a compact (recent bars only) update into a stored full history, by date.
+    Bars from the update win where the two overlap, since the latest bar is still moving intraday.
+    Returns (merged, revised): `revised` is True when an overlapping bar other than the stored
+    latest one changed (e.g. a split adjustment), which invalidates anything derived incrementally.
+    Returns (None, False) when the update doesn't reach back to the stored history, so there
+    is a gap only a full refetch can fill.
+    """
+    old_dates, new_dates = stored["date"], update["date"]
+    if len(old_dates) == 0:
+        return update, True
+    if len(new_dates) == 0:
+        return stored, False
+    if new_dates[0] > old_dates[-1]:
+        return None, False
+
+    cut = np.searchsorted(old_dates, new_dates[0])
+    overlap_end = np.searchsorted(new_dates, old_dates[-1], side="right")
+    revised = False
+    if len(old_dates) - cut > 1:
+        # Compare the overlap, excluding the stored latest bar, on the dates present in both
+        old_idx = np.arange(cut, len(old_dates) - 1)
+        new_idx = np.searchsorted(new_dates, old_dates[old_idx])
+        present = (new_idx < overlap_end) & (new_dates[np.minimum(new_idx, len(new_dates) - 1)] == old_dates[old_idx])
+        revised = not np.allclose(stored["close"][old_idx[present]], update["close"][new_idx[present]], equal_nan=True)
+
+    merged = {"date": np.concatenate([old_dates[:cut], new_dates])}
+    for col in SERIES_COLUMNS:
+        merged[col] = np.concatenate([stored[col][:cut], update[col]])
+    merged["fetched_at"] = update.get("fetched_at", time.time())
+    return merged, revised
+
+
+def latest_bar(series: dict) -> dict:
+    """The newest bar; histories are kept ascending, so this is just the last index."""
+    bar = {"date": series["date"][-1]}
+    for col in SERIES_COLUMNS:
+        bar[col] = float(series[col][-1])
+    return bar
+
+
+def cached_at(key: CacheKey) -> Optional[float]:
+    """When `key` was last fetched, whatever its freshness; None if it was never cached."""
+    try:
+        with np.load(key.filename("npz")) as npz:
+            return float(npz["fetched_at"])
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        with open(key.filename("json"), "r", encoding="utf-8") as f:
+            return float(json.load(f).get("fetched_at", 0))
+    except (OSError, ValueError):
+        return None
+
+
+def load_payload(key: CacheKey, allow_stale: bool = False) -> Optional[dict]:
+    """Raw JSON cache for endpoints that aren't OHLCV series (commodities, indicators)."""
+    path = key.filename("json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not allow_stale and not is_fresh(key.function, entry.get("fetched_at", 0)):
+        return None
+    return entry.get("payload")
+
+
+def save_payload(key: CacheKey, payload: dict) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with atomic_write(key.filename("json"), "w", encoding="utf-8") as f:
+        json.dump({"fetched_at": time.time(), "payload": payload}, f)
+
+
+def load_state(key: CacheKey):
+    """Pickled derived state (e.g. streaming indicators) stored next to the series it was built from."""
+    try:
+        with open(key.filename("state.pkl"), "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+
+def drop_states(key: CacheKey) -> None:
+    """Delete every saved state derived from `key`'s series, whatever its interval or parameters."""
+    prefix = _safe_name([key.function, key.symbol, key.market or "-"]) + "__"
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(prefix) and name.endswith(".state.pkl"):
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except OSError:
+                pass
+
+
+def save_state(key: CacheKey, state) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with atomic_write(key.filename("state.pkl")) as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
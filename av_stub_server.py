@@ -0,0 +1,261 @@
+"""
+Offline stand-in for the Alpha Vantage /query endpoint.
+
+Replays recorded JSON payloads from fixtures/alphavantage/, or synthesises deterministic ones for
+every function the project uses. Latency, HTTP errors and rate-limit notes can be injected so
+fetch throughput and tail latency can be measured without spending quota.
+
+    python av_stub_server.py --port 8765 --latency-ms 150 --jitter-ms 50 --rate-limit-rate 0.02
+    AV_BASE_URL=http://127.0.0.1:8765/query streamlit run app.py
+
+Record mode proxies misses to the real API once and saves the responses as fixtures:
+
+    AV_API_KEY=... python av_stub_server.py --record
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import zlib
+import argparse
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+FIXTURE_DIR = os.path.join("fixtures", "alphavantage")
+REAL_AV_URL = "https://www.alphavantage.co/query"
+
+RATE_LIMIT_NOTE = {
+    "Note": "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute "
+            "and 25 requests per day. Please visit https://www.alphavantage.co/premium/ (stub injected)"
+}
+
+SERIES_KEYS = {
+    "TIME_SERIES_DAILY": "Time Series (Daily)",
+    "FX_DAILY": "Time Series FX (Daily)",
+    "DIGITAL_CURRENCY_DAILY": "Time Series (Digital Currency Daily)",
+}
+
+# Fields each synthesised indicator row carries
+INDICATOR_FIELDS = {
+    "RSI": ("RSI",),
+    "SMA": ("SMA",),
+    "EMA": ("EMA",),
+    "MACD": ("MACD", "MACD_Signal", "MACD_Hist"),
+    "BBANDS": ("Real Upper Band", "Real Middle Band", "Real Lower Band"),
+    "STOCHRSI": ("FastK", "FastD"),
+}
+
+
+def fixture_name(params: dict) -> str:
+    """Stable file name for a request: function plus every other parameter except the key."""
+    parts = [params.get("function", "UNKNOWN")]
+    for k in sorted(params):
+        if k not in ("function", "apikey"):
+            parts.append(f"{k}={params[k]}")
+    return re.sub(r"[^A-Za-z0-9.=,\-_]", "_", "__".join(parts)) + ".json"
+
+
+def _rng(params: dict) -> random.Random:
+    """Per-request deterministic generator, so the same query always gets the same synthetic data."""
+    return random.Random(zlib.crc32(fixture_name(params).encode()))
+
+
+def _walk(rng: random.Random, bars: int, start: float, vol: float) -> list:
+    """Geometric random walk of (date, open, high, low, close, volume), oldest first, weekdays only."""
+    out, price, day = [], start, date.today()
+    days = []
+    while len(days) < bars:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    for d in reversed(days):
+        open_price = price
+        close_price = max(0.01, open_price * (1 + rng.gauss(0, vol)))
+        high = max(open_price, close_price) * (1 + abs(rng.gauss(0, vol / 2)))
+        low = min(open_price, close_price) * (1 - abs(rng.gauss(0, vol / 2)))
+        out.append((d.isoformat(), open_price, high, low, close_price, rng.randint(10_000, 5_000_000)))
+        price = close_price
+    return out
+
+
+def synthesize(params: dict) -> dict:
+    """A payload shaped like the real one for the functions data_fetcher and technical_analysis call."""
+    function = params.get("function", "")
+    rng = _rng(params)
+    bars = 5000 if params.get("outputsize") == "full" else 100
+
+    if function in SERIES_KEYS:
+        start, vol = {"FX_DAILY": (1.1, 0.004), "DIGITAL_CURRENCY_DAILY": (40000.0, 0.03)}.get(function, (150.0, 0.015))
+        rows = _walk(rng, bars, start, vol)
+        decimals = 5 if function == "FX_DAILY" else 4
+        series = {}
+        for d, o, h, l, c, v in reversed(rows):
+            bar = {"1. open": f"{o:.{decimals}f}", "2. high": f"{h:.{decimals}f}",
+                   "3. low": f"{l:.{decimals}f}", "4. close": f"{c:.{decimals}f}"}
+            if function != "FX_DAILY":
+                bar["5. volume"] = str(v)
+            series[d] = bar
+        return {"Meta Data": {"1. Information": "Synthetic data (av_stub_server)"}, SERIES_KEYS[function]: series}
+
+    if function == "REALTIME_BULK_QUOTES":
+        data = []
+        for sym in params.get("symbol", "").split(","):
+            d, o, h, l, c, v = _walk(_rng({"function": function, "symbol": sym}), 1, 150.0, 0.015)[-1]
+            data.append({"symbol": sym, "timestamp": f"{d} 16:00:00", "open": f"{o:.4f}", "high": f"{h:.4f}",
+                         "low": f"{l:.4f}", "close": f"{c:.4f}", "volume": str(v)})
+        return {"endpoint": "Realtime Bulk Quotes", "data": data}
+
+    if function == "ALL_COMMODITIES":
+        rows = _walk(rng, 120, 150.0, 0.03)
+        return {"name": "Global Price Index of All Commodities", "interval": "monthly",
+                "data": [{"date": d, "value": f"{c:.2f}"} for d, _, _, _, c, _ in reversed(rows)]}
+
+    if function in INDICATOR_FIELDS:
+        rows = _walk(rng, bars, 50.0, 0.02)
+        analysis = {}
+        for d, _, _, _, c, _ in reversed(rows):
+            analysis[d] = {field: f"{c + i * rng.random():.4f}" for i, field in enumerate(INDICATOR_FIELDS[function])}
+        return {"Meta Data": {"2: Indicator": function}, f"Technical Analysis: {function}": analysis}
+
+    return {"Error Message": f"Invalid API call. The stub has no data for function={function}."}
+
+
+class StubConfig:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 per_minute=0, record=False, synthesize=True, fixture_dir=FIXTURE_DIR):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.per_minute = per_minute
+        self.record = record
+        self.synthesize = synthesize
+        self.fixture_dir = fixture_dir
+        self.calls = []
+        self.served = 0
+        self.lock = threading.Lock()
+
+
+def load_fixture(params: dict, fixture_dir: str = FIXTURE_DIR):
+    """Exact recording for these parameters, else a per-function fallback file like RSI.json."""
+    for name in (fixture_name(params), f"{params.get('function', '')}.json"):
+        path = os.path.join(fixture_dir, name)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    return None
+
+
+def record_fixture(params: dict, fixture_dir: str = FIXTURE_DIR) -> dict:
+    api_key = os.getenv("AV_API_KEY")
+    if not api_key:
+        return {"Error Message": "Record mode needs AV_API_KEY in the environment."}
+    r = requests.get(REAL_AV_URL, params={**params, "apikey": api_key}, timeout=30)
+    data = r.json()
+    if "Note" in data or "Information" in data or "Error Message" in data:
+        return data  # never save throttling or error bodies as fixtures
+    os.makedirs(fixture_dir, exist_ok=True)
+    with open(os.path.join(fixture_dir, fixture_name(params)), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    return data
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    config: StubConfig = None
+
+    def _over_minute_limit(self) -> bool:
+        cfg = self.config
+        if not cfg.per_minute:
+            return False
+        now = time.monotonic()
+        with cfg.lock:
+            cfg.calls = [t for t in cfg.calls if now - t < 60]
+            cfg.calls.append(now)
+            return len(cfg.calls) > cfg.per_minute
+
+    def _send(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        cfg = self.config
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        with cfg.lock:
+            cfg.served += 1
+
+        delay = max(0.0, cfg.latency_ms + random.uniform(-cfg.jitter_ms, cfg.jitter_ms)) / 1000
+        if delay:
+            time.sleep(delay)
+        if random.random() < cfg.error_rate:
+            return self._send(500, {"error": "stub injected server error"})
+        if self._over_minute_limit() or random.random() < cfg.rate_limit_rate:
+            return self._send(200, RATE_LIMIT_NOTE)
+
+        data = load_fixture(params, cfg.fixture_dir)
+        if data is None and cfg.record:
+            data = record_fixture(params, cfg.fixture_dir)
+        if data is None and cfg.synthesize:
+            data = synthesize(params)
+        if data is None:
+            data = {"Error Message": f"No fixture for {fixture_name(params)}"}
+        self._send(200, data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(config: StubConfig = None, host: str = "127.0.0.1", port: int = 0):
+    """Start the stub on a background thread; returns (server, base_url). Port 0 picks a free port."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="av-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/query"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline Alpha Vantage stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter around the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered with a rate-limit Note")
+    parser.add_argument("--per-minute", type=int, default=0, help="emulate a per-minute call limit (0 = off)")
+    parser.add_argument("--record", action="store_true", help="fetch misses from the real API and save them")
+    parser.add_argument("--no-synthesize", action="store_true", help="only serve recorded fixtures")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        per_minute=args.per_minute,
+        record=args.record,
+        synthesize=not args.no_synthesize,
+        fixture_dir=args.fixtures,
+    )
+    server, url = start_stub_server(config, args.host, args.port)
+    print(f"Alpha Vantage stub listening on {url} (fixtures: {args.fixtures})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+Vectorised signal backtester over the cached daily series.
+
+Entry and exit rules are screener conditions (see screener.py), evaluated bar by bar over a
+symbol's whole history. A rule fires on a bar's close and is filled at the next bar's close, so
+a signal never trades on the close that produced it; the position earns returns from the bar
+after the fill. Positions are long or flat.
+Everything is array arithmetic over a (strategies x bars) matrix with no per-bar loop, which is
+what lets a parameter sweep simulate hundreds of variants at once.
+"""
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from av_cache import SERIES_COLUMNS
+from data_fetcher import fetch_daily_series
+from screener import Condition, ScreenerError, evaluate_series
+
+TRADING_DAYS = 252
+DEFAULT_FEE_BPS = 1.0
+DEFAULT_SLIPPAGE_BPS = 5.0
+
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+# Sweeps smaller than this run in-process; starting the pool would cost more than it saves
+PARALLEL_MIN_VARIANTS = 32
+TASKS_PER_WORKER = 4
+
+
+def positions(entry: np.ndarray, exit_: np.ndarray) -> np.ndarray:
+    """Position held after each bar's close: 1 from an entry signal until an exit signal (exit wins ties)."""
+    state = np.where(exit_, 0.0, np.where(entry, 1.0, np.nan))
+    cols = np.arange(state.shape[-1])
+    last_signal = np.maximum.accumulate(np.where(np.isnan(state), -1, cols), axis=-1)
+    held = np.take_along_axis(state, np.clip(last_signal, 0, None), axis=-1)
+    return np.where(last_signal < 0, 0.0, held)
+
+
+def simulate(close: np.ndarray, entry: np.ndarray, exit_: np.ndarray,
+             fee_bps: float = DEFAULT_FEE_BPS, slippage_bps: float = DEFAULT_SLIPPAGE_BPS) -> dict:
+    """
+    Run every row of the (strategies x bars) entry/exit matrices against one close series.
+    Signals are filled at the next bar's close; each fill pays fee + slippage (basis points of
+    the traded value) on the bar it happens.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    bar_returns = np.zeros(close.shape[-1])
+    bar_returns[1:] = close[1:] / close[:-1] - 1.0
+    wanted = positions(entry, exit_)
+    # Position after each bar's close: what the previous bar's signals asked for
+    held = np.zeros(wanted.shape)
+    held[..., 1:] = wanted[..., :-1]
+    exposure = np.zeros(held.shape)
+    exposure[..., 1:] = held[..., :-1]
+    trades = np.abs(np.diff(held, axis=-1, prepend=0.0))
+    returns = exposure * bar_returns - trades * (fee_bps + slippage_bps) / 1e4
+    return {
+        "position": exposure,
+        "trades": trades,
+        "returns": returns,
+        "equity": np.cumprod(1.0 + returns, axis=-1),
+    }
+
+
+def performance(result: dict, dates: np.ndarray) -> dict:
+    """CAGR, Sharpe, max drawdown, turnover, trade count and exposure for every simulated row."""
+    equity, returns, trades = result["equity"], result["returns"], result["trades"]
+    years = (dates[-1] - dates[0]) / np.timedelta64(1, "D") / 365.25 if len(dates) > 1 else 0.0
+    final = equity[..., -1]
+    cagr = turnover = np.full(final.shape, np.nan)
+    if years > 0:
+        cagr = np.power(np.maximum(final, 0.0), 1.0 / years) - 1.0
+        # One-way position changes per year; 2.0 means one full round trip a year
+        turnover = trades.sum(axis=-1) / years
+    sharpe = np.full(final.shape, np.nan)
+    if returns.shape[-1] > 1:
+        std = returns.std(axis=-1, ddof=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe = np.where(std > 0, returns.mean(axis=-1) / std * np.sqrt(TRADING_DAYS), np.nan)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=-1), 1.0)
+    return {
+        "Total Return": final - 1.0,
+        "CAGR": cagr,
+        "Sharpe": sharpe,
+        "Max Drawdown": (equity / peak - 1.0).min(axis=-1),
+        "Turnover": turnover,
+        "Trades": (np.diff(result["position"], axis=-1) > 0).sum(axis=-1),
+        "Exposure": result["position"].mean(axis=-1),
+    }
+
+
+def _prices(series: dict) -> dict:
+    """One series as 1 x bars matrices, the layout screener.evaluate_series works on."""
+    prices = {col: np.asarray(series[col], dtype=np.float64)[None, :] for col in SERIES_COLUMNS}
+    prices["obv_offset"] = np.zeros(1)
+    return prices
+
+
+def backtest_series(series: dict, entry: str, exit_: str,
+                    fee_bps: float = DEFAULT_FEE_BPS, slippage_bps: float = DEFAULT_SLIPPAGE_BPS):
+    """
+    Backtest one entry/exit rule pair on a daily series.
+    Returns (metrics dict, equity DataFrame with Strategy and Buy & Hold columns indexed by date).
+    """
+    prices = _prices(series)
+    memo = {}
+    entry_signal = evaluate_series(Condition(entry), prices, memo)
+    exit_signal = evaluate_series(Condition(exit_), prices, memo)
+    result = simulate(series["close"], entry_signal, exit_signal, fee_bps, slippage_bps)
+    metrics = {name: float(values[0]) for name, values in performance(result, series["date"]).items()}
+    close = np.asarray(series["close"], dtype=np.float64)
+    equity = pd.DataFrame(
+        {"Strategy": result["equity"][0], "Buy & Hold": close / close[0]},
+        index=pd.to_datetime(series["date"]),
+    )
+    return metrics, equity
+
+
+def expand_grid(grid: dict) -> list:
+    """Every combination of a {name: values} grid, as a list of {name: value} dicts."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def _run_variants(prices: dict, dates: np.ndarray, rules: list, fee_bps: float, slippage_bps: float) -> dict:
+    """Simulate (entry, exit) rule pairs together as one matrix; indicators are computed once per distinct call."""
+    memo = {}
+    entry = np.vstack([evaluate_series(Condition(e), prices, memo) for e, _ in rules])
+    exit_ = np.vstack([evaluate_series(Condition(x), prices, memo) for _, x in rules])
+    return performance(simulate(prices["close"][0], entry, exit_, fee_bps, slippage_bps), dates)
+
+
+# Set in each pool worker by _init_worker, so the series is sent once per worker rather than per task
+_worker_prices = None
+_worker_dates = None
+
+
+def _init_worker(prices: dict, dates: np.ndarray) -> None:
+    global _worker_prices, _worker_dates
+    _worker_prices, _worker_dates = prices, dates
+
+
+def _run_variants_worker(rules: list, fee_bps: float, slippage_bps: float) -> dict:
+    return _run_variants(_worker_prices, _worker_dates, rules, fee_bps, slippage_bps)
+
+
+def sweep(series: dict, entry_template: str, exit_template: str, grid: dict,
+          fee_bps: float = DEFAULT_FEE_BPS, slippage_bps: float = DEFAULT_SLIPPAGE_BPS,
+          workers: int = None) -> pd.DataFrame:
+    """
+    Backtest every combination of `grid` substituted into the rule templates, e.g.
+    entry "RSI({period}) < {lower}" and exit "RSI({period}) > {upper}" over
+    {"period": range(5, 31), "lower": [20, 30], "upper": [70, 80]}.
+    Variants are split into contiguous chunks across a process pool; each chunk runs as one matrix.
+    Returns one row per variant (parameters then metrics), best Sharpe first.
+    """
+    combos = expand_grid(grid)
+    if not combos:
+        return pd.DataFrame()
+    try:
+        rules = [(entry_template.format(**c), exit_template.format(**c)) for c in combos]
+    except (KeyError, IndexError, ValueError) as e:
+        raise ScreenerError(f"rule templates don't match the grid parameters: {e}") from None
+    # Fail fast on an invalid rule (syntax or an out-of-range period), before any workers start
+    for text in set(r for rule in rules for r in rule):
+        Condition(text)
+
+    prices, dates = _prices(series), series["date"]
+    workers = BACKTEST_WORKERS if workers is None else workers
+    if workers > 1 and len(rules) >= PARALLEL_MIN_VARIANTS:
+        bounds = np.linspace(0, len(rules), min(len(rules), workers * TASKS_PER_WORKER) + 1).astype(int)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(prices, dates)) as pool:
+            futures = [
+                pool.submit(_run_variants_worker, rules[lo:hi], fee_bps, slippage_bps)
+                for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+            ]
+            parts = [f.result() for f in futures]
+        metrics = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    else:
+        metrics = _run_variants(prices, dates, rules, fee_bps, slippage_bps)
+
+    table = pd.DataFrame(combos)
+    for name, values in metrics.items():
+        table[name] = values
+    return table.sort_values("Sharpe", ascending=False, na_position="last", kind="stable").reset_index(drop=True)
+
+
+def _parse_values(text: str) -> list:
+    return [float(v) if "." in v else int(v) for v in text.replace(",", " ").split()]
+
+
+PERCENT_COLUMNS = ("Total Return", "CAGR", "Max Drawdown", "Exposure")
+
+
+def backtest_tool():
+    st.header("Strategy Backtester")
+    st.write("Entry and exit rules use the screener syntax, e.g. `RSI(14) < 30` or "
+             "`CROSSED_ABOVE(MACD(), MACD_SIGNAL())`. Signals are filled at the next bar's close.")
+
+    symbol = st.text_input("Symbol", value="IBM").strip().upper()
+    col1, col2 = st.columns(2)
+    fee_bps = col1.number_input("Fee (bps per trade)", min_value=0.0, value=DEFAULT_FEE_BPS, step=0.5)
+    slippage_bps = col2.number_input("Slippage (bps per trade)", min_value=0.0, value=DEFAULT_SLIPPAGE_BPS, step=0.5)
+
+    st.subheader("Single Backtest")
+    entry = st.text_input("Entry rule", value="RSI(14) < 30")
+    exit_ = st.text_input("Exit rule", value="RSI(14) > 70")
+    run_single = st.button("Run Backtest")
+
+    st.subheader("Parameter Sweep")
+    entry_template = st.text_input("Entry template", value="RSI({period}) < {lower}")
+    exit_template = st.text_input("Exit template", value="RSI({period}) > {upper}")
+    period_range = st.slider("period", min_value=2, max_value=60, value=(5, 30))
+    lower_text = st.text_input("lower", value="20, 25, 30, 35")
+    upper_text = st.text_input("upper", value="65, 70, 75, 80")
+    run_sweep = st.button("Run Sweep")
+
+    if not (run_single or run_sweep) or not symbol:
+        return
+    try:
+        series = fetch_daily_series("TIME_SERIES_DAILY", symbol)
+    except Exception as e:
+        st.error(f"Error fetching price history for {symbol}: {e}")
+        return
+    if not series:
+        st.error(f"No daily history available for {symbol}.")
+        return
+
+    try:
+        if run_single:
+            metrics, equity = backtest_series(series, entry, exit_, fee_bps, slippage_bps)
+            cols = st.columns(4)
+            cols[0].metric("CAGR", f"{metrics['CAGR']:.2%}")
+            cols[1].metric("Sharpe", f"{metrics['Sharpe']:.2f}")
+            cols[2].metric("Max Drawdown", f"{metrics['Max Drawdown']:.2%}")
+            cols[3].metric("Turnover", f"{metrics['Turnover']:.2f}/yr")
+            st.caption(f"{metrics['Trades']:.0f} trades, in the market {metrics['Exposure']:.0%} of the time, "
+                       f"total return {metrics['Total Return']:.2%}.")
+            st.line_chart(equity)
+        if run_sweep:
+            grid = {
+                "period": list(range(period_range[0], period_range[1] + 1)),
+                "lower": _parse_values(lower_text),
+                "upper": _parse_values(upper_text),
+            }
+            with st.spinner(f"Backtesting {len(expand_grid(grid))} variants..."):
+                results = sweep(series, entry_template, exit_template, grid, fee_bps, slippage_bps)
+            config = {c: st.column_config.NumberColumn(c, format="%.2f%%") for c in PERCENT_COLUMNS}
+            shown = results.copy()
+            for c in PERCENT_COLUMNS:
+                shown[c] = shown[c] * 100
+            st.dataframe(shown, hide_index=True, column_config=config)
+    except (ScreenerError, ValueError) as e:
+        st.error(f"Invalid backtest rules: {e}")
@@ -0,0 +1,116 @@
+"""
+Fetch throughput / tail-latency benchmark against the offline Alpha Vantage stub.
+
+    python bench_fetch.py --iterations 20 --latency-ms 120 --jitter-ms 60
+    python bench_fetch.py --url http://127.0.0.1:8765/query   # use an already running stub
+
+Every iteration starts from an empty cache so it measures the network path, not cache hits.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+from av_stub_server import StubConfig, start_stub_server
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return float("nan")
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name: str, samples: list, requests_made: int) -> None:
+    total = sum(samples)
+    print(
+        f"{name:<14} n={len(samples):<4} mean={statistics.mean(samples) * 1000:8.1f}ms "
+        f"p50={percentile(samples, 50) * 1000:8.1f}ms p95={percentile(samples, 95) * 1000:8.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.1f}ms max={max(samples) * 1000:8.1f}ms "
+        f"throughput={requests_made / total if total else float('nan'):7.1f} req/s"
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark data_fetcher against the Alpha Vantage stub.")
+    parser.add_argument("--url", help="base URL of a running stub; by default one is started in-process")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--symbols", default="IBM,AAPL,GOOGL,MSFT,AMZN", help="symbols for the indicator scenarios")
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.url:
+        url = args.url
+    else:
+        config = StubConfig(
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+        )
+        _, url = start_stub_server(config)
+
+    # data_fetcher reads these at import time; the stub has no quota to protect
+    os.environ["AV_BASE_URL"] = url
+    os.environ.setdefault("AV_API_KEY", "stub")
+    os.environ["AV_CALLS_PER_MINUTE"] = "100000"
+    os.environ["AV_CALLS_PER_DAY"] = "0"
+    os.environ["AV_BULK_QUOTES"] = "1"
+
+    import av_cache
+    import data_fetcher
+    from singleflight import shared as shared_flights
+    from technical_analysis import parse_technical_indicators
+
+    symbols = [s for s in args.symbols.split(",") if s]
+    cache_dirs = []
+    sent = 0
+
+    # Counted on the client, so throughput is right against an external stub (--url) as well
+    get_json = data_fetcher.get_json
+
+    async def counting_get_json(*a, **kw):
+        nonlocal sent
+        sent += 1
+        return await get_json(*a, **kw)
+
+    data_fetcher.get_json = counting_get_json
+
+    def cold():
+        av_cache.CACHE_DIR = tempfile.mkdtemp(prefix="bench-av-cache-")
+        cache_dirs.append(av_cache.CACHE_DIR)
+        shared_flights.clear()
+
+    scenarios = {
+        "all_assets": lambda: data_fetcher.collect_assets(data_fetcher.DEFAULT_WATCHLIST, history=True),
+        "bulk_quotes": lambda: data_fetcher.collect_assets({"stocks": symbols}),
+        "indicator_rsi": lambda: [data_fetcher.fetch_indicator_data(s, "RSI") for s in symbols],
+        "parse_ta": lambda: [parse_technical_indicators(s) for s in symbols],
+    }
+
+    print(f"Alpha Vantage stub at {url}")
+    try:
+        for name, run in scenarios.items():
+            samples, before = [], sent
+            for _ in range(args.iterations):
+                cold()
+                start = time.perf_counter()
+                run()
+                samples.append(time.perf_counter() - start)
+            report(name, samples, sent - before)
+    finally:
+        for path in cache_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
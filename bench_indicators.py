@@ -0,0 +1,278 @@
+"""
+Correctness and throughput benchmark for the indicators in technical_analysis.py. Runs offline.
+
+    python bench_indicators.py --symbols IBM,AAPL --batch-symbols 500
+    python bench_indicators.py --save bench_indicators.json              # record a baseline
+    python bench_indicators.py --baseline bench_indicators.json          # fail on a >20% slowdown
+    AV_API_KEY=... python bench_indicators.py --record --symbols IBM     # capture fixtures once
+
+RSI, MACD, EMA, BBANDS and STOCHRSI are checked against recorded Alpha Vantage indicator payloads
+in fixtures/alphavantage/ (the av_stub_server layout) and against pandas_ta when it is installed.
+The streaming (indicator_state) and panel paths are checked against the single-series one.
+Symbols without a recorded daily series use the stub's deterministic synthetic history, which
+is fine for throughput and for the pandas_ta and internal checks. No fixtures are committed, so the
+Alpha Vantage comparison is skipped (and says so) until someone records them with --record.
+The exit status is 1 if any check is out of tolerance or any mode is slower than the baseline allows.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+
+import numpy as np
+
+from av_stub_server import FIXTURE_DIR, fixture_name, record_fixture, synthesize
+
+TIME_PERIOD = 14
+# Every indicator here forgets how it was seeded well within this many bars, so values after it
+# have to agree whatever history each implementation started from
+WARMUP_BARS = 250
+# Largest allowed absolute difference per indicator field (Alpha Vantage rounds to 4 decimals)
+TOLERANCE = {
+    "RSI": 1e-2,
+    "EMA": 1e-2,
+    "MACD": 1e-2,
+    "MACD_Signal": 1e-2,
+    "MACD_Hist": 1e-2,
+    "Real Upper Band": 1e-2,
+    "Real Middle Band": 1e-2,
+    "Real Lower Band": 1e-2,
+    "FastK": 5e-2,
+    "FastD": 5e-2,
+}
+COMPARED = ("RSI", "EMA", "MACD", "BBANDS", "STOCHRSI")
+# Internal paths must agree to rounding error
+INTERNAL_TOLERANCE = 1e-8
+INCREMENTAL_BARS = 20  # new bars per incremental update
+
+
+def indicator_params(symbol: str, function: str) -> dict:
+    """The request fetch_indicator_data would send to Alpha Vantage for this indicator."""
+    return {"function": function, "symbol": symbol, "interval": "daily",
+            "time_period": TIME_PERIOD, "series_type": "close"}
+
+
+def daily_params(symbol: str) -> dict:
+    return {"function": "TIME_SERIES_DAILY", "symbol": symbol, "outputsize": "full"}
+
+
+def recorded(params: dict, fixture_dir: str):
+    """The exact recording for these parameters, or None (the stub's per-function fallbacks don't count)."""
+    path = os.path.join(fixture_dir, fixture_name(params))
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_series(symbol: str, fixture_dir: str):
+    """(daily series, True if it was recorded rather than synthesised)."""
+    from data_fetcher import SERIES_KEYS, _parse_daily_series
+
+    data = recorded(daily_params(symbol), fixture_dir)
+    is_recorded = data is not None
+    if data is None:
+        data = synthesize(daily_params(symbol))
+    return _parse_daily_series(data.get(SERIES_KEYS["TIME_SERIES_DAILY"], {})), is_recorded
+
+
+def record(symbols: list, fixture_dir: str) -> int:
+    failures = 0
+    for sym in symbols:
+        for params in [daily_params(sym)] + [indicator_params(sym, f) for f in COMPARED]:
+            data = record_fixture(params, fixture_dir)
+            ok = not any(k in data for k in ("Note", "Information", "Error Message"))
+            failures += not ok
+            print(f"{'recorded' if ok else 'FAILED  '} {fixture_name(params)}")
+            # The free tier allows 5 calls a minute
+            time.sleep(12)
+    return 1 if failures else 0
+
+
+def _max_diff(ours: np.ndarray, theirs: np.ndarray) -> float:
+    both = ~np.isnan(ours) & ~np.isnan(theirs)
+    return float(np.max(np.abs(ours[both] - theirs[both]))) if both.any() else float("nan")
+
+
+def compare_av(symbol: str, series: dict, fixture_dir: str) -> list:
+    """(check, field, compared bars, max abs diff, tolerance) against each recorded AV payload."""
+    from technical_analysis import _indicator_columns
+
+    rows = []
+    dates = series["date"]
+    for function in COMPARED:
+        payload = recorded(indicator_params(symbol, function), fixture_dir)
+        if payload is None:
+            continue
+        analysis = payload.get(f"Technical Analysis: {function}", {})
+        ours = _indicator_columns(function, series, TIME_PERIOD, "close")
+        av_dates = np.array(list(analysis), dtype="datetime64[D]")
+        idx = np.searchsorted(dates, av_dates)
+        found = (idx < len(dates)) & (idx >= WARMUP_BARS)
+        found[found] &= dates[idx[found]] == av_dates[found]
+        for field, values in ours.items():
+            theirs = np.array([float(analysis[str(d)][field]) for d in av_dates[found]])
+            rows.append((f"{symbol} vs Alpha Vantage", field, int(found.sum()),
+                         _max_diff(values[idx[found]], theirs), TOLERANCE[field]))
+    return rows
+
+
+def compare_pandas_ta(symbol: str, series: dict) -> list:
+    """Same as compare_av against pandas_ta; empty if pandas_ta isn't installed."""
+    try:
+        import pandas as pd
+        import pandas_ta
+    except ImportError:
+        return []
+    from technical_analysis import bbands, ema, macd, rsi, stochrsi
+
+    close = pd.Series(series["close"])
+    line, signal, hist = macd(series["close"])
+    upper, middle, lower = bbands(series["close"], TIME_PERIOD)
+    fastk, fastd = stochrsi(series["close"], TIME_PERIOD)
+    checks = {
+        "RSI": (rsi(series["close"], TIME_PERIOD), lambda: pandas_ta.rsi(close, length=TIME_PERIOD)),
+        "EMA": (ema(series["close"], TIME_PERIOD), lambda: pandas_ta.ema(close, length=TIME_PERIOD)),
+        "MACD": (line, lambda: pandas_ta.macd(close, 12, 26, 9).iloc[:, 0]),
+        "MACD_Hist": (hist, lambda: pandas_ta.macd(close, 12, 26, 9).iloc[:, 1]),
+        "MACD_Signal": (signal, lambda: pandas_ta.macd(close, 12, 26, 9).iloc[:, 2]),
+        "Real Lower Band": (lower, lambda: pandas_ta.bbands(close, TIME_PERIOD, 2.0, ddof=0).iloc[:, 0]),
+        "Real Middle Band": (middle, lambda: pandas_ta.bbands(close, TIME_PERIOD, 2.0, ddof=0).iloc[:, 1]),
+        "Real Upper Band": (upper, lambda: pandas_ta.bbands(close, TIME_PERIOD, 2.0, ddof=0).iloc[:, 2]),
+        # k=1 leaves %K unsmoothed, as Alpha Vantage's FastK is
+        "FastK": (fastk, lambda: pandas_ta.stochrsi(close, 5, TIME_PERIOD, k=1, d=3).iloc[:, 0]),
+        "FastD": (fastd, lambda: pandas_ta.stochrsi(close, 5, TIME_PERIOD, k=1, d=3).iloc[:, 1]),
+    }
+    rows = []
+    for field, (ours, theirs) in checks.items():
+        try:
+            values = np.asarray(theirs(), dtype=np.float64)
+        except Exception as e:
+            print(f"pandas_ta {field} failed: {e}", file=sys.stderr)
+            values = np.full(len(close), np.nan)
+        n = max(len(close) - WARMUP_BARS, 0)
+        rows.append((f"{symbol} vs pandas_ta", field, n, _max_diff(ours[WARMUP_BARS:], values[WARMUP_BARS:]),
+                     TOLERANCE[field]))
+    return rows
+
+
+def compare_internal(symbol: str, series: dict) -> list:
+    """The streaming state and the panel path against compute_indicators on the same series."""
+    from indicator_state import IndicatorSet
+    from technical_analysis import align_series, compute_indicators, compute_panel_indicators
+
+    full = compute_indicators(series, TIME_PERIOD)
+    state = IndicatorSet(TIME_PERIOD)
+    state.feed(series, 0, len(series["date"]))
+    panel = compute_panel_indicators(align_series({symbol: series}), TIME_PERIOD)
+    rows = []
+    for name, values in full.items():
+        scale = max(1.0, abs(float(values[-1]))) if not np.isnan(values[-1]) else 1.0
+        streamed = np.array([state.latest[name]])
+        rows.append((f"{symbol} streaming", name, 1, _max_diff(values[-1:], streamed) / scale, INTERNAL_TOLERANCE))
+        rows.append((f"{symbol} panel", name, len(values),
+                     _max_diff(values, panel[name][0]) / max(1.0, np.nanmax(np.abs(values), initial=0.0)),
+                     INTERNAL_TOLERANCE))
+    return rows
+
+
+def _timed(fn, repeat: int) -> float:
+    """Best of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def throughput(series_list: list, batch: dict, repeat: int) -> dict:
+    """Bars per second for the single-series, batch (panel) and incremental (streaming) modes."""
+    from indicator_state import IndicatorSet
+    from technical_analysis import PANEL_BARS, align_series, compute_indicators, latest_panel_indicators
+
+    results = {}
+    single_bars = sum(len(s["date"]) for s in series_list)
+    results["single"] = single_bars / _timed(lambda: [compute_indicators(s, TIME_PERIOD) for s in series_list], repeat)
+
+    batch_bars = sum(min(len(s["date"]), PANEL_BARS) for s in batch.values())
+    results["batch"] = batch_bars / _timed(
+        lambda: latest_panel_indicators(align_series(batch, PANEL_BARS), TIME_PERIOD), repeat)
+
+    # A state that has seen all but the last INCREMENTAL_BARS bars of each series takes the rest
+    warmed = []
+    for s in series_list:
+        state = IndicatorSet(TIME_PERIOD)
+        state.feed(s, 0, len(s["date"]) - INCREMENTAL_BARS)
+        warmed.append(state)
+
+    def incremental():
+        for s, state in zip(series_list, warmed):
+            copy.deepcopy(state).feed(s, len(s["date"]) - INCREMENTAL_BARS, len(s["date"]))
+
+    copy_only = _timed(lambda: [copy.deepcopy(state) for state in warmed], repeat)
+    results["incremental"] = INCREMENTAL_BARS * len(series_list) / max(_timed(incremental, repeat) - copy_only, 1e-9)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check and time the technical_analysis indicators offline.")
+    parser.add_argument("--symbols", default="IBM", help="symbols to check (recorded fixtures if present)")
+    parser.add_argument("--batch-symbols", type=int, default=500, help="synthetic symbols in the batch panel")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per mode (best is reported)")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    parser.add_argument("--record", action="store_true", help="fetch the fixtures from the real API and exit")
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON from an earlier --save run to compare throughput against")
+    parser.add_argument("--max-slowdown", type=float, default=0.2, help="allowed throughput drop vs the baseline")
+    args = parser.parse_args(argv)
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()]
+    if args.record:
+        return record(symbols, args.fixtures)
+
+    checks, series_list = [], []
+    for sym in symbols:
+        series, is_recorded = load_series(sym, args.fixtures)
+        print(f"{sym}: {len(series['date'])} bars ({'recorded' if is_recorded else 'synthetic'})")
+        series_list.append(series)
+        if is_recorded:
+            checks += compare_av(sym, series, args.fixtures)
+        checks += compare_pandas_ta(sym, series)
+        checks += compare_internal(sym, series)
+
+    failed = 0
+    print(f"\n{'check':<24} {'field':<18} {'bars':>6} {'max diff':>11} {'tolerance':>10}")
+    for name, field, bars, diff, tolerance in checks:
+        ok = bars == 0 or (not np.isnan(diff) and diff <= tolerance)
+        failed += not ok
+        print(f"{name:<24} {field:<18} {bars:>6} {diff:>11.3g} {tolerance:>10.0e}{'' if ok else '  FAIL'}")
+    if not any(name.endswith("pandas_ta") for name, *_ in checks):
+        print("pandas_ta is not installed; skipped those comparisons")
+    if not any(name.endswith("Alpha Vantage") for name, *_ in checks):
+        print(f"no recorded Alpha Vantage indicator payloads for {', '.join(symbols)} in {args.fixtures}; "
+              f"skipped those comparisons (capture them with --record)")
+
+    batch = {f"SYN{i:04d}": load_series(f"SYN{i:04d}", args.fixtures)[0] for i in range(args.batch_symbols)}
+    rates = throughput(series_list, batch, args.repeat)
+    print()
+    for mode, rate in rates.items():
+        print(f"{mode:<12} {rate:14,.0f} bars/s")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["throughput"]
+        for mode, rate in rates.items():
+            if mode in baseline and rate < baseline[mode] * (1 - args.max_slowdown):
+                failed += 1
+                print(f"{mode} throughput fell {1 - rate / baseline[mode]:.0%} below the baseline")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"throughput": rates, "checks": [list(c) for c in checks]}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,16 @@
 import streamlit as st
 import re
+from datetime import date, timedelta
 import yfinance as yf
 from openai import OpenAI
 from vectorstore_utils import similarity_search_docs
+from singleflight import shared as shared_flights
+from quotes import AssetClass
+from av_cache import cached_symbols
+from technical_analysis import PATTERNS, find_patterns
+
+# How long a yfinance history download is reused across sessions
+CHART_CACHE_SECONDS = 5 * 60
 
 def chat_interface():
     st.header("Chat with Your Personal Finance Assistant")
@@ -22,8 +30,8 @@ def chat_interface():
         # Possibly fetch chart data if user requests: e.g. "price of TSLA"
         chart_data = display_chart_for_asset(user_input)
 
-        # Generate an assistant response from OpenAI
-        assistant_response = generate_assistant_response(user_input)
+        # Pattern questions are answered from the pattern index; anything else goes to the model
+        assistant_response = answer_pattern_question(user_input) or generate_assistant_response(user_input)
         assistant_message = {"role": "assistant", "content": assistant_response}
 
         if chart_data is not None:
@@ -45,7 +53,11 @@ def display_chart_for_asset(message: str):
         ticker = matches[0].upper()
         stock = yf.Ticker(ticker)
         try:
-            hist = stock.history(period="1y")
+            hist = shared_flights.do(
+                ("yfinance", ticker, "1y"),
+                lambda: stock.history(period="1y"),
+                ttl=CHART_CACHE_SECONDS,
+            )
             if not hist.empty:
                 return hist['Close']
             else:
@@ -54,6 +66,94 @@ def display_chart_for_asset(message: str):
             st.write(f"Error retrieving data for {ticker}: {e}")
     return None
 
+# Words that name several patterns; narrowed by "bullish"/"bearish" (or "support"/"resistance") when the question says which
+PATTERN_FAMILIES = {
+    "engulfing": ["Bullish Engulfing", "Bearish Engulfing"],
+    "harami": ["Bullish Harami", "Bearish Harami"],
+    "pivot": ["Support Pivot", "Resistance Pivot"],
+}
+# A pattern question asks for matches: "which of my stocks...", "find stocks with...", "show holdings that..."
+PATTERN_LOOKUP = re.compile(
+    r'\b(?:which|what|any|find|show|list|scan|search)\b.*'
+    r'\b(?:stocks?|tickers?|symbols?|names|holdings|companies|shares|watchlist|portfolio)\b'
+)
+
+def _mentions(word: str, text: str) -> bool:
+    """`word` (or its plural) as a whole word of `text`."""
+    return re.search(r'\b' + re.escape(word) + r's?\b', text) is not None
+
+def _asked_patterns(text: str) -> list:
+    asked = [name for name in PATTERNS if _mentions(name.lower(), text)]
+    if not asked:
+        for word, names in PATTERN_FAMILIES.items():
+            if _mentions(word, text):
+                asked += names
+        for word, direction in (("bullish", "bullish"), ("bearish", "bearish"), ("support", "bullish"), ("resistance", "bearish")):
+            if _mentions(word, text):
+                asked = [name for name in asked if PATTERNS[name] == direction] or asked
+    return asked
+
+def _asked_tickers(message: str) -> list:
+    """Upper-case words of the message that are stocks we hold or have price history for."""
+    words = re.findall(r'\b[A-Z][A-Z0-9.]{0,5}\b', message)
+    if not words:
+        return []
+    known = {q.ticker for q in st.session_state.get('asset_data', []) if q.asset_class == AssetClass.STOCK}
+    known.update(cached_symbols("TIME_SERIES_DAILY"))
+    return [w for w in dict.fromkeys(words) if w in known]
+
+def _asked_period(text: str, today: date):
+    """(first day, last day) the question is about; the last seven days when it doesn't say."""
+    if "yesterday" in text:
+        return today - timedelta(days=1), today - timedelta(days=1)
+    if "today" in text:
+        return today, today
+    monday = today - timedelta(days=today.weekday())
+    if "last week" in text:
+        return monday - timedelta(days=7), monday - timedelta(days=1)
+    if "this week" in text:
+        return monday, today
+    if "this month" in text:
+        return today.replace(day=1), today
+    days = re.search(r'\b(?:last|past)\s+(\d+)\s+days?\b', text)
+    if days:
+        return today - timedelta(days=int(days.group(1)) - 1), today
+    return today - timedelta(days=6), today
+
+def answer_pattern_question(message: str):
+    """
+    Answer e.g. "which of my stocks printed a bullish engulfing this week" or "any hammers in AAPL
+    last week" from the date-keyed pattern index. Returns None unless the message names a pattern and
+    asks for matches (a ticker, or "which/find/show ... stocks" phrasing), so questions about a
+    pattern itself still go to the model.
+    """
+    text = message.lower()
+    asked = _asked_patterns(text)
+    if not asked:
+        return None
+    tickers = _asked_tickers(message)
+    if not tickers and not PATTERN_LOOKUP.search(text):
+        return None
+    start, end = _asked_period(text, date.today())
+    symbols = tickers or None
+    if not symbols and re.search(r'\bmy\b', text):
+        symbols = [q.ticker for q in st.session_state.get('asset_data', []) if q.asset_class == AssetClass.STOCK] or None
+    found = find_patterns(start, end, asked, symbols)
+
+    when = f"on {start:%a %d %b}" if start == end else f"between {start:%a %d %b} and {end:%a %d %b}"
+    whose = ", ".join(tickers) if tickers else "your stocks" if symbols else "the cached stocks"
+    if found.empty:
+        if tickers:
+            return f"{whose} didn't print a {' or '.join(asked).lower()} {when}."
+        return f"None of {whose} printed a {' or '.join(asked).lower()} {when}."
+    lines = [f"Patterns in {whose} {when}:"]
+    for name in asked:
+        hits = found[found["Pattern"] == name]
+        if not hits.empty:
+            listed = ", ".join(f"{row.Ticker} ({row.Date:%a %d %b})" for row in hits.itertuples())
+            lines.append(f"- **{name}**: {listed}")
+    return "\n".join(lines)
+
 def generate_assistant_response(user_input: str) -> str:
     # Example logic:
     # 1) Do a vector store similarity search if needed
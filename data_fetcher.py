@@ -1,127 +1,372 @@
 import os
-import requests
+import time
+import queue
+import asyncio
 import math
+from typing import NamedTuple
+import numpy as np
 import pandas as pd
 import streamlit as st
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import yfinance as yf
+
+import av_cache
+from av_cache import CacheKey
+from http_engine import AIMDLimiter, get_json, get_loop, run_sync
+from singleflight import shared as shared_flights
+import resample
+from resample import INTERVALS
+from quotes import AssetClass, Quote, bar_timestamp
+from rate_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RateLimited,
+    get_scheduler,
+    is_rate_limit_payload,
+)
 
 AV_API_KEY = os.getenv("AV_API_KEY")  # Our Alpha Vantage key
+# Point at av_stub_server.py for offline runs, e.g. AV_BASE_URL=http://127.0.0.1:8765/query
+AV_BASE_URL = os.getenv("AV_BASE_URL", "https://www.alphavantage.co/query")
+
+# JSON key holding the bars for each daily series endpoint
+SERIES_KEYS = {
+    "TIME_SERIES_DAILY": "Time Series (Daily)",
+    "FX_DAILY": "Time Series FX (Daily)",
+    "DIGITAL_CURRENCY_DAILY": "Time Series (Digital Currency Daily)",
+}
+
+# What fetch_all_assets and the background refresher track when no watchlist is configured
+DEFAULT_WATCHLIST = {
+    "stocks": ["IBM", "AAPL", "GOOGL"],
+    "forex": [("EUR", "USD"), ("GBP", "USD")],
+    "crypto": [("BTC", "USD"), ("ETH", "USD")],
+    "commodities": True,
+}
+
+# REALTIME_BULK_QUOTES is a premium endpoint; free keys get a refusal that would still cost a call
+AV_BULK_QUOTES = os.getenv("AV_BULK_QUOTES", "0") == "1"
+BULK_BATCH_SIZE = 100  # symbols per REALTIME_BULK_QUOTES call
 
-def fetch_stock_data(symbol: str) -> dict:
+# Times we re-queue a call that came back with a rate-limit note before giving up
+AV_MAX_RETRIES = 3
+
+async def _av_get_async(params: dict, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """
+    Single choke point for Alpha Vantage calls.
+    Identical concurrent calls (from any session) are coalesced into one request.
+    """
+    key = ("alphavantage",) + tuple(sorted((k, str(v)) for k, v in params.items()))
+    return await shared_flights.do_async(
+        key,
+        lambda: _av_request(params, priority),
+        cache_if=lambda data: "Error Message" not in data,
+    )
+
+async def _av_request(params: dict, priority: int) -> dict:
+    """
+    Waits for a slot from the shared scheduler, and if the response is a throttling note
+    instead of data, reports it (which pauses everyone) and re-queues the call.
+    """
+    scheduler = get_scheduler()
+    for _ in range(AV_MAX_RETRIES + 1):
+        await scheduler.acquire_async(priority)
+        data = await get_json(AV_BASE_URL, {**params, "apikey": AV_API_KEY})
+        if not is_rate_limit_payload(data):
+            return data
+        scheduler.report_rate_limited(data)
+    raise RateLimited(f"Alpha Vantage rate limit hit for {params.get('function')} {params.get('symbol', '')}")
+
+def _av_get(params: dict, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    return run_sync(_av_get_async(params, priority))
+
+# Endpoints that accept outputsize=compact|full; DIGITAL_CURRENCY_DAILY always returns full history
+OUTPUTSIZE_FUNCTIONS = {"TIME_SERIES_DAILY", "FX_DAILY"}
+# Functions whose outputsize=full request this key was refused (premium-only), so we stop asking
+_full_refused = set()
+
+def _series_params(function: str, symbol: str, market: str = None, outputsize: str = None) -> dict:
+    if function == "FX_DAILY":
+        params = {"function": function, "from_symbol": symbol, "to_symbol": market}
+    elif function == "DIGITAL_CURRENCY_DAILY":
+        params = {"function": function, "symbol": symbol, "market": market}
+    else:
+        params = {"function": function, "symbol": symbol}
+    if outputsize and function in OUTPUTSIZE_FUNCTIONS:
+        params["outputsize"] = outputsize
+    return params
+
+def _find_field(bar: dict, name: str, market: str = None) -> str:
+    """
+    Map a column name onto the payload's numbered keys ("1. open", "4a. close (USD)", ...).
+    Older crypto payloads carry one column per market, so prefer the one for ours.
+    """
+    candidates = [k for k in bar if name in k]
+    if market:
+        for k in candidates:
+            if f"({market})" in k:
+                return k
+    return candidates[0] if candidates else None
+
+def _parse_daily_series(time_series: dict, market: str = None) -> dict:
+    """
+    Turn {"2025-01-03": {"1. open": "...", ...}, ...} into ascending numpy columns.
+    """
+    if not time_series:
+        return {}
+    # Alpha Vantage lists bars newest first, so reversing is enough; only sort if that ever changes
+    dates = list(time_series.keys())[::-1]
+    date_arr = np.array(dates, dtype="datetime64[D]")
+    order = None
+    if len(date_arr) > 1 and not (date_arr[1:] > date_arr[:-1]).all():
+        order = np.argsort(date_arr, kind="stable")
+        date_arr = date_arr[order]
+    first_bar = time_series[dates[0]]
+    series = {"date": date_arr}
+    for col in av_cache.SERIES_COLUMNS:
+        field = _find_field(first_bar, col, market)
+        if field is None:
+            series[col] = np.full(len(dates), np.nan)
+        else:
+            values = np.array([float(time_series[d][field]) for d in dates], dtype=np.float64)
+            series[col] = values if order is None else values[order]
+    series["fetched_at"] = time.time()
+    return series
+
+async def fetch_daily_series_async(function: str, symbol: str, market: str = None, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """
+    Return a daily OHLCV series as numpy columns, served from the on-disk cache while it is fresh.
+    Raises on network errors so callers can report them in their own words.
+    """
+    key = CacheKey(function, symbol, market, "daily")
+    stored = av_cache.load_series(key, allow_stale=True)
+    if stored is not None and av_cache.is_fresh(function, stored["fetched_at"]):
+        return stored
+
+    # Once we hold the full history, refreshes only pull the ~100 most recent bars and merge them in
+    if stored is not None and function in OUTPUTSIZE_FUNCTIONS:
+        data = await _av_get_async(_series_params(function, symbol, market, "compact"), priority)
+        update = _parse_daily_series(data.get(SERIES_KEYS[function], {}), market)
+        if update:
+            merged, revised = av_cache.merge_series(stored, update)
+            if merged is not None:
+                av_cache.save_series(key, merged)
+                if revised:
+                    # Past bars changed (e.g. a split adjustment), so nothing built incrementally on them holds
+                    av_cache.drop_states(key)
+                    resample.forget(key)
+                return merged
+
+    series = {}
+    if function not in _full_refused:
+        data = await _av_get_async(_series_params(function, symbol, market, "full"), priority)
+        series = _parse_daily_series(data.get(SERIES_KEYS[function], {}), market)
+        if not series and "Information" in data:
+            _full_refused.add(function)
+    if not series and function in OUTPUTSIZE_FUNCTIONS:
+        # outputsize=full is premium-only for some endpoints; settle for the compact history
+        data = await _av_get_async(_series_params(function, symbol, market, "compact"), priority)
+        series = _parse_daily_series(data.get(SERIES_KEYS[function], {}), market)
+    if series:
+        av_cache.save_series(key, series)
+    return series
+
+def fetch_daily_series(function: str, symbol: str, market: str = None, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    return run_sync(fetch_daily_series_async(function, symbol, market, priority))
+
+def fetch_daily_series_many(function: str, symbols: list, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """{symbol: series or the exception that stopped it}, fetched concurrently."""
+    async def gather_all():
+        return await asyncio.gather(
+            *(fetch_daily_series_async(function, s, priority=priority) for s in symbols), return_exceptions=True
+        )
+    return dict(zip(symbols, run_sync(gather_all())))
+
+def _latest_quote(series: dict, ticker: str, asset_class: AssetClass) -> Quote:
+    """Latest close and its change versus the same day's open, in percent."""
+    bar = av_cache.latest_bar(series)
+    price_change = ((bar["close"] - bar["open"]) / bar["open"]) * 100
+    return Quote(ticker, asset_class, bar["close"], price_change, bar_timestamp(bar["date"]))
+
+async def _stock_quote(symbol: str, priority: int) -> Quote:
+    series = await fetch_daily_series_async("TIME_SERIES_DAILY", symbol, priority=priority)
+    if not series:
+        return None
+    return _latest_quote(series, symbol, AssetClass.STOCK)
+
+async def _forex_quote(from_symbol: str, to_symbol: str, priority: int) -> Quote:
+    series = await fetch_daily_series_async("FX_DAILY", from_symbol, to_symbol, priority)
+    if not series:
+        return None
+    return _latest_quote(series, f"{from_symbol}/{to_symbol}", AssetClass.FOREX)
+
+async def _crypto_quote(symbol: str, market: str, priority: int) -> Quote:
+    series = await fetch_daily_series_async("DIGITAL_CURRENCY_DAILY", symbol, market, priority)
+    if not series:
+        return None
+    return _latest_quote(series, f"{symbol}/{market}", AssetClass.CRYPTO)
+
+async def _commodity_payload(priority: int) -> dict:
+    key = CacheKey("ALL_COMMODITIES", "-", None, "monthly")
+    cached = av_cache.load_payload(key)
+    if cached is not None:
+        return cached
+    data = await _av_get_async({"function": "ALL_COMMODITIES", "interval": "monthly"}, priority)
+    if data.get("data"):
+        av_cache.save_payload(key, data)
+    return data
+
+async def _commodity_quote(priority: int) -> Quote:
+    """
+    Latest print of the global commodity price index.
+    It is monthly, so the change column is versus the previous month.
+    """
+    data = await _commodity_payload(priority)
+    points = [p for p in data.get("data", []) if p.get("value") not in (None, "", ".")]
+    if len(points) < 2:
+        return None
+    latest, previous = float(points[0]["value"]), float(points[1]["value"])
+    return Quote(
+        "ALL_COMMODITIES",
+        AssetClass.COMMODITY,
+        latest,
+        (latest - previous) / previous * 100,
+        bar_timestamp(np.datetime64(points[0]["date"], "D")),
+    )
+
+def _bulk_row_quote(row: dict) -> Quote:
+    """One entry of a REALTIME_BULK_QUOTES payload, with the change measured from the open like the series path."""
+    try:
+        close_price, open_price = float(row["close"]), float(row["open"])
+        timestamp = bar_timestamp(np.datetime64(row["timestamp"][:10], "D"))
+    except (KeyError, TypeError, ValueError):
+        return None
+    change = ((close_price - open_price) / open_price) * 100 if open_price else 0.0
+    return Quote(row["symbol"], AssetClass.STOCK, close_price, change, timestamp)
+
+def _yfinance_quotes(symbols: list) -> dict:
+    """Latest daily bar for many tickers in one yfinance download (no Alpha Vantage quota)."""
+    frame = yf.download(symbols, period="5d", interval="1d", group_by="ticker", auto_adjust=False, progress=False)
+    quotes = {}
+    for sym in symbols:
+        try:
+            bars = frame[sym] if len(symbols) > 1 else frame
+            bars = bars.dropna(subset=["Open", "Close"])
+        except KeyError:
+            continue
+        if bars.empty:
+            continue
+        open_price, close_price = float(bars["Open"].iloc[-1]), float(bars["Close"].iloc[-1])
+        date = np.datetime64(bars.index[-1].date(), "D")
+        quotes[sym] = Quote(sym, AssetClass.STOCK, close_price, (close_price - open_price) / open_price * 100, bar_timestamp(date))
+    return quotes
+
+async def _bulk_stock_quotes(symbols: list, priority: int) -> dict:
+    """
+    Latest quotes for many stocks with as few requests as possible:
+    Alpha Vantage bulk quotes (100 symbols per call) when the key allows it, then one yfinance download.
+    Symbols neither source returned are simply absent from the result.
+    """
+    quotes = {}
+    if AV_BULK_QUOTES and symbols:
+        batches = [symbols[i:i + BULK_BATCH_SIZE] for i in range(0, len(symbols), BULK_BATCH_SIZE)]
+        payloads = await asyncio.gather(
+            *(_av_get_async({"function": "REALTIME_BULK_QUOTES", "symbol": ",".join(b)}, priority) for b in batches),
+            return_exceptions=True,
+        )
+        for payload in payloads:
+            if isinstance(payload, Exception):
+                continue
+            for row in payload.get("data", []):
+                quote = _bulk_row_quote(row)
+                if quote:
+                    quotes[quote.ticker] = quote
+    missing = [sym for sym in symbols if sym not in quotes]
+    if missing:
+        try:
+            quotes.update(await asyncio.to_thread(_yfinance_quotes, missing))
+        except Exception:
+            pass  # whatever is still missing falls back to per-symbol series
+    for quote in quotes.values():
+        av_cache.save_payload(CacheKey("REALTIME_QUOTE", quote.ticker), quote.to_dict())
+    return quotes
+
+def _cached_stock_quote(symbol: str) -> Quote:
+    """A stock quote we can serve without any request: a fresh bulk quote or a fresh daily series."""
+    payload = av_cache.load_payload(CacheKey("REALTIME_QUOTE", symbol))
+    if payload:
+        return Quote.from_dict(payload)
+    series = av_cache.load_series(CacheKey("TIME_SERIES_DAILY", symbol))
+    if series:
+        return _latest_quote(series, symbol, AssetClass.STOCK)
+    return None
+
+async def _stock_quotes(symbols: list, priority: int, history: bool = False) -> dict:
+    """
+    Quotes for many stocks, picking the cheapest path.
+    Without history: cache first, then bulk quotes, and per-symbol daily series only for what's left.
+    With history: per-symbol daily series, since the caller wants the bars anyway.
+    Returns {symbol: Quote or Exception} in watchlist order.
+    """
+    results = {}
+    if history:
+        pending = list(symbols)
+    else:
+        for sym in symbols:
+            results[sym] = _cached_stock_quote(sym)
+        uncached = [sym for sym in symbols if results[sym] is None]
+        results.update(await _bulk_stock_quotes(uncached, priority))
+        pending = [sym for sym in symbols if results.get(sym) is None]
+
+    outcomes = await asyncio.gather(*(_stock_quote(sym, priority) for sym in pending), return_exceptions=True)
+    results.update(zip(pending, outcomes))
+    return {sym: results[sym] for sym in symbols if results.get(sym) is not None}
+
+def fetch_stock_data(symbol: str, priority: int = PRIORITY_INTERACTIVE) -> Quote:
     """
     Fetch daily stock data from Alpha Vantage for a given symbol.
-    Returns the latest close price, a daily price change, etc.
+    Returns a Quote with the latest close and its change on the day, or None.
     """
     if not AV_API_KEY:
         st.error("Missing Alpha Vantage API Key in .env (AV_API_KEY).")
-        return {}
+        return None
 
-    base_url = "https://www.alphavantage.co/query"
-    params = {
-        "function": "TIME_SERIES_DAILY",
-        "symbol": symbol,
-        "apikey": AV_API_KEY,
-    }
     try:
-        r = requests.get(base_url, params=params)
-        data = r.json()
-        time_series = data.get("Time Series (Daily)", {})
-        if not time_series:
-            return {}
-        # The daily keys are typically in descending order (latest first)
-        # We'll just get the first one
-        latest_date = sorted(time_series.keys())[-1]
-        daily_data = time_series[latest_date]
-
-        close_price = float(daily_data["4. close"])
-        open_price = float(daily_data["1. open"])
-        price_change = ((close_price - open_price) / open_price) * 100
-
-        return {
-            "Ticker": symbol,
-            "Current Price": f"${close_price:.2f}",
-            "Price Change (Today)": f"{price_change:.2f}%",
-            # We can add more fields as needed
-        }
+        return run_sync(_stock_quote(symbol, priority))
     except Exception as e:
         st.error(f"Error fetching stock data for {symbol}: {e}")
-        return {}
+        return None
 
-def fetch_forex_data(from_symbol: str, to_symbol: str) -> dict:
+def fetch_forex_data(from_symbol: str, to_symbol: str, priority: int = PRIORITY_INTERACTIVE) -> Quote:
     """
     Fetch daily forex data from Alpha Vantage for a given currency pair.
+    Returns a Quote, or None.
     """
     if not AV_API_KEY:
         st.error("Missing Alpha Vantage API Key in .env (AV_API_KEY).")
-        return {}
+        return None
 
-    base_url = "https://www.alphavantage.co/query"
-    params = {
-        "function": "FX_DAILY",
-        "from_symbol": from_symbol,
-        "to_symbol": to_symbol,
-        "apikey": AV_API_KEY,
-    }
     try:
-        r = requests.get(base_url, params=params)
-        data = r.json()
-        time_series = data.get("Time Series FX (Daily)", {})
-        if not time_series:
-            return {}
-        latest_date = sorted(time_series.keys())[-1]
-        daily_data = time_series[latest_date]
-
-        close_price = float(daily_data["4. close"])
-        open_price = float(daily_data["1. open"])
-        price_change = ((close_price - open_price) / open_price) * 100
-
-        return {
-            "Ticker": f"{from_symbol}/{to_symbol}",
-            "Current Price": f"${close_price:.4f}",
-            "Price Change (Today)": f"{price_change:.2f}%",
-        }
+        return run_sync(_forex_quote(from_symbol, to_symbol, priority))
     except Exception as e:
         st.error(f"Error fetching forex data for {from_symbol}/{to_symbol}: {e}")
-        return {}
+        return None
 
-def fetch_crypto_data(symbol: str, market="USD") -> dict:
+def fetch_crypto_data(symbol: str, market="USD", priority: int = PRIORITY_INTERACTIVE) -> Quote:
     """
     Fetch daily crypto data from Alpha Vantage for a given symbol and market.
+    Returns a Quote, or None.
     """
     if not AV_API_KEY:
         st.error("Missing Alpha Vantage API Key in .env (AV_API_KEY).")
-        return {}
+        return None
 
-    base_url = "https://www.alphavantage.co/query"
-    params = {
-        "function": "DIGITAL_CURRENCY_DAILY",
-        "symbol": symbol,
-        "market": market,
-        "apikey": AV_API_KEY,
-    }
     try:
-        r = requests.get(base_url, params=params)
-        data = r.json()
-        time_series = data.get("Time Series (Digital Currency Daily)", {})
-        if not time_series:
-            return {}
-        latest_date = sorted(time_series.keys())[-1]
-        daily_data = time_series[latest_date]
-
-        close_price = float(daily_data["4a. close (USD)"])  # if market="USD"
-        open_price = float(daily_data["1a. open (USD)"])
-        price_change = ((close_price - open_price) / open_price) * 100
-
-        return {
-            "Ticker": f"{symbol}/{market}",
-            "Current Price": f"${close_price:.2f}",
-            "Price Change (Today)": f"{price_change:.2f}%",
-        }
+        return run_sync(_crypto_quote(symbol, market, priority))
     except Exception as e:
         st.error(f"Error fetching crypto data for {symbol}/{market}: {e}")
-        return {}
+        return None
 
-def fetch_commodity_data() -> list:
+def fetch_commodity_data(priority: int = PRIORITY_BACKGROUND) -> list:
     """
     Fetch monthly commodity data from Alpha Vantage (ALL_COMMODITIES).
     Returns a list. 
@@ -132,15 +377,8 @@ def fetch_commodity_data() -> list:
         st.error("Missing Alpha Vantage API Key in .env (AV_API_KEY).")
         return []
 
-    base_url = "https://www.alphavantage.co/query"
-    params = {
-        "function": "ALL_COMMODITIES",
-        "interval": "monthly",
-        "apikey": AV_API_KEY,
-    }
     try:
-        r = requests.get(base_url, params=params)
-        data = r.json()
+        data = run_sync(_commodity_payload(priority))
         # data might have multiple commodity series - you'll parse accordingly
         # We'll just return it raw or do some minimal handling
         return [data]  # For demonstration, returning entire response in a list
@@ -148,75 +386,270 @@ def fetch_commodity_data() -> list:
         st.error(f"Error fetching commodity data: {e}")
         return []
 
-def fetch_indicator_data(symbol: str, function_name: str, interval: str = "daily", time_period: int = 10, series_type: str = "close") -> dict:
+def fetch_indicator_data(symbol: str, function_name: str, interval: str = "daily", time_period: int = 10, series_type: str = "close", priority: int = PRIORITY_INTERACTIVE) -> dict:
     """
     Generic function to fetch a technical indicator from Alpha Vantage.
     function_name can be one of: RSI, MACD, STOCHRSI, SMA, EMA, BBANDS, etc.
+    Indicators we can compute ourselves, on daily/weekly/monthly/quarterly bars, are built from
+    the one cached daily series instead of costing an API call per indicator and interval.
     """
     if not AV_API_KEY:
         st.error("Missing Alpha Vantage API Key in .env (AV_API_KEY).")
         return {}
 
-    base_url = "https://www.alphavantage.co/query"
+    # technical_analysis imports this module, so it can only be imported here
+    from technical_analysis import LOCAL_INDICATORS, indicator_payload
+    if function_name in LOCAL_INDICATORS and interval in INTERVALS and series_type in av_cache.SERIES_COLUMNS:
+        try:
+            return indicator_payload(symbol, function_name, interval, time_period, series_type, priority)
+        except Exception as e:
+            st.error(f"Error fetching {function_name} for {symbol}: {e}")
+            return {}
+
+    key = CacheKey(function_name, symbol, None, interval, f"{time_period}-{series_type}")
+    cached = av_cache.load_payload(key)
+    if cached is not None:
+        return cached
+
     params = {
         "function": function_name,   # e.g. RSI, MACD, SMA, STOCHRSI, etc.
         "symbol": symbol,
         "interval": interval,       # e.g. daily, weekly
         "time_period": time_period, # for RSI, STOCHRSI, etc.
         "series_type": series_type, # open, close, etc.
-        "apikey": AV_API_KEY,
     }
     try:
-        r = requests.get(base_url, params=params)
-        data = r.json()
+        data = _av_get(params, priority)
+        if f"Technical Analysis: {function_name}" in data:
+            av_cache.save_payload(key, data)
         return data
     except Exception as e:
         st.error(f"Error fetching {function_name} for {symbol}: {e}")
         return {}
 
-def fetch_all_assets() -> list:
+def _asset_jobs(watchlist: dict, priority: int, history: bool) -> list:
+    """(label, coroutine factory) for every instrument; stocks share one job so they can be batched."""
+    jobs = []
+    # 1) Stocks, as one job that batches symbols where it can
+    if watchlist.get("stocks"):
+        stocks = list(watchlist["stocks"])
+        jobs.append(("stock data", lambda: _stock_quotes(stocks, priority, history)))
+    # 2) Forex
+    for (f, t) in watchlist.get("forex", []):
+        jobs.append((f"forex data for {f}/{t}", lambda f=f, t=t: _forex_quote(f, t, priority)))
+    # 3) Crypto
+    for (c, market) in watchlist.get("crypto", []):
+        jobs.append((f"crypto data for {c}/{market}", lambda c=c, m=market: _crypto_quote(c, m, priority)))
+    # 4) Commodities
+    if watchlist.get("commodities"):
+        jobs.append(("commodity data", lambda: _commodity_quote(priority)))
+    return jobs
+
+def _unpack_result(label: str, res, rows: list, errors: list) -> None:
+    if isinstance(res, Exception):
+        errors.append(f"Error fetching {label}: {res}")
+    elif isinstance(res, dict):
+        for sym, quote in res.items():
+            if isinstance(quote, Exception):
+                errors.append(f"Error fetching {label} for {sym}: {quote}")
+            else:
+                rows.append(quote)
+    elif res:
+        rows.append(res)
+
+def collect_assets(watchlist: dict = None, priority: int = PRIORITY_BACKGROUND, history: bool = False):
     """
-    Example aggregator to fetch some stocks, forex pairs, cryptos, and commodities 
-    from Alpha Vantage, returning a combined list of dictionaries.
+    Fetch every instrument in the watchlist concurrently.
+    Stocks are quoted in bulk unless `history` asks for their daily series to be fetched too.
+    Returns (rows, errors) without touching Streamlit, so the background refresher can use it too.
     """
-    # For demonstration, let's just fetch a few. 
-    # You can expand or make it user-driven.
-    stocks_to_fetch = ["IBM", "AAPL", "GOOGL"]
-    forex_pairs = [("EUR", "USD"), ("GBP", "USD")]
-    cryptos = [("BTC", "USD"), ("ETH", "USD")]
+    jobs = _asset_jobs(watchlist or DEFAULT_WATCHLIST, priority, history)
 
-    results = []
-    # 1) Stocks
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {}
-        for sym in stocks_to_fetch:
-            futures[executor.submit(fetch_stock_data, sym)] = sym
+    # Everything goes out in one gather, so a refresh costs about as long as its slowest request
+    async def gather_all():
+        return await asyncio.gather(*(make() for _, make in jobs), return_exceptions=True)
 
-        for future in as_completed(futures):
-            res = future.result()
-            if res:
-                results.append(res)
+    rows, errors = [], []
+    for (label, _), res in zip(jobs, run_sync(gather_all())):
+        _unpack_result(label, res, rows, errors)
+    return rows, errors
 
-    # 2) Forex
-    for (f, t) in forex_pairs:
-        forex_data = fetch_forex_data(f, t)
-        if forex_data:
-            results.append(forex_data)
+class FetchProgress(NamedTuple):
+    rows: list      # Quotes completed since the previous update
+    errors: list
+    done: int       # instruments finished so far
+    total: int
 
-    # 3) Crypto
-    for (c, market) in cryptos:
-        crypto_data = fetch_crypto_data(c, market)
-        if crypto_data:
-            results.append(crypto_data)
+def _shard_watchlist(watchlist: dict, shard_size: int) -> list:
+    """Split a watchlist into smaller watchlists of at most shard_size instruments each."""
+    items = [("stocks", s) for s in watchlist.get("stocks", [])]
+    items += [("forex", tuple(p)) for p in watchlist.get("forex", [])]
+    items += [("crypto", tuple(p)) for p in watchlist.get("crypto", [])]
+    shards = []
+    for i in range(0, len(items), shard_size):
+        shard = {}
+        for kind, item in items[i:i + shard_size]:
+            shard.setdefault(kind, []).append(item)
+        shards.append(shard)
+    if watchlist.get("commodities"):
+        if not shards:
+            shards.append({})
+        shards[0]["commodities"] = True
+    return shards
+
+async def _prequote_stocks(symbols: list, priority: int) -> dict:
+    """Quotes for the stocks that need no per-symbol request: cached ones, then one bulk lookup for the rest."""
+    quotes = {}
+    for sym in symbols:
+        quote = _cached_stock_quote(sym)
+        if quote is not None:
+            quotes[sym] = quote
+    uncached = [sym for sym in symbols if sym not in quotes]
+    if uncached:
+        try:
+            quotes.update(await _bulk_stock_quotes(uncached, priority))
+        except Exception:
+            pass  # the per-symbol series requests cover whatever is missing
+    return quotes
+
+def iter_collect_assets(watchlist: dict = None, priority: int = PRIORITY_BACKGROUND, history: bool = False,
+                        shard_size: int = BULK_BATCH_SIZE, limiter: AIMDLimiter = None):
+    """
+    Generator over FetchProgress updates for large watchlists.
+    The watchlist is cut into shards; each shard's stocks are first quoted from the cache and in bulk
+    (unless `history` wants their series), then every instrument still missing becomes its own request
+    under an AIMD concurrency limit that adapts to each request's latency and outcome. Shards are
+    prepared one after another while earlier shards' requests are still running. Each update carries
+    the rows that just completed, so callers can render progressively.
+    """
+    watchlist = watchlist or DEFAULT_WATCHLIST
+    shards = _shard_watchlist(watchlist, shard_size)
+    total = sum(len(shard.get(k, [])) for shard in shards for k in ("stocks", "forex", "crypto"))
+    total += 1 if watchlist.get("commodities") else 0
+    limiter = limiter or AIMDLimiter()
+    updates = queue.Queue()
+    done_marker = object()
+
+    async def run_job(label, make) -> None:
+        try:
+            res = await limiter.run(make)
+        except Exception as e:
+            res = e
+        rows, errors = [], []
+        _unpack_result(label, res, rows, errors)
+        updates.put((rows, errors, 1))
+
+    async def start_shard(shard: dict) -> list:
+        stocks = list(shard.get("stocks", []))
+        quoted = {} if history else await _prequote_stocks(stocks, priority)
+        if quoted:
+            updates.put(([quoted[sym] for sym in stocks if sym in quoted], [], len(quoted)))
+        jobs = [(f"stock data for {sym}", lambda sym=sym: _stock_quote(sym, priority)) for sym in stocks if sym not in quoted]
+        jobs += _asset_jobs({k: v for k, v in shard.items() if k != "stocks"}, priority, history)
+        return [asyncio.ensure_future(run_job(label, make)) for label, make in jobs]
+
+    async def run_all() -> None:
+        tasks = []
+        try:
+            for shard in shards:
+                tasks += await start_shard(shard)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            updates.put(done_marker)
+
+    future = asyncio.run_coroutine_threadsafe(run_all(), get_loop())
+    done = 0
+    try:
+        while True:
+            item = updates.get()
+            if item is done_marker:
+                break
+            rows, errors, size = item
+            done += size
+            yield FetchProgress(rows, errors, done, total)
+        future.result()
+    finally:
+        future.cancel()
+
+def _parse_pair(symbol: str):
+    """("EUR", "USD") from "EUR/USD" or a six-letter "EURUSD"; None if it isn't a pair."""
+    symbol = symbol.upper()
+    if "/" in symbol:
+        base, _, quote = symbol.partition("/")
+    elif len(symbol) == 6 and symbol.isalpha():
+        base, quote = symbol[:3], symbol[3:]
+    else:
+        return None
+    return (base, quote) if base.isalnum() and quote.isalnum() else None
+
+def parse_watchlist_text(text: str) -> tuple:
+    """
+    Parse a user-typed watchlist: stock tickers as-is, "fx:EUR/USD" (or "fx:EURUSD") for forex pairs
+    and "crypto:BTC/USD" (or "crypto:BTCUSD") for cryptocurrencies, separated by commas, spaces or newlines.
+    Returns (watchlist, invalid tokens); a prefixed token that isn't a pair is never taken for a stock.
+    """
+    watchlist = {"stocks": [], "forex": [], "crypto": []}
+    invalid = []
+    for token in text.replace(",", " ").split():
+        kind, colon, symbol = token.rpartition(":")
+        kind = kind.lower()
+        if not colon:
+            watchlist["stocks"].append(symbol.upper())
+            continue
+        pair = _parse_pair(symbol)
+        if kind in ("fx", "forex") and pair:
+            watchlist["forex"].append(pair)
+        elif kind == "crypto" and pair:
+            watchlist["crypto"].append(pair)
+        else:
+            invalid.append(token)
+    return watchlist, invalid
+
+def _stock_quote_key(symbol: str) -> CacheKey:
+    """
+    The cache entry a stock's quote is served from: the bulk quote or, for symbols the bulk
+    sources missed, the daily series (see _cached_stock_quote); whichever was written last.
+    """
+    candidates = [CacheKey("REALTIME_QUOTE", symbol), CacheKey("TIME_SERIES_DAILY", symbol)]
+    fetched = [av_cache.cached_at(key) for key in candidates]
+    if all(f is None for f in fetched):
+        return candidates[0]
+    return max(zip(candidates, fetched), key=lambda kf: kf[1] or 0)[0]
+
+def watchlist_cache_keys(watchlist: dict = None, history: bool = False) -> list:
+    """Cache keys backing each watchlist entry, used to decide what is stale."""
+    watchlist = watchlist or DEFAULT_WATCHLIST
+    if history:
+        keys = [CacheKey("TIME_SERIES_DAILY", sym) for sym in watchlist.get("stocks", [])]
+    else:
+        keys = [_stock_quote_key(sym) for sym in watchlist.get("stocks", [])]
+    keys += [CacheKey("FX_DAILY", f, t) for (f, t) in watchlist.get("forex", [])]
+    keys += [CacheKey("DIGITAL_CURRENCY_DAILY", c, m) for (c, m) in watchlist.get("crypto", [])]
+    if watchlist.get("commodities"):
+        keys.append(CacheKey("ALL_COMMODITIES", "-", None, "monthly"))
+    return keys
 
-    # 4) Commodities (optional)
-    # commodity_data = fetch_commodity_data()
-    # if commodity_data:
-    #     # parse or combine them if you want to display in a table
-    #     pass
+def fetch_all_assets(watchlist: dict = None, history: bool = False) -> list:
+    """
+    Aggregator to fetch stocks, forex pairs, cryptos, and commodities
+    from Alpha Vantage, returning a combined list of Quote records.
+    Pass history=True when the caller also needs each stock's daily series cached.
+    """
+    if not AV_API_KEY:
+        st.error("Missing Alpha Vantage API Key in .env (AV_API_KEY).")
+        return []
 
+    results, errors = collect_assets(watchlist, history=history)
+    for message in errors:
+        st.error(message)
     return results
 
+def get_quota_status() -> dict:
+    """Live Alpha Vantage call accounting for this server process."""
+    return get_scheduler().quota_status()
+
 def get_top_movers() -> list:
     """
     You can choose to implement a separate logic using the 
@@ -0,0 +1,241 @@
+"""
+Persistent embedding cache keyed by (model id, SHA-256 of the normalised chunk text).
+
+Vectors live in one memory-mapped float32 file per model and dimension; a SQLite table maps each
+key to its row in that file and when it was last used. The file never grows beyond the size
+budget: once it is full, the least recently used tenth of the rows is evicted and their slots are
+reused. Only texts that miss go to the wrapped embeddings, so re-indexing text that was embedded
+before (a rebuild, a new chunk overlap, a re-added file) costs nothing.
+"""
+import os
+import time
+import contextlib
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = os.getenv("FINBOT_EMBEDDING_CACHE_DIR", os.path.join(".cache", "embeddings"))
+# Size budget of each model's vector file
+EMBEDDING_CACHE_MB = float(os.getenv("FINBOT_EMBEDDING_CACHE_MB", "512"))
+EVICT_FRACTION = 0.1
+GROW_ROWS = 4096  # the vector file is extended this many rows at a time, up to the budget
+# A slot reservation older than this was left by a writer that died before storing its vectors
+RESERVATION_SECONDS = 600
+
+
+def normalise(text: str) -> str:
+    """NFC with runs of whitespace collapsed, so re-extracted text with different spacing still hits."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(normalise(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str = EMBEDDING_CACHE_DIR, max_mb: float = EMBEDDING_CACHE_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._vectors = {}  # (model, dim) -> np.memmap
+        os.makedirs(cache_dir, exist_ok=True)
+        # Transactions are explicit (isolation_level=None), so writers can take the lock up front
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (model TEXT, digest TEXT, dim INTEGER, slot INTEGER, "
+            "last_used REAL, PRIMARY KEY (model, digest))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (model, dim, last_used)")
+        # Slots handed to a writer that hasn't recorded its entries yet
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reserved (model TEXT, dim INTEGER, slot INTEGER, since REAL, "
+            "PRIMARY KEY (model, dim, slot))"
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, model: str, dim: int) -> str:
+        name = hashlib.sha256(model.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"vectors-{name}-{dim}.f32")
+
+    def capacity(self, dim: int) -> int:
+        return max(1, self.max_bytes // (dim * 4))
+
+    def _file(self, model: str, dim: int, rows: int = 0) -> np.memmap:
+        """The vector file for (model, dim), extended to hold at least `rows` rows."""
+        vectors = self._vectors.get((model, dim))
+        if vectors is not None and len(vectors) >= rows:
+            return vectors
+        path = self._path(model, dim)
+        have = os.path.getsize(path) // (dim * 4) if os.path.exists(path) else 0
+        if have < rows:
+            want = min(self.capacity(dim), max(rows, have + GROW_ROWS))
+            with open(path, "ab") as f:
+                f.truncate(want * dim * 4)
+            have = want
+        vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(have, dim)) if have else np.zeros((0, dim), np.float32)
+        self._vectors[(model, dim)] = vectors
+        return vectors
+
+    def get(self, model: str, digests: list) -> dict:
+        """{digest: vector} for the digests that are cached; marks them as used."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(digests), 500):
+                part = digests[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT digest, dim, slot FROM entries WHERE model = ? AND digest IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ).fetchall()
+                for digest, dim, slot in rows:
+                    vectors = self._file(model, dim)
+                    if slot < len(vectors):
+                        found[digest] = np.array(vectors[slot])
+            if found:
+                now = time.time()
+                with self._transaction():
+                    self._db.executemany("UPDATE entries SET last_used = ? WHERE model = ? AND digest = ?",
+                                         [(now, model, d) for d in found])
+        return found
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """A write transaction holding SQLite's write lock from the start, so writers in every process queue up."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _reserve_slots(self, model: str, dim: int, needed: int) -> list:
+        """
+        Reserve `needed` unused rows of the vector file, evicting the least recently used entries if it is full.
+        Evictions and reservations are committed before the caller writes to the rows, so no entry ever
+        points at a row that is being overwritten, and no other writer can be handed the same rows.
+        """
+        with self._transaction():
+            self._db.execute("DELETE FROM reserved WHERE since < ?", (time.time() - RESERVATION_SECONDS,))
+            used = np.array([r[0] for r in self._db.execute(
+                "SELECT slot FROM entries WHERE model = ? AND dim = ? "
+                "UNION SELECT slot FROM reserved WHERE model = ? AND dim = ?", (model, dim, model, dim))], dtype=np.int64)
+            capacity = self.capacity(dim)
+            # The first len(used) + needed rows always hold `needed` free ones unless the file is full
+            free = np.setdiff1d(np.arange(min(capacity, len(used) + needed)), used)
+            if len(free) < needed:
+                evict = max(needed - len(free), int(capacity * EVICT_FRACTION))
+                victims = self._db.execute(
+                    "SELECT digest, slot FROM entries WHERE model = ? AND dim = ? ORDER BY last_used LIMIT ?",
+                    (model, dim, evict),
+                ).fetchall()
+                self._db.executemany("DELETE FROM entries WHERE model = ? AND digest = ?",
+                                     [(model, digest) for digest, _ in victims])
+                self.evictions += len(victims)
+                free = np.sort(np.concatenate([free, [slot for _, slot in victims]]).astype(np.int64))
+            slots = free[:needed].tolist()
+            now = time.time()
+            self._db.executemany("INSERT INTO reserved (model, dim, slot, since) VALUES (?, ?, ?, ?)",
+                                 [(model, dim, slot, now) for slot in slots])
+        return slots
+
+    def _release_slots(self, model: str, dim: int, slots: list) -> None:
+        self._db.executemany("DELETE FROM reserved WHERE model = ? AND dim = ? AND slot = ?",
+                             [(model, dim, slot) for slot in slots])
+
+    def put(self, model: str, digests: list, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(digests):
+            return
+        dim = vectors.shape[1]
+        with self._lock:
+            # Anything beyond the budget in one go just isn't cached; with other writers
+            # holding reservations, fewer rows than asked for may be free
+            digests, vectors = digests[:self.capacity(dim)], vectors[:self.capacity(dim)]
+            slots = self._reserve_slots(model, dim, len(digests))
+            digests, vectors = digests[:len(slots)], vectors[:len(slots)]
+            if not slots:
+                return
+            try:
+                stored = self._file(model, dim, max(slots) + 1)
+                stored[slots] = vectors
+                stored.flush()
+                # Rows point at their vectors only once those are on disk
+                now = time.time()
+                with self._transaction():
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO entries (model, digest, dim, slot, last_used) VALUES (?, ?, ?, ?, ?)",
+                        [(model, d, dim, s, now) for d, s in zip(digests, slots)],
+                    )
+                    self._release_slots(model, dim, slots)
+            except Exception:
+                with self._transaction():
+                    self._release_slots(model, dim, slots)
+                raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(dim * 4), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else float("nan"),
+            "evictions": self.evictions,
+        }
+
+
+class CachedEmbeddings:
+    """
+    Wraps an embeddings object (e.g. OpenAIEmbeddings): embed_documents only sends texts the cache
+    hasn't seen for this model. Identical texts within one call are embedded once.
+    """
+
+    def __init__(self, embeddings, model: str, cache: EmbeddingCache = None):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache or shared_cache()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: list) -> list:
+        digests = [text_digest(t) for t in texts]
+        found = self.cache.get(self.model, list(dict.fromkeys(digests)))
+        missing = {}
+        for digest, text in zip(digests, texts):
+            if digest not in found and digest not in missing:
+                missing[digest] = text
+        if missing:
+            vectors = np.asarray(self.embeddings.embed_documents(list(missing.values())), dtype=np.float32)
+            self.cache.put(self.model, list(missing), vectors)
+            found.update(zip(missing, vectors))
+        hits = len(texts) - len(missing)
+        self.hits += hits
+        self.misses += len(missing)
+        self.cache.hits += hits
+        self.cache.misses += len(missing)
+        return [found[d].tolist() for d in digests]
+
+    def embed_query(self, text: str) -> list:
+        return self.embeddings.embed_query(text)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache() -> EmbeddingCache:
+    """One cache per process, opened on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = EmbeddingCache()
+        return _shared
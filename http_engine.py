@@ -0,0 +1,121 @@
+import asyncio
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import httpx
+
+# Connection pool shared by every request made from this process
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+# Concurrent in-flight requests allowed against any single host
+PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "8"))
+REQUEST_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+
+_loop = None
+_client = None
+_host_limits = {}
+_start_lock = threading.Lock()
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    The engine's event loop, running forever in a daemon thread.
+    Streamlit reruns scripts on fresh threads, so one long-lived loop is what lets
+    the pooled client (and its keep-alive connections) survive between reruns.
+    """
+    global _loop
+    with _start_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            # Blocking helpers (disk cache, yfinance) run here via asyncio.to_thread
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=32, thread_name_prefix="http-engine"))
+            threading.Thread(target=_run_loop, args=(loop,), name="http-engine", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Created lazily on the engine loop so it is bound to it."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE),
+            timeout=REQUEST_TIMEOUT,
+            headers={"Accept-Encoding": "gzip, deflate"},
+        )
+    return _client
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(PER_HOST_LIMIT)
+    return _host_limits[host]
+
+
+async def get_json(url: str, params: dict = None):
+    """GET `url` on the pooled client and decode the JSON body. Must run on the engine loop."""
+    async with _host_semaphore(url):
+        r = await _get_client().get(url, params=params)
+        r.raise_for_status()
+        return r.json()
+
+
+def run_sync(coro, timeout: float = None):
+    """Run a coroutine on the engine loop from synchronous code and wait for its result."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    return future.result(timeout)
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit, TCP-style: grow by about one slot per window of fast successes,
+    halve on an error or a response slower than `target_latency` seconds. Use from the engine loop.
+    """
+
+    def __init__(self, initial: float = 4, minimum: float = 1, maximum: float = 64,
+                 target_latency: float = 2.0, backoff: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.in_flight = 0
+        self._cond = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def record(self, latency: float, ok: bool) -> None:
+        if ok and latency <= self.target_latency:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        else:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+
+    async def run(self, coro_fn):
+        """Await coro_fn() once a slot is free, feeding its latency and outcome back into the limit."""
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        start = time.monotonic()
+        ok = False
+        try:
+            result = await coro_fn()
+            ok = True
+            return result
+        finally:
+            self.record(time.monotonic() - start, ok)
+            async with cond:
+                self.in_flight -= 1
+                cond.notify_all()
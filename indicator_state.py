@@ -0,0 +1,284 @@
+"""
+Streaming indicator state.
+
+Each class folds in one bar at a time in constant time (fixed-size ring buffers, EMA accumulators,
+Wilder-smoothed gains/losses) and produces exactly the values the vectorised functions in
+technical_analysis.py produce for the same bar. IndicatorSet bundles them and is persisted next
+to the price cache, so a refresh that brings one new bar costs one update, not a full recompute.
+"""
+import copy
+import math
+
+import numpy as np
+
+import av_cache
+
+NAN = float("nan")
+
+
+class RingBuffer:
+    """Fixed-size window over the most recent values."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.data = np.full(size, np.nan)
+        self.count = 0
+
+    def push(self, value: float) -> None:
+        self.data[self.count % self.size] = value
+        self.count += 1
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.size
+
+    def values(self) -> np.ndarray:
+        return self.data if self.full else self.data[:self.count]
+
+
+class EMAState:
+    """Exponential average seeded with the mean of its first `period` inputs (alpha defaults to 2/(n+1))."""
+
+    def __init__(self, period: int, alpha: float = None):
+        self.period = period
+        self.alpha = 2.0 / (period + 1) if alpha is None else alpha
+        self.count = 0
+        self.seed_sum = 0.0
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        self.count += 1
+        if self.count < self.period:
+            self.seed_sum += x
+        elif self.count == self.period:
+            self.value = (self.seed_sum + x) / self.period
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+def wilder(period: int) -> EMAState:
+    return EMAState(period, alpha=1.0 / period)
+
+
+class RSIState:
+    def __init__(self, period: int = 14):
+        self.prev_close = None
+        self.gain = wilder(period)
+        self.loss = wilder(period)
+
+    def update(self, close: float) -> float:
+        if self.prev_close is None:
+            self.prev_close = close
+            return NAN
+        delta = close - self.prev_close
+        self.prev_close = close
+        avg_gain = self.gain.update(max(delta, 0.0))
+        avg_loss = self.loss.update(max(-delta, 0.0))
+        if math.isnan(avg_gain):
+            return NAN
+        if avg_loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+class MACDState:
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMAState(fast)
+        self.slow = EMAState(slow)
+        self.signal = EMAState(signal)
+
+    def update(self, close: float):
+        fast, slow = self.fast.update(close), self.slow.update(close)
+        if math.isnan(slow):
+            return NAN, NAN, NAN
+        line = fast - slow
+        signal = self.signal.update(line)
+        return line, signal, line - signal
+
+
+class RollingState:
+    """Simple moving average and population standard deviation over a ring buffer."""
+
+    def __init__(self, period: int = 20):
+        self.window = RingBuffer(period)
+
+    def update(self, x: float):
+        self.window.push(x)
+        if not self.window.full:
+            return NAN, NAN
+        values = self.window.values()
+        return float(values.mean()), float(values.std())
+
+
+class StochRSIState:
+    def __init__(self, period: int = 14, fastk_period: int = 5, fastd_period: int = 3):
+        self.rsi = RSIState(period)
+        self.rsi_window = RingBuffer(fastk_period)
+        self.k_window = RingBuffer(fastd_period)
+
+    def update(self, close: float):
+        r = self.rsi.update(close)
+        if math.isnan(r):
+            return NAN, NAN
+        self.rsi_window.push(r)
+        if not self.rsi_window.full:
+            return NAN, NAN
+        values = self.rsi_window.values()
+        lowest, highest = values.min(), values.max()
+        k = (r - lowest) / (highest - lowest) * 100 if highest > lowest else 0.0
+        self.k_window.push(k)
+        d = float(self.k_window.values().mean()) if self.k_window.full else NAN
+        return float(k), d
+
+
+class ATRState:
+    def __init__(self, period: int = 14):
+        self.prev_close = None
+        self.avg = wilder(period)
+
+    def update(self, high: float, low: float, close: float) -> float:
+        if self.prev_close is None:
+            self.prev_close = close
+            return NAN
+        prev = self.prev_close
+        self.prev_close = close
+        return self.avg.update(max(high - low, abs(high - prev), abs(low - prev)))
+
+
+class OBVState:
+    def __init__(self):
+        self.prev_close = None
+        self.total = NAN
+
+    def update(self, close: float, volume: float) -> float:
+        if self.prev_close is None:
+            self.total = volume
+        elif close > self.prev_close:
+            self.total += volume
+        elif close < self.prev_close:
+            self.total -= volume
+        self.prev_close = close
+        return self.total
+
+
+class IndicatorSet:
+    """All indicators parse_technical_indicators reports, with the same parameters as compute_indicators."""
+
+    def __init__(self, rsi_period: int = 10):
+        self.rsi_period = rsi_period
+        self.rsi = RSIState(rsi_period)
+        self.macd = MACDState()
+        self.bands = RollingState(20)
+        self.ema = EMAState(20)
+        self.stochrsi = StochRSIState()
+        self.atr = ATRState()
+        self.obv = OBVState()
+        self.last_date = None
+        self.last_close = NAN
+        self.latest = {}
+
+    def update(self, date, open_, high, low, close, volume) -> dict:
+        macd_line, macd_signal, macd_hist = self.macd.update(close)
+        middle, std = self.bands.update(close)
+        fastk, fastd = self.stochrsi.update(close)
+        self.latest = {
+            "RSI": self.rsi.update(close),
+            "MACD": macd_line,
+            "MACD_Signal": macd_signal,
+            "MACD_Hist": macd_hist,
+            "SMA": middle,
+            "EMA": self.ema.update(close),
+            "BB_Upper": middle + 2.0 * std,
+            "BB_Middle": middle,
+            "BB_Lower": middle - 2.0 * std,
+            "StochRSI_K": fastk,
+            "StochRSI_D": fastd,
+            "ATR": self.atr.update(high, low, close),
+            "OBV": self.obv.update(close, volume),
+        }
+        self.last_date = date
+        self.last_close = close
+        return self.latest
+
+    def feed(self, series: dict, start: int, stop: int) -> None:
+        for i in range(start, stop):
+            self.update(series["date"][i], *(float(series[col][i]) for col in av_cache.SERIES_COLUMNS))
+
+
+def _resume_index(state: IndicatorSet, series: dict):
+    """
+    Index of the first bar the saved state hasn't seen, or None if the state no longer matches
+    the history (bars rewritten by a split adjustment, a gap refetch, or different parameters).
+    """
+    if state is None or state.last_date is None:
+        return None
+    idx = int(np.searchsorted(series["date"], state.last_date))
+    if idx >= len(series["date"]) or series["date"][idx] != state.last_date:
+        return None
+    if not math.isclose(float(series["close"][idx]), state.last_close, rel_tol=1e-9):
+        return None
+    return idx + 1
+
+
+def obv_before(series: dict, cut: int) -> float:
+    """OBV at bar `cut` minus that bar's volume: what a series starting at `cut` leaves out."""
+    close, volume = series["close"][:cut + 1], series["volume"][:cut + 1]
+    return float(volume[0] + np.sum(np.sign(np.diff(close)) * volume[1:]) - volume[-1])
+
+
+def _load(key: av_cache.CacheKey, series: dict, rsi_period: int):
+    """(saved state, first bar it hasn't seen), or (None, None) if it can't be brought up to date."""
+    state = av_cache.load_state(key)
+    if state is not None and getattr(state, "rsi_period", None) != rsi_period:
+        return None, None
+    start = _resume_index(state, series)
+    if start is None or start > len(series["date"]) - 1:
+        return None, None
+    return state, start
+
+
+def _advance(key: av_cache.CacheKey, state: IndicatorSet, start: int, series: dict) -> dict:
+    """
+    Fold bars start..n-2 into the state and save it, then return the latest values with the newest bar.
+    Only completed bars are folded into the saved state; the newest bar may still be moving
+    intraday, so it is applied to a throwaway copy.
+    """
+    n = len(series["date"])
+    if start < n - 1:
+        state.feed(series, start, n - 1)
+        av_cache.save_state(key, state)
+    preview = copy.deepcopy(state)
+    preview.feed(series, n - 1, n)
+    return dict(preview.latest)
+
+
+def resume_indicators(key: av_cache.CacheKey, series: dict, rsi_period: int = 10):
+    """Like latest_indicators, but None instead of a full recompute when there is no usable saved state."""
+    if len(series["date"]) == 0:
+        return None
+    state, start = _load(key, series, rsi_period)
+    if state is None:
+        return None
+    return _advance(key, state, start, series)
+
+
+def latest_indicators(key: av_cache.CacheKey, series: dict, rsi_period: int = 10, seed_bars: int = None) -> dict:
+    """
+    Latest value of every indicator for `series`, updating the persisted state in O(new bars).
+    Without a usable saved state, one is built from the whole history, or from only its last
+    `seed_bars` bars (OBV carried over), matching the batch panel built over that many bars.
+    """
+    n = len(series["date"])
+    if n == 0:
+        return {}
+    state, start = _load(key, series, rsi_period)
+    if state is None:
+        # Cache invalidated (or the state is ahead of a shorter history): full recompute
+        start = max(0, min(n - seed_bars, n - 2)) if seed_bars else 0
+        state = IndicatorSet(rsi_period)
+        if start:
+            state.feed(series, start, start + 1)
+            state.obv.total += obv_before(series, start)
+            start += 1
+    return _advance(key, state, start, series)
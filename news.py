@@ -3,8 +3,10 @@ import os
 from newsapi import NewsApiClient
 from newsapi.newsapi_exception import NewsAPIException
 from datetime import datetime, timedelta
+from singleflight import shared as shared_flights
 
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+NEWS_CACHE_SECONDS = 15 * 60
 
 def fetch_finance_news(num_articles=3):
     try:
@@ -12,13 +14,18 @@ def fetch_finance_news(num_articles=3):
         today = datetime.today().strftime('%Y-%m-%d')
         last_week = (datetime.today() - timedelta(days=7)).strftime('%Y-%m-%d')
 
-        news = newsapi.get_everything(
-            q="finance OR economy",
-            from_param=last_week,
-            to=today,
-            language="en",
-            sort_by="relevancy",
-            page_size=num_articles
+        # Every session asks for the same headlines, so share one request between them
+        news = shared_flights.do(
+            ("newsapi", "finance OR economy", today, num_articles),
+            lambda: newsapi.get_everything(
+                q="finance OR economy",
+                from_param=last_week,
+                to=today,
+                language="en",
+                sort_by="relevancy",
+                page_size=num_articles
+            ),
+            ttl=NEWS_CACHE_SECONDS,
         )
         articles = news.get('articles', [])
         return [{"title": article['title'], "url": article['url'], "source": article['source']['name']} for article in articles]
@@ -0,0 +1,143 @@
+"""
+PDF text extraction spread over a process pool, streamed page by page.
+
+PyPDF2 extraction is pure Python and CPU-bound, so one large book keeps a single core busy
+for most of a rebuild. Every file is cut into page ranges, the ranges go to a process pool
+and pages come back in order while only a few ranges per worker are in flight. Each worker keeps its readers open
+between tasks, so a file's cross-reference table is parsed once per worker rather than per range.
+Kept apart from vectorstore_utils so workers don't import streamlit, langchain or faiss.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+
+EXTRACT_WORKERS = int(os.getenv("FINBOT_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = 8
+# Fewer pages than this in total are extracted in-process; starting the pool would cost more than it saves
+PARALLEL_MIN_PAGES = 64
+# Page ranges extracted ahead of the consumer, per worker
+IN_FLIGHT_PER_WORKER = 4
+
+# Per-process open readers: path -> (file object, PdfReader)
+_readers = {}
+
+
+def _reader(path: str) -> PyPDF2.PdfReader:
+    if path not in _readers:
+        f = open(path, "rb")
+        _readers[path] = (f, PyPDF2.PdfReader(f))
+    return _readers[path][1]
+
+
+def _close_readers() -> None:
+    for f, _ in _readers.values():
+        f.close()
+    _readers.clear()
+
+
+def extract_pages(path: str, start: int, stop: int):
+    """(text of pages start..stop-1 in order, CPU seconds spent)."""
+    began = time.process_time()
+    pages = _reader(path).pages
+    texts = [pages[i].extract_text() or "" for i in range(start, stop)]
+    return texts, time.process_time() - began
+
+
+def _page_counts(paths: list) -> list:
+    """(path, page count, or the exception opening it raised) per file."""
+    counts = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                counts.append((path, len(PyPDF2.PdfReader(f).pages)))
+        except Exception as e:
+            counts.append((path, e))
+    return counts
+
+
+def iter_pages(paths: list, report: list = None, workers: int = None):
+    """
+    Yield (path, page text) for every page of every PDF in `paths`, in order, then (path, None) after
+    each file's last page. A file that fails yields (path, exception) in place of its remaining pages.
+    At most IN_FLIGHT_PER_WORKER ranges per worker are extracted ahead of the consumer, so memory
+    doesn't grow with the corpus. Per-file timings are appended to `report` as files finish:
+    {"file", "pages", "seconds" since the start, "cpu_seconds"}.
+    """
+    began = time.perf_counter()
+    counts = _page_counts(paths)
+    workers = EXTRACT_WORKERS if workers is None else workers
+    total = sum(n for _, n in counts if not isinstance(n, Exception))
+    pool = ProcessPoolExecutor(workers) if workers > 1 and total >= PARALLEL_MIN_PAGES else None
+    limit = max(workers, 1) * IN_FLIGHT_PER_WORKER
+    cpu = {}
+
+    def jobs():
+        """(path, first page or None at the end of the file or an exception, pending extraction)."""
+        for path, n in counts:
+            if isinstance(n, Exception):
+                yield path, n, None
+                continue
+            cpu[path] = 0.0
+            for lo in range(0, n, PAGES_PER_TASK):
+                hi = min(lo + PAGES_PER_TASK, n)
+                yield path, lo, pool.submit(extract_pages, path, lo, hi) if pool else (path, lo, hi)
+            yield path, None, n
+
+    failed = set()
+
+    def emit(path, lo, job):
+        if path in failed:
+            return
+        if isinstance(lo, Exception):
+            failed.add(path)
+            yield path, lo
+            return
+        if lo is None:
+            if report is not None:
+                report.append({"file": os.path.basename(path), "pages": job,
+                               "seconds": time.perf_counter() - began, "cpu_seconds": cpu[path]})
+            yield path, None
+            return
+        try:
+            texts, spent = job.result() if pool else extract_pages(*job)
+        except Exception as e:
+            failed.add(path)
+            yield path, e
+            return
+        cpu[path] += spent
+        for text in texts:
+            yield path, text
+
+    window = deque()
+    try:
+        for job in jobs():
+            window.append(job)
+            while len(window) > limit:
+                yield from emit(*window.popleft())
+        while window:
+            yield from emit(*window.popleft())
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        else:
+            _close_readers()
+
+
+def extract_texts(paths: list, workers: int = None):
+    """
+    Whole text of every PDF in `paths` plus the iter_pages timing report.
+    Returns ({path: text, or the exception that stopped it}, report).
+    """
+    texts, pages, report = {}, {}, []
+    for path, page in iter_pages(paths, report, workers):
+        if isinstance(page, str):
+            pages.setdefault(path, []).append(page)
+        elif page is None:
+            texts[path] = "".join(pages.pop(path, []))
+        else:
+            pages.pop(path, None)
+            texts[path] = page
+    return texts, report
@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+from enum import IntEnum
+
+import numpy as np
+import pandas as pd
+
+
+class AssetClass(IntEnum):
+    STOCK = 0
+    FOREX = 1
+    CRYPTO = 2
+    COMMODITY = 3
+
+
+@dataclass(slots=True)
+class Quote:
+    """
+    One row of the Assets table, kept numeric until it is rendered.
+    `timestamp` is the date of the bar the quote comes from, as epoch seconds (UTC midnight).
+    """
+    ticker: str
+    asset_class: AssetClass
+    price: float
+    change_pct: float
+    timestamp: float
+
+    def to_dict(self) -> dict:
+        return {
+            "ticker": self.ticker,
+            "asset_class": self.asset_class.name,
+            "price": self.price,
+            "change_pct": self.change_pct,
+            "timestamp": self.timestamp,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Quote":
+        return cls(
+            ticker=d["ticker"],
+            asset_class=AssetClass[d["asset_class"]],
+            price=float(d["price"]),
+            change_pct=float(d["change_pct"]),
+            timestamp=float(d["timestamp"]),
+        )
+
+
+# Columnar form for vectorised work over many quotes
+QUOTE_DTYPE = np.dtype([
+    ("ticker", "U24"),
+    ("asset_class", np.uint8),
+    ("price", np.float64),
+    ("change_pct", np.float32),
+    ("timestamp", "datetime64[s]"),
+])
+
+
+def bar_timestamp(date: np.datetime64) -> float:
+    """Epoch seconds for a datetime64 bar date."""
+    return float(np.datetime64(date, "s").astype(np.int64))
+
+
+def quotes_to_array(quotes: list) -> np.ndarray:
+    arr = np.empty(len(quotes), dtype=QUOTE_DTYPE)
+    for i, q in enumerate(quotes):
+        arr[i] = (q.ticker, int(q.asset_class), q.price, q.change_pct, np.datetime64(int(q.timestamp), "s"))
+    return arr
+
+
+def quotes_to_frame(quotes: list) -> pd.DataFrame:
+    """Numeric DataFrame (sortable/filterable) built from the structured array."""
+    arr = quotes_to_array(quotes)
+    return pd.DataFrame({
+        "Ticker": arr["ticker"],
+        "Asset Class": pd.Categorical.from_codes(arr["asset_class"], [c.name.title() for c in AssetClass]),
+        "Price": arr["price"],
+        "Change %": arr["change_pct"],
+        "As Of": arr["timestamp"].astype("datetime64[D]"),
+    })
@@ -0,0 +1,246 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from datetime import datetime, timezone
+
+# Lower number = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Free-tier defaults; override for premium keys
+AV_CALLS_PER_MINUTE = int(os.getenv("AV_CALLS_PER_MINUTE", "5"))
+AV_CALLS_PER_DAY = int(os.getenv("AV_CALLS_PER_DAY", "25"))  # 0 means no daily cap
+
+# How long to stop issuing calls after Alpha Vantage tells us we're over the limit
+RATE_LIMIT_BACKOFF_SECONDS = 60
+
+
+class RateLimited(Exception):
+    """Alpha Vantage kept answering with a rate-limit note after our retries."""
+
+
+class QuotaExhausted(Exception):
+    """The daily call budget for this key is used up."""
+
+
+def is_rate_limit_payload(data) -> bool:
+    """
+    Alpha Vantage answers HTTP 200 with a "Note" or "Information" body when throttling.
+    "Information" is also used for premium-endpoint notices, so look at the wording.
+    """
+    if not isinstance(data, dict):
+        return False
+    message = data.get("Note") or data.get("Information")
+    if not message:
+        return False
+    message = message.lower()
+    return any(hint in message for hint in ("rate limit", "call frequency", "requests per day", "per minute"))
+
+
+def is_daily_limit_payload(data) -> bool:
+    """
+    Whether a throttling payload says the daily cap is spent. The per-minute note quotes the daily
+    allowance too ("5 calls per minute and 500 calls per day"), so a message that mentions the
+    per-minute frequency is never taken as the daily one.
+    """
+    message = (data.get("Note") or data.get("Information") or "").lower()
+    if "per minute" in message or "call frequency" in message:
+        return False
+    return "per day" in message or "daily" in message
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    Not thread-safe on its own; RequestScheduler guards it with its lock.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def drain(self, seconds: float) -> None:
+        """Empty the bucket and refuse tokens for `seconds`."""
+        now = time.monotonic()
+        self.tokens = 0.0
+        self.updated = now + seconds
+        self.blocked_until = now + seconds
+
+
+class RequestScheduler:
+    """
+    Process-wide gate for Alpha Vantage calls.
+    Callers wait in acquire() (threads) or acquire_async() (coroutines) until both the per-minute
+    bucket and the daily quota allow a call; waiting callers of either kind share one queue and are
+    served by priority, then in arrival order.
+    """
+
+    def __init__(self, per_minute: int = AV_CALLS_PER_MINUTE, per_day: int = AV_CALLS_PER_DAY):
+        self.per_day = per_day
+        self._bucket = TokenBucket(rate=per_minute / 60.0, capacity=per_minute)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._wakers = {}  # ticket -> (loop, future) of a coroutine parked in acquire_async
+        self._seq = itertools.count()
+        self._day = self._today()
+        self._used_today = 0
+        self._rate_limited = 0
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date()
+
+    def _roll_day(self) -> None:
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._used_today = 0
+
+    def _quota_left(self) -> bool:
+        return not self.per_day or self._used_today < self.per_day
+
+    def _notify(self) -> None:
+        """Wake every waiter, threads and coroutines alike, to re-check its turn. Call with the lock held."""
+        self._cond.notify_all()
+        for loop, future in self._wakers.values():
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def _try_take(self, ticket) -> float:
+        """
+        Take a slot for `ticket` if it is first in line and the bucket allows it, returning 0.
+        Otherwise the seconds until the head of the queue could go, or None if `ticket` isn't the head.
+        Call with the lock held.
+        """
+        self._roll_day()
+        if not self._quota_left():
+            raise QuotaExhausted(
+                f"Alpha Vantage daily quota of {self.per_day} calls used up; resets at 00:00 UTC."
+            )
+        if self._waiting[0] != ticket:
+            return None
+        wait = self._bucket.wait_time()
+        if wait == 0:
+            self._bucket.take()
+            self._used_today += 1
+        return wait
+
+    def _leave(self, ticket) -> None:
+        self._waiting.remove(ticket)
+        heapq.heapify(self._waiting)
+        self._notify()
+
+    def acquire(self, priority: int = PRIORITY_BACKGROUND, timeout: float = None) -> None:
+        """
+        Block until this caller may issue one request, and count it against the quota.
+        Raises QuotaExhausted when the daily budget is spent and TimeoutError after `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    wait = self._try_take(ticket)
+                    if wait == 0:
+                        return
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError("Timed out waiting for an Alpha Vantage request slot.")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._leave(ticket)
+
+    async def acquire_async(self, priority: int = PRIORITY_BACKGROUND, timeout: float = None) -> None:
+        """
+        acquire() for coroutines: the caller is parked on a future in the same queue instead of
+        holding a thread, so any number of queued background calls can't crowd out an interactive one.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(ticket)
+                    if wait == 0:
+                        return
+                    # Registered under the lock, so a wake-up between here and the await isn't lost
+                    waker = loop.create_future()
+                    self._wakers[ticket] = (loop, waker)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for an Alpha Vantage request slot.")
+                    wait = remaining if wait is None else min(wait, remaining)
+                try:
+                    await asyncio.wait((waker,), timeout=wait)
+                finally:
+                    with self._cond:
+                        self._wakers.pop(ticket, None)
+        finally:
+            with self._cond:
+                self._leave(ticket)
+
+    def report_rate_limited(self, payload: dict = None) -> None:
+        """Back off after a throttling payload; a daily-limit note also closes the quota for today."""
+        with self._cond:
+            self._rate_limited += 1
+            self._bucket.drain(RATE_LIMIT_BACKOFF_SECONDS)
+            if payload and is_daily_limit_payload(payload) and self.per_day:
+                self._used_today = self.per_day
+            self._notify()
+
+    def quota_status(self) -> dict:
+        with self._cond:
+            self._roll_day()
+            return {
+                "used_today": self._used_today,
+                "daily_limit": self.per_day or None,
+                "remaining_today": (self.per_day - self._used_today) if self.per_day else None,
+                "queued": len(self._waiting),
+                "rate_limited_responses": self._rate_limited,
+            }
+
+
+def _resolve(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
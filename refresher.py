@@ -0,0 +1,204 @@
+"""
+Background watchlist refresher.
+
+Keeps the watchlist's cache entries warm and writes the latest asset table to a snapshot file,
+so the Streamlit app only ever reads from disk. Run it inside the app (start_background_refresher)
+or as its own worker process:
+
+    python refresher.py            # refresh forever
+    python refresher.py --once     # refresh what is stale, write a snapshot and exit
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+# data_fetcher reads AV_API_KEY at import time, so load .env first when run as a worker
+load_dotenv()
+
+import av_cache
+from quotes import Quote
+from data_fetcher import (
+    AV_API_KEY,
+    DEFAULT_WATCHLIST,
+    collect_assets,
+    get_quota_status,
+    watchlist_cache_keys,
+)
+
+logger = logging.getLogger(__name__)
+
+WATCHLIST_FILE = os.getenv("WATCHLIST_FILE", "watchlist.json")
+SNAPSHOT_PATH = os.getenv("ASSET_SNAPSHOT_PATH", os.path.join(".cache", "snapshots", "assets.json"))
+
+# Bounds on how long the worker sleeps between staleness checks
+MIN_SLEEP_SECONDS = 30
+MAX_SLEEP_SECONDS = 15 * 60
+
+# Set to "0" to keep the Streamlit app from starting its own refresher thread
+BACKGROUND_REFRESH = os.getenv("FINBOT_BACKGROUND_REFRESH", "1") != "0"
+
+
+def load_watchlist(path: str = WATCHLIST_FILE) -> dict:
+    """
+    Read the watchlist from JSON, e.g.
+    {"stocks": ["IBM"], "forex": [["EUR", "USD"]], "crypto": [["BTC", "USD"]], "commodities": true}
+    Add "history": true to keep each stock's full daily series warm instead of just its quote.
+    Falls back to data_fetcher.DEFAULT_WATCHLIST when the file is missing or unreadable.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return DEFAULT_WATCHLIST
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable watchlist %s: %s", path, e)
+        return DEFAULT_WATCHLIST
+
+
+def write_snapshot(rows: list, errors: list = None, path: str = SNAPSHOT_PATH) -> dict:
+    """Atomically write a list of Quote rows; returns the snapshot with the rows as Quotes."""
+    snapshot = {
+        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "rows": [q.to_dict() for q in rows],
+        "errors": errors or [],
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with av_cache.atomic_write(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    snapshot["rows"] = list(rows)
+    return snapshot
+
+
+def read_snapshot(path: str = SNAPSHOT_PATH) -> dict:
+    """Latest snapshot written by the refresher (rows as Quote records), or None if there isn't one yet."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        snapshot["rows"] = [Quote.from_dict(row) for row in snapshot.get("rows", [])]
+        return snapshot
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def stale_keys(watchlist: dict, now: float = None) -> list:
+    now = time.time() if now is None else now
+    stale = []
+    for key in watchlist_cache_keys(watchlist, bool(watchlist.get("history"))):
+        fetched_at = av_cache.cached_at(key)
+        if fetched_at is None or not av_cache.is_fresh(key.function, fetched_at, now):
+            stale.append(key)
+    return stale
+
+
+def seconds_until_next_stale(watchlist: dict, now: float = None) -> float:
+    """How long until the first watchlist entry expires, clamped to the sleep bounds."""
+    now = time.time() if now is None else now
+    expiries = []
+    for key in watchlist_cache_keys(watchlist, bool(watchlist.get("history"))):
+        fetched_at = av_cache.cached_at(key)
+        expiries.append(now if fetched_at is None else av_cache.expires_at(key.function, fetched_at))
+    if not expiries:
+        return MAX_SLEEP_SECONDS
+    return min(MAX_SLEEP_SECONDS, max(MIN_SLEEP_SECONDS, min(expiries) - now))
+
+
+def refresh_once(watchlist: dict = None, force_snapshot: bool = False) -> dict:
+    """
+    Refresh the stale part of the watchlist and write a new snapshot.
+    Fresh entries are served from the cache, so only stale ones cost API calls. If the remaining
+    daily quota can't cover the stale entries we skip the round rather than half-refresh.
+    """
+    if not AV_API_KEY:
+        return None
+    watchlist = watchlist or load_watchlist()
+    stale = stale_keys(watchlist)
+    if not stale and not force_snapshot and read_snapshot() is not None:
+        return None
+
+    remaining = get_quota_status()["remaining_today"]
+    if remaining is not None and remaining < len(stale):
+        logger.warning("Skipping refresh: %d stale entries but only %d calls left today", len(stale), remaining)
+        return None
+
+    rows, errors = collect_assets(watchlist, history=bool(watchlist.get("history")))
+    for message in errors:
+        logger.warning(message)
+    return write_snapshot(rows, errors)
+
+
+class WatchlistRefresher(threading.Thread):
+    """Daemon thread that calls refresh_once whenever the earliest cache entry goes stale."""
+
+    def __init__(self, watchlist: dict = None):
+        super().__init__(name="watchlist-refresher", daemon=True)
+        self.watchlist = watchlist
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self) -> None:
+        """Ask for an immediate staleness check (e.g. the user pressed "Update Data")."""
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self) -> None:
+        while not self._stopping.is_set():
+            watchlist = self.watchlist or load_watchlist()
+            try:
+                refresh_once(watchlist)
+            except Exception:
+                logger.exception("Watchlist refresh failed")
+            self._wake.wait(seconds_until_next_stale(watchlist))
+            self._wake.clear()
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_background_refresher() -> WatchlistRefresher:
+    """Start the refresher thread once per server process; later calls return the same thread."""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = WatchlistRefresher()
+            _refresher.start()
+        return _refresher
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Keep the asset watchlist warm.")
+    parser.add_argument("--once", action="store_true", help="refresh stale entries, write a snapshot and exit")
+    parser.add_argument("--watchlist", default=WATCHLIST_FILE, help="path to the watchlist JSON file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not AV_API_KEY:
+        logger.error("Missing Alpha Vantage API Key in .env (AV_API_KEY).")
+        return 1
+
+    if args.once:
+        refresh_once(load_watchlist(args.watchlist), force_snapshot=True)
+        return 0
+
+    refresher = WatchlistRefresher(load_watchlist(args.watchlist))
+    refresher.start()
+    try:
+        while refresher.is_alive():
+            refresher.join(1)
+    except KeyboardInterrupt:
+        refresher.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Weekly, monthly and quarterly bars derived from the stored daily series.
+
+Bars are formed with reduceat over the runs of days that share a period, the same way Alpha
+Vantage builds its weekly/monthly series: first open, highest high, lowest low, last close,
+summed volume, dated on the period's last trading day. Results are memoised per series and only
+the last period is recomputed when new daily bars arrive.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from av_cache import SERIES_COLUMNS, CacheKey
+
+INTERVALS = ("daily", "weekly", "monthly", "quarterly")
+MEMO_SIZE = 256
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def period_keys(dates: np.ndarray, interval: str) -> np.ndarray:
+    """Integer period number of every date; equal numbers share a bar."""
+    if interval == "weekly":
+        # 1970-01-01 was a Thursday; shifting by 3 days makes weeks run Monday..Sunday
+        return (dates.astype("datetime64[D]").astype(np.int64) + 3) // 7
+    if interval == "monthly":
+        return dates.astype("datetime64[M]").astype(np.int64)
+    if interval == "quarterly":
+        return dates.astype("datetime64[M]").astype(np.int64) // 3
+    raise ValueError(f"unknown interval '{interval}', expected one of {', '.join(INTERVALS)}")
+
+
+def _period_starts(dates: np.ndarray, interval: str) -> np.ndarray:
+    keys = period_keys(dates, interval)
+    return np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+
+
+def resample_series(series: dict, interval: str) -> dict:
+    """OHLCV bars for `interval` from an ascending daily series (numpy columns as cached by data_fetcher)."""
+    dates = series["date"]
+    if interval == "daily" or len(dates) == 0:
+        return series
+    starts = _period_starts(dates, interval)
+    ends = np.concatenate([starts[1:], [len(dates)]]) - 1
+    out = {
+        "date": dates[ends],
+        "open": series["open"][starts],
+        "high": np.maximum.reduceat(series["high"], starts),
+        "low": np.minimum.reduceat(series["low"], starts),
+        "close": series["close"][ends],
+        "volume": np.add.reduceat(series["volume"], starts),
+    }
+    if "fetched_at" in series:
+        out["fetched_at"] = series["fetched_at"]
+    return out
+
+
+def _extend(entry: dict, series: dict, interval: str):
+    """
+    Resampled bars for `series` built from a memo entry of an earlier version of it, or None if
+    anything before the memo's last period has changed since (e.g. a split adjustment).
+    """
+    dates, close = series["date"], series["close"]
+    tail_start, n = entry["tail_start"], entry["n"]
+    if len(dates) < n or dates[n - 1] != entry["last_date"] or dates[0] != entry["first_date"]:
+        return None
+    if tail_start and close[tail_start - 1] != entry["anchor_close"]:
+        return None
+    tail = resample_series({col: series[col][tail_start:] for col in ("date",) + SERIES_COLUMNS}, interval)
+    bars = {col: np.concatenate([entry["bars"][col][:-1], tail[col]]) for col in ("date",) + SERIES_COLUMNS}
+    return bars, tail_start + int(_period_starts(dates[tail_start:], interval)[-1])
+
+
+def resampled(key: CacheKey, series: dict, interval: str) -> dict:
+    """
+    resample_series, memoised per (series, interval). When the daily series has only grown or had
+    its latest bars revised, just the periods from the memo's last one onwards are rebuilt.
+    """
+    if interval == "daily" or not len(series.get("date", ())):
+        return series
+    memo_key = (key.function, key.symbol, key.market, interval)
+    with _memo_lock:
+        entry = _memo.get(memo_key)
+        if entry is not None:
+            _memo.move_to_end(memo_key)
+
+    dates = series["date"]
+    n = len(dates)
+    if (entry is not None and entry["n"] == n and entry["last_date"] == dates[-1]
+            and entry["last_close"] == series["close"][-1] and entry["first_date"] == dates[0]):
+        bars = entry["bars"]
+    else:
+        extended = _extend(entry, series, interval) if entry is not None else None
+        if extended is None:
+            bars = resample_series(series, interval)
+            tail_start = int(_period_starts(dates, interval)[-1])
+        else:
+            bars, tail_start = extended
+        entry = {
+            "n": n,
+            "first_date": dates[0],
+            "last_date": dates[-1],
+            "last_close": series["close"][-1],
+            "tail_start": tail_start,
+            "anchor_close": series["close"][tail_start - 1] if tail_start else None,
+            "bars": {col: bars[col] for col in ("date",) + SERIES_COLUMNS},
+        }
+        with _memo_lock:
+            _memo[memo_key] = entry
+            _memo.move_to_end(memo_key)
+            while len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+
+    out = dict(entry["bars"])
+    if "fetched_at" in series:
+        out["fetched_at"] = series["fetched_at"]
+    return out
+
+
+def forget(key: CacheKey) -> None:
+    """Drop the memoised bars of one series at every interval, e.g. after its past bars were revised."""
+    with _memo_lock:
+        for memo_key in [k for k in _memo if k[:3] == (key.function, key.symbol, key.market)]:
+            del _memo[memo_key]
+
+
+def clear() -> None:
+    with _memo_lock:
+        _memo.clear()
@@ -0,0 +1,178 @@
+"""
+Rolling risk statistics over the cached daily series.
+
+Every rolling statistic is a difference of cumulative sums, so a window of any length costs O(n)
+per symbol and all symbols go through together as a symbols x dates matrix. Returns are centred
+on each symbol's own mean first: variance and covariance don't change under a shift, and keeping
+the running sums near zero stops them from swallowing the small per-window differences.
+The correlation matrix for a window is a single matrix product of standardised returns.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import matplotlib.pyplot as plt
+
+from data_fetcher import fetch_daily_series_many
+from singleflight import shared as shared_flights
+from technical_analysis import align_series
+
+TRADING_DAYS = 252
+WINDOWS = (20, 60, 120, 252)
+BENCHMARK = os.getenv("FINBOT_BENCHMARK", "SPY")
+# Reports are keyed on the data they were computed from, so this only bounds how long they stay in memory
+RISK_CACHE_SECONDS = 60 * 60
+
+
+def returns_matrix(close: np.ndarray) -> np.ndarray:
+    """Simple daily returns along the last axis, NaN where either close is missing."""
+    close = np.asarray(close, dtype=np.float64)
+    out = np.full(close.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[..., 1:] = close[..., 1:] / close[..., :-1] - 1.0
+    return out
+
+
+def _window_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of the last `window` values at every position (fewer at the start)."""
+    total = np.cumsum(values, axis=-1)
+    out = total.copy()
+    out[..., window:] -= total[..., :-window]
+    return out
+
+
+def _centred(returns: np.ndarray):
+    """(returns minus their row mean with NaN as 0, validity mask)."""
+    valid = ~np.isnan(returns)
+    with np.errstate(invalid="ignore"):
+        mean = np.nanmean(np.where(valid, returns, np.nan), axis=-1, keepdims=True) if returns.size else 0.0
+    return np.where(valid, returns - np.nan_to_num(mean), 0.0), valid
+
+
+def rolling_variance(returns: np.ndarray, window: int) -> np.ndarray:
+    """Sample variance of each trailing window; NaN until a window is complete."""
+    x, valid = _centred(returns)
+    n = _window_sum(valid.astype(np.float64), window)
+    s1, s2 = _window_sum(x, window), _window_sum(x * x, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = (s2 - s1 * s1 / n) / (n - 1)
+    return np.where(n == window, np.maximum(var, 0.0), np.nan)
+
+
+def rolling_volatility(returns: np.ndarray, window: int) -> np.ndarray:
+    """Annualised standard deviation of daily returns over each trailing window."""
+    return np.sqrt(rolling_variance(returns, window) * TRADING_DAYS)
+
+
+def rolling_downside_deviation(returns: np.ndarray, window: int, target: float = 0.0) -> np.ndarray:
+    """Annualised root mean square of the shortfall below `target` over each trailing window."""
+    valid = ~np.isnan(returns)
+    shortfall = np.where(valid, np.minimum(np.nan_to_num(returns) - target, 0.0), 0.0)
+    n = _window_sum(valid.astype(np.float64), window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = np.sqrt(_window_sum(shortfall * shortfall, window) / n * TRADING_DAYS)
+    return np.where(n == window, dd, np.nan)
+
+
+def rolling_beta(returns: np.ndarray, benchmark: np.ndarray, window: int) -> np.ndarray:
+    """Covariance with the benchmark over its variance, per trailing window; only bars where both trade count."""
+    both = ~np.isnan(returns) & ~np.isnan(benchmark)
+    r = np.where(both, returns, np.nan)
+    b = np.where(both, np.broadcast_to(benchmark, returns.shape), np.nan)
+    x, _ = _centred(r)
+    y, _ = _centred(b)
+    n = _window_sum(both.astype(np.float64), window)
+    sx, sy = _window_sum(x, window), _window_sum(y, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = _window_sum(x * y, window) - sx * sy / n
+        var = _window_sum(y * y, window) - sy * sy / n
+        beta = cov / var
+    return np.where((n == window) & (var > 0), beta, np.nan)
+
+
+def correlation_matrix(returns: np.ndarray, window: int):
+    """
+    Pearson correlations over the last `window` bars as one matrix product.
+    Rows without a complete window are left out; returns (matrix, indices of the rows kept).
+    """
+    tail = returns[:, -window:]
+    keep = np.flatnonzero(~np.isnan(tail).any(axis=1)) if tail.shape[1] == window else np.array([], dtype=int)
+    z = tail[keep] - tail[keep].mean(axis=1, keepdims=True)
+    norm = np.sqrt((z * z).sum(axis=1, keepdims=True))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = z / norm
+    corr = z @ z.T
+    np.fill_diagonal(corr, 1.0)
+    return np.clip(corr, -1.0, 1.0), keep
+
+
+def _report(panel: dict, window: int, benchmark: str, held: list):
+    """The risk_report tables for the `held` symbols; the benchmark is only a row of its own if it is held."""
+    symbols = panel["symbols"]
+    returns = returns_matrix(panel["close"])
+    held = set(held)
+    stocks = [i for i, s in enumerate(symbols) if s in held]
+    vol = rolling_volatility(returns[stocks], window)
+    downside = rolling_downside_deviation(returns[stocks], window)
+    if benchmark in symbols:
+        beta = rolling_beta(returns[stocks], returns[symbols.index(benchmark)], window)
+    else:
+        beta = np.full(vol.shape, np.nan)
+
+    last = [np.flatnonzero(~np.isnan(v)) for v in vol]
+    at = np.array([idx[-1] if len(idx) else vol.shape[1] - 1 for idx in last], dtype=int)
+    rows = np.arange(len(stocks))
+    table = pd.DataFrame({
+        "Ticker": [symbols[i] for i in stocks],
+        "As Of": pd.to_datetime(panel["date"][at]) if len(panel["date"]) else pd.NaT,
+        "Volatility": vol[rows, at] if vol.size else np.nan,
+        "Downside Deviation": downside[rows, at] if downside.size else np.nan,
+        f"Beta vs {benchmark}": beta[rows, at] if beta.size else np.nan,
+    })
+    history = pd.DataFrame(vol.T, index=pd.to_datetime(panel["date"]), columns=table["Ticker"])
+
+    corr, keep = correlation_matrix(returns[stocks], window)
+    names = [symbols[stocks[i]] for i in keep]
+    return table, pd.DataFrame(corr, index=names, columns=names), history
+
+
+def risk_report(symbols: list, window: int = 60, benchmark: str = BENCHMARK):
+    """
+    Latest rolling volatility, downside deviation and beta per symbol, the correlation matrix over
+    the last `window` days, and the rolling volatility history, from the cached daily series.
+    Results are cached per window and per version of the underlying data.
+    Returns (table, correlation DataFrame, volatility history DataFrame).
+    """
+    wanted = list(dict.fromkeys(symbols + [benchmark]))
+    series_by_symbol = {}
+    for sym, res in fetch_daily_series_many("TIME_SERIES_DAILY", wanted).items():
+        if isinstance(res, Exception):
+            st.error(f"Error fetching price history for {sym}: {res}")
+        elif res:
+            series_by_symbol[sym] = res
+    if not any(s in series_by_symbol for s in symbols):
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+    version = tuple((s, str(series["date"][-1]), float(series["close"][-1]), len(series["date"]))
+                    for s, series in series_by_symbol.items())
+    return shared_flights.do(
+        ("risk", version, window, benchmark, tuple(symbols)),
+        lambda: _report(align_series(series_by_symbol), window, benchmark, symbols),
+        ttl=RISK_CACHE_SECONDS,
+    )
+
+
+def correlation_heatmap(corr: pd.DataFrame):
+    size = max(4.0, 0.45 * len(corr))
+    fig, ax = plt.subplots(figsize=(size + 1, size))
+    image = ax.imshow(corr.values, cmap="RdBu_r", vmin=-1, vmax=1)
+    ax.set_xticks(range(len(corr)), corr.columns, rotation=90)
+    ax.set_yticks(range(len(corr)), corr.index)
+    if len(corr) <= 15:
+        for i in range(len(corr)):
+            for j in range(len(corr)):
+                ax.text(j, i, f"{corr.values[i, j]:.2f}", ha="center", va="center", fontsize=8)
+    fig.colorbar(image, ax=ax, fraction=0.046, pad=0.04)
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,371 @@
+"""
+Technical screener over the cached daily histories.
+
+Conditions use a small expression language built on the indicator functions in
+technical_analysis.py, for example
+
+    RSI(14) < 30 and CROSSED_ABOVE(MACD(), MACD_SIGNAL(), 3)
+    CLOSE > SMA(200) and 20 < STOCHRSI_K() < 80
+
+The price panel is copied once into a multiprocessing.shared_memory block. Pool workers attach
+to it by name and each screens a range of rows, so only row bounds and small result arrays are
+pickled between processes, never the price histories themselves.
+"""
+import os
+import ast
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import av_cache
+import technical_analysis as ta
+from av_cache import SERIES_COLUMNS, CacheKey
+
+SCREENER_WORKERS = int(os.getenv("SCREENER_WORKERS", str(os.cpu_count() or 1)))
+# Below this many symbols the pool costs more than it saves; screen in-process
+PARALLEL_MIN_SYMBOLS = 256
+TASKS_PER_WORKER = 4
+
+PRICE_FIELDS = {"OPEN": "open", "HIGH": "high", "LOW": "low", "CLOSE": "close", "VOLUME": "volume"}
+
+# name -> (default arguments, family, which output of the family's function)
+INDICATORS = {
+    "RSI": ((14,), "RSI", None),
+    "SMA": ((20,), "SMA", None),
+    "EMA": ((20,), "EMA", None),
+    "MACD": ((12, 26, 9), "MACD", 0),
+    "MACD_SIGNAL": ((12, 26, 9), "MACD", 1),
+    "MACD_HIST": ((12, 26, 9), "MACD", 2),
+    "BB_UPPER": ((20, 2.0), "BBANDS", 0),
+    "BB_MIDDLE": ((20, 2.0), "BBANDS", 1),
+    "BB_LOWER": ((20, 2.0), "BBANDS", 2),
+    "STOCHRSI_K": ((14, 5, 3), "STOCHRSI", 0),
+    "STOCHRSI_D": ((14, 5, 3), "STOCHRSI", 1),
+    "ATR": ((14,), "ATR", None),
+    "OBV": ((), "OBV", None),
+}
+
+FAMILIES = {
+    "RSI": lambda p, period: ta.rsi(p["close"], int(period)),
+    "SMA": lambda p, period: ta.sma(p["close"], int(period)),
+    "EMA": lambda p, period: ta.ema(p["close"], int(period)),
+    "MACD": lambda p, fast, slow, signal: ta.macd(p["close"], int(fast), int(slow), int(signal)),
+    "BBANDS": lambda p, period, nbdev: ta.bbands(p["close"], int(period), float(nbdev)),
+    "STOCHRSI": lambda p, period, k, d: ta.stochrsi(p["close"], int(period), int(k), int(d)),
+    "ATR": lambda p, period: ta.atr(p["high"], p["low"], p["close"], int(period)),
+    "OBV": lambda p: ta.obv(p["close"], p["volume"]) + p["obv_offset"][:, None],
+}
+
+# Helpers over time: CROSSED_*(a, b[, bars]) and AGO(series, bars)
+CROSSINGS = {"CROSSED_ABOVE", "CROSSED_BELOW"}
+
+_COMPARE = {
+    ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater,
+    ast.GtE: np.greater_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+_ARITHMETIC = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+
+
+class ScreenerError(ValueError):
+    """The condition text isn't valid screener syntax."""
+
+
+def _number(node: ast.AST) -> float:
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -_number(node.operand)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    raise ScreenerError(f"expected a number, got '{ast.unparse(node)}'")
+
+
+def _bar_count(node: ast.AST, name: str, minimum: int) -> int:
+    """A bar count argument: an integer literal of at least `minimum`."""
+    value = _number(node)
+    if not isinstance(value, int) or value < minimum:
+        raise ScreenerError(f"{name}() needs a whole number of bars, at least {minimum}, got '{ast.unparse(node)}'")
+    return value
+
+
+class Condition:
+    """A parsed, validated screener expression."""
+
+    def __init__(self, text: str):
+        self.text = text.strip()
+        try:
+            self.tree = ast.parse(self.text, mode="eval").body
+        except SyntaxError as e:
+            raise ScreenerError(f"can't parse '{self.text}': {e.msg}") from None
+        self.label = ast.unparse(self.tree)
+        self.calls = []     # distinct indicator calls, in order of appearance, for the result table
+        self.lookback = 1   # bars of history the expression looks at, counting the latest
+        self._check(self.tree)
+
+    def _check(self, node: ast.AST) -> None:
+        if isinstance(node, ast.BoolOp):
+            for value in node.values:
+                self._check(value)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub)):
+            self._check(node.operand)
+        elif isinstance(node, ast.Compare):
+            if not all(type(op) in _COMPARE for op in node.ops):
+                raise ScreenerError("only <, <=, >, >=, == and != comparisons are supported")
+            for operand in [node.left, *node.comparators]:
+                self._check(operand)
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in _ARITHMETIC:
+                raise ScreenerError("only + - * / arithmetic is supported")
+            self._check(node.left)
+            self._check(node.right)
+        elif isinstance(node, ast.Constant):
+            _number(node)
+        elif isinstance(node, ast.Name):
+            if node.id.upper() not in PRICE_FIELDS:
+                raise ScreenerError(f"unknown name '{node.id}'; price fields are {', '.join(PRICE_FIELDS)}")
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            self._check_call(node)
+        else:
+            raise ScreenerError(f"'{ast.unparse(node)}' is not allowed in a condition")
+
+    def _check_call(self, node: ast.Call) -> None:
+        name = node.func.id.upper()
+        if node.keywords:
+            raise ScreenerError(f"{name}() takes positional arguments only")
+        if name in CROSSINGS:
+            if len(node.args) not in (2, 3):
+                raise ScreenerError(f"{name}(a, b[, bars]) takes two series and an optional bar count")
+            bars = _bar_count(node.args[2], name, 1) if len(node.args) == 3 else 1
+            self.lookback = max(self.lookback, bars + 1)
+            self._check(node.args[0])
+            self._check(node.args[1])
+        elif name == "AGO":
+            if len(node.args) != 2:
+                raise ScreenerError("AGO(series, bars) takes a series and a bar count")
+            self.lookback = max(self.lookback, _bar_count(node.args[1], name, 0) + 1)
+            self._check(node.args[0])
+        elif name in INDICATORS:
+            defaults = INDICATORS[name][0]
+            if len(node.args) > len(defaults):
+                raise ScreenerError(f"{name}() takes at most {len(defaults)} arguments")
+            for i, arg in enumerate(node.args):
+                if isinstance(defaults[i], float):
+                    # A band width in standard deviations, not a bar count
+                    if _number(arg) <= 0:
+                        raise ScreenerError(f"{name}() needs a positive band width, got '{ast.unparse(arg)}'")
+                else:
+                    _bar_count(arg, name, 1)
+            label = ast.unparse(node)
+            if label not in self.calls:
+                self.calls.append(label)
+        else:
+            known = sorted(INDICATORS) + sorted(CROSSINGS) + ["AGO"]
+            raise ScreenerError(f"unknown function '{node.func.id}'; available: {', '.join(known)}")
+
+
+class _Evaluator:
+    """Evaluates a Condition over left-justified price matrices, keeping the last `lookback` bars per row."""
+
+    def __init__(self, prices: dict, at: np.ndarray, lookback: int, memo: dict = None):
+        self.prices = prices
+        self.lookback = lookback
+        # Column of each of the last `lookback` bars per row, oldest first
+        self.idx = at[:, None] - np.arange(lookback - 1, -1, -1)[None, :]
+        # Full indicator matrices by (family, arguments); share it between evaluators over the same prices
+        self.memo = {} if memo is None else memo
+
+    def _tail(self, values: np.ndarray) -> np.ndarray:
+        out = np.take_along_axis(values, np.clip(self.idx, 0, None), axis=1)
+        out[self.idx < 0] = np.nan
+        return out
+
+    def indicator(self, name: str, args: tuple) -> np.ndarray:
+        defaults, family, output = INDICATORS[name]
+        args = tuple(float(a) for a in args) + defaults[len(args):]
+        key = (family, args)
+        if key not in self.memo:
+            self.memo[key] = FAMILIES[family](self.prices, *args)
+        values = self.memo[key] if output is None else self.memo[key][output]
+        return self._tail(values)
+
+    def eval(self, node: ast.AST):
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            result = self._bool(self.eval(node.values[0]))
+            for value in node.values[1:]:
+                result = combine(result, self._bool(self.eval(value)))
+            return result
+        if isinstance(node, ast.UnaryOp):
+            operand = self.eval(node.operand)
+            return np.logical_not(self._bool(operand)) if isinstance(node.op, ast.Not) else -operand
+        if isinstance(node, ast.Compare):
+            result, left = True, self.eval(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.eval(comparator)
+                with np.errstate(invalid="ignore"):
+                    result = np.logical_and(result, _COMPARE[type(op)](left, right))
+                left = right
+            return result
+        if isinstance(node, ast.BinOp):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return _ARITHMETIC[type(node.op)](self.eval(node.left), self.eval(node.right))
+        if isinstance(node, ast.Constant):
+            return float(node.value)
+        if isinstance(node, ast.Name):
+            return self._tail(self.prices[PRICE_FIELDS[node.id.upper()]])
+
+        name = node.func.id.upper()
+        if name in CROSSINGS:
+            bars = int(_number(node.args[2])) if len(node.args) == 3 else 1
+            diff = np.broadcast_to(self.eval(node.args[0]) - self.eval(node.args[1]), self.idx.shape)
+            before = np.full(diff.shape, np.nan)
+            before[:, 1:] = diff[:, :-1]
+            with np.errstate(invalid="ignore"):
+                crossed = (before <= 0) & (diff > 0) if name == "CROSSED_ABOVE" else (before >= 0) & (diff < 0)
+            # True on every bar with a crossing among the `bars` bars ending there
+            count = np.cumsum(crossed, axis=1)
+            earlier = np.zeros_like(count)
+            earlier[:, bars:] = count[:, :-bars]
+            return count > earlier
+        if name == "AGO":
+            bars = int(_number(node.args[1]))
+            values = np.broadcast_to(self.eval(node.args[0]), self.idx.shape).astype(np.float64)
+            shifted = np.full(values.shape, np.nan)
+            shifted[:, bars:] = values[:, :values.shape[1] - bars]
+            return shifted
+        return self.indicator(name, [_number(arg) for arg in node.args])
+
+    @staticmethod
+    def _bool(value) -> np.ndarray:
+        return np.asarray(value) if np.asarray(value).dtype == bool else np.nan_to_num(value) != 0
+
+    def latest(self, node: ast.AST) -> np.ndarray:
+        """Value of an expression on each row's latest bar."""
+        value = np.broadcast_to(self.eval(node), self.idx.shape)
+        return value[:, -1]
+
+
+def evaluate_series(condition: Condition, prices: dict, memo: dict = None) -> np.ndarray:
+    """
+    Bar-by-bar boolean signal of `condition` over whole price matrices (rows ending on their last
+    column, e.g. one symbol's full history as a 1 x dates matrix). Bars without enough history are False.
+    """
+    n_rows, width = prices["close"].shape
+    evaluator = _Evaluator(prices, np.full(n_rows, width - 1), width, memo)
+    return np.broadcast_to(_Evaluator._bool(evaluator.eval(condition.tree)), (n_rows, width))
+
+
+def screen_rows(prices: dict, at: np.ndarray, condition: Condition, rank_by: Condition = None) -> dict:
+    """
+    Screen every row of a block of left-justified price matrices (see technical_analysis.justify_panel).
+    Returns {"match": bool per row, "rank": rank_by value per row, label: value per row for each indicator call}.
+    """
+    lookback = max(condition.lookback, rank_by.lookback if rank_by else 1)
+    evaluator = _Evaluator(prices, at, lookback)
+    result = {"match": _Evaluator._bool(evaluator.latest(condition.tree)).copy()}
+    result["rank"] = evaluator.latest(rank_by.tree).astype(np.float64) if rank_by else np.full(len(at), np.nan)
+    for expr in [condition, rank_by] if rank_by else [condition]:
+        for label in expr.calls:
+            if label not in result:
+                call = ast.parse(label, mode="eval").body
+                result[label] = evaluator.latest(call).astype(np.float64)
+    return result
+
+
+# Set in each pool worker by _attach: the shared price block and a view of it
+_shm = None
+_block = None
+
+
+def _attach(name: str, shape: tuple) -> None:
+    global _shm, _block
+    _shm = shared_memory.SharedMemory(name=name)
+    _block = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+
+
+def _screen_shared(lo: int, hi: int, at: np.ndarray, obv_offset: np.ndarray, condition_text: str, rank_text: str) -> dict:
+    """Worker task: screen rows lo..hi of the shared block."""
+    prices = {col: _block[i, lo:hi] for i, col in enumerate(SERIES_COLUMNS)}
+    prices["obv_offset"] = obv_offset
+    return screen_rows(prices, at, Condition(condition_text), Condition(rank_text) if rank_text else None)
+
+
+def load_panel(symbols: list = None, bars: int = ta.PANEL_BARS):
+    """
+    align_series panel of the cached TIME_SERIES_DAILY histories (all cached symbols by default).
+    Never touches the network; returns (panel, symbols that have no cached history).
+    """
+    symbols = av_cache.cached_symbols("TIME_SERIES_DAILY") if symbols is None else symbols
+    series_by_symbol, missing = {}, []
+    for sym in symbols:
+        series = av_cache.load_series(CacheKey("TIME_SERIES_DAILY", sym), allow_stale=True)
+        if series is None:
+            missing.append(sym)
+        else:
+            series_by_symbol[sym] = series
+    return ta.align_series(series_by_symbol, bars), missing
+
+
+def _screen_parallel(prices: dict, at: np.ndarray, condition: Condition, rank_by: Condition, workers: int) -> dict:
+    n = len(at)
+    shape = (len(SERIES_COLUMNS),) + prices["close"].shape
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        for i, col in enumerate(SERIES_COLUMNS):
+            block[i] = prices[col]
+        bounds = np.linspace(0, n, min(n, workers * TASKS_PER_WORKER) + 1).astype(int)
+        rank_text = rank_by.text if rank_by else None
+        with ProcessPoolExecutor(workers, initializer=_attach, initargs=(shm.name, shape)) as pool:
+            futures = [
+                pool.submit(_screen_shared, lo, hi, at[lo:hi], prices["obv_offset"][lo:hi], condition.text, rank_text)
+                for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+            ]
+            parts = [f.result() for f in futures]
+        del block
+    finally:
+        shm.close()
+        shm.unlink()
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def screen(condition: str, symbols: list = None, rank_by: str = None, descending: bool = False,
+           workers: int = None) -> pd.DataFrame:
+    """
+    Symbols whose latest bar satisfies `condition`, ranked by the `rank_by` expression.
+    Raises ScreenerError for invalid expressions. The result has the Ticker, the date of the
+    bar screened, its close and the latest value of every indicator the expressions mention.
+    """
+    parsed = Condition(condition)
+    ranker = Condition(rank_by) if rank_by and rank_by.strip() else None
+    panel, _ = load_panel(symbols)
+    if not panel["symbols"]:
+        return pd.DataFrame()
+
+    prices, first, last = ta.justify_panel(panel)
+    prices["obv_offset"] = panel["obv_offset"]
+    at = last - first
+    workers = SCREENER_WORKERS if workers is None else workers
+    if workers > 1 and len(at) >= PARALLEL_MIN_SYMBOLS:
+        result = _screen_parallel(prices, at, parsed, ranker, workers)
+    else:
+        result = screen_rows(prices, at, parsed, ranker)
+
+    match = result.pop("match")
+    rank = result.pop("rank")
+    rows = np.flatnonzero(match)
+    table = pd.DataFrame({
+        "Ticker": np.asarray(panel["symbols"], dtype=object)[rows],
+        "As Of": pd.to_datetime(panel["date"][last[rows]]),
+        "Close": panel["close"][rows, last[rows]],
+    })
+    for label, values in result.items():
+        table[label] = values[rows]
+    if ranker is not None:
+        if ranker.label not in table.columns:
+            table.insert(1, ranker.label, rank[rows])
+        table = table.sort_values(ranker.label, ascending=not descending, na_position="last", kind="stable")
+    else:
+        table = table.sort_values("Ticker", kind="stable")
+    table.insert(0, "Rank", np.arange(1, len(table) + 1))
+    return table.reset_index(drop=True)
@@ -0,0 +1,120 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+_MISS = object()
+
+
+class SingleFlight:
+    """
+    Process-wide request coalescing.
+    The first caller for a key does the work; anyone asking for the same key while it is in
+    flight waits on the same future. Finished results are kept in a bounded LRU for `ttl` seconds.
+    Results are shared between Streamlit sessions, so callers must treat them as read-only.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._results = OrderedDict()
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        entry = self._results.get(key)
+        if entry is None:
+            return _MISS
+        value, expires = entry
+        if time.monotonic() >= expires:
+            del self._results[key]
+            return _MISS
+        self._results.move_to_end(key)
+        return value
+
+    def _store(self, key, value, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self._results[key] = (value, time.monotonic() + ttl)
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def _claim(self, key):
+        """Return (cached value, None, False) on a hit, else (_MISS, future, is_leader)."""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISS:
+                self.hits += 1
+                return value, None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return _MISS, future, False
+            self.misses += 1
+            future = Future()
+            self._inflight[key] = future
+            return _MISS, future, True
+
+    def _finish(self, key, future: Future, value=_MISS, error: BaseException = None, ttl: float = None, cache_if=None) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None and (cache_if is None or cache_if(value)):
+                self._store(key, value, self.ttl if ttl is None else ttl)
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+    def do(self, key, fn, ttl: float = None, cache_if=None):
+        """Call fn() once per key across all threads; errors are passed to every waiter but never cached."""
+        value, future, leader = self._claim(key)
+        if value is not _MISS:
+            return value
+        if not leader:
+            return future.result()
+        try:
+            value = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, value, ttl=ttl, cache_if=cache_if)
+        return value
+
+    async def do_async(self, key, coro_fn, ttl: float = None, cache_if=None):
+        """Async flavour of do(); shares the same registry, so sync and async callers coalesce too."""
+        value, future, leader = self._claim(key)
+        if value is not _MISS:
+            return value
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            value = await coro_fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, value, ttl=ttl, cache_if=cache_if)
+        return value
+
+    def clear(self) -> None:
+        """Drop cached results (in-flight requests are left alone)."""
+        with self._lock:
+            self._results.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "in_flight": len(self._inflight),
+                "cached": len(self._results),
+            }
+
+
+# One registry per server process, shared by data_fetcher, news and chat
+shared = SingleFlight()
@@ -1,40 +1,637 @@
+import os
+import threading
+import numpy as np
 import pandas as pd
 import streamlit as st
 import requests
-from data_fetcher import fetch_indicator_data
-
-def parse_technical_indicators(symbol: str) -> dict:
-    """
-    Fetch different technical indicators from Alpha Vantage for the given symbol
-    and parse them into a dictionary. 
-    This is just an example - tailor to your needs.
-    """
-    indicators = {}
-    # Examples of function_name: "SMA", "EMA", "MACD", "RSI", "STOCHRSI", "BBANDS"
-    # We'll do an RSI fetch here as a demonstration:
-    rsi_data = fetch_indicator_data(symbol, function_name="RSI", interval="daily", time_period=10, series_type="close")
-    # parse the JSON for RSI
-    if "Technical Analysis: RSI" in rsi_data:
-        ta_rsi = rsi_data["Technical Analysis: RSI"]
-        # The keys here are dates. We can pick the most recent date:
-        dates = sorted(ta_rsi.keys())
-        if dates:
-            latest_date = dates[-1]
-            latest_rsi = ta_rsi[latest_date]["RSI"]
-            indicators["RSI"] = float(latest_rsi)
-
-    # We can do the same for MACD, STOCHRSI, etc.
-    macd_data = fetch_indicator_data(symbol, function_name="MACD", interval="daily", series_type="close")
-    if "Technical Analysis: MACD" in macd_data:
-        ta_macd = macd_data["Technical Analysis: MACD"]
-        dates = sorted(ta_macd.keys())
-        if dates:
-            latest_date = dates[-1]
-            macd_val = ta_macd[latest_date]["MACD"]
-            signal_val = ta_macd[latest_date]["MACD_Signal"]
-            indicators["MACD"] = float(macd_val)
-            indicators["MACD_Signal"] = float(signal_val)
-
-    # Add more calls for STOCHRSI, BBANDS, etc. as needed
-
-    return indicators
+from av_cache import SERIES_COLUMNS, CacheKey, cached_symbols, load_series
+from data_fetcher import fetch_daily_series, fetch_daily_series_many
+from indicator_state import latest_indicators, obv_before, resume_indicators
+from rate_limiter import PRIORITY_INTERACTIVE
+from resample import resampled
+from singleflight import shared as shared_flights
+
+# Indicators are computed locally from the cached daily series, one price fetch per symbol.
+# Conventions follow TA-Lib / Alpha Vantage: EMAs are seeded with the SMA of their first window,
+# RSI and ATR use Wilder smoothing, Bollinger bands use the population standard deviation.
+# Every function works along the last axis, so it accepts one series or a symbols x dates matrix,
+# and returns arrays aligned with its input, NaN where there isn't enough history yet.
+
+# RSI look-back used by parse_technical_indicators and the batch table (Alpha Vantage's example uses 10);
+# walk_forward.py can suggest a better one for a given symbol
+RSI_PERIOD = int(os.getenv("FINBOT_RSI_PERIOD", "10"))
+
+EWM_BLOCK = 128  # bars per matrix product in _ewm
+# Bars per symbol the batch path keeps at least. With the default periods the seed of the slowest
+# average (26-bar EMA, 14-bar Wilder) weighs less than SEED_WEIGHT after this many bars, so latest
+# values equal a full-history run; longer RSI periods need more, see panel_bars.
+PANEL_BARS = 500
+SEED_WEIGHT = 1e-15
+
+
+def _ewm(values: np.ndarray, alpha: float, period: int) -> np.ndarray:
+    """
+    Exponential smoothing seeded with the mean of the first `period` values.
+    The recurrence is evaluated a block of bars at a time as one product with a lower-triangular
+    decay matrix, so there is no per-bar Python loop even for a whole watchlist.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(values.shape, np.nan)
+    n = values.shape[-1]
+    if n < period:
+        return out
+    acc = values[..., :period].mean(axis=-1)
+    out[..., period - 1] = acc
+    decay = (1.0 - alpha) ** np.arange(EWM_BLOCK + 1)
+    lag = np.arange(EWM_BLOCK)[None, :] - np.arange(EWM_BLOCK)[:, None]
+    weights = np.where(lag >= 0, alpha * decay[np.clip(lag, 0, None)], 0.0)
+    for start in range(period, n, EWM_BLOCK):
+        chunk = values[..., start:start + EWM_BLOCK]
+        m = chunk.shape[-1]
+        block = chunk @ weights[:m, :m] + np.multiply.outer(acc, decay[1:m + 1])
+        out[..., start:start + m] = block
+        acc = block[..., -1]
+    return out
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] < period:
+        return out
+    csum = np.cumsum(values, axis=-1)
+    csum = np.concatenate([np.zeros(values.shape[:-1] + (1,)), csum], axis=-1)
+    out[..., period - 1:] = (csum[..., period:] - csum[..., :-period]) / period
+    return out
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    return _ewm(values, 2.0 / (period + 1), period)
+
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    """Wilder's RSI."""
+    close = np.asarray(close, dtype=np.float64)
+    out = np.full(close.shape, np.nan)
+    if close.shape[-1] <= period:
+        return out
+    delta = np.diff(close, axis=-1)
+    avg_gain = _ewm(np.clip(delta, 0, None), 1.0 / period, period)
+    avg_loss = _ewm(np.clip(-delta, 0, None), 1.0 / period, period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        values = np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + rs))
+    out[..., 1:] = np.where(np.isnan(avg_gain), np.nan, values)
+    return out
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9):
+    """Returns (macd, signal, histogram)."""
+    close = np.asarray(close, dtype=np.float64)
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = np.full(close.shape, np.nan)
+    start = slow - 1
+    if close.shape[-1] > start:
+        signal_line[..., start:] = ema(line[..., start:], signal)
+    return line, signal_line, line - signal_line
+
+
+def bbands(close: np.ndarray, period: int = 20, nbdev: float = 2.0):
+    """Returns (upper, middle, lower)."""
+    close = np.asarray(close, dtype=np.float64)
+    middle = sma(close, period)
+    std = np.full(close.shape, np.nan)
+    n = close.shape[-1]
+    if n >= period:
+        # Sum of squared deviations one lag at a time: exact, and never materialises the windows
+        m = n - period + 1
+        mean = middle[..., period - 1:]
+        sq = np.zeros(close.shape[:-1] + (m,))
+        dev = np.empty_like(sq)
+        for lag in range(period):
+            np.subtract(close[..., lag:lag + m], mean, out=dev)
+            sq += np.square(dev, out=dev)
+        std[..., period - 1:] = np.sqrt(sq / period)
+    return middle + nbdev * std, middle, middle - nbdev * std
+
+
+def stochrsi(close: np.ndarray, period: int = 14, fastk_period: int = 5, fastd_period: int = 3):
+    """Stochastic oscillator applied to RSI. Returns (fastk, fastd), both 0..100."""
+    r = rsi(close, period)
+    fastk = np.full(r.shape, np.nan)
+    start = period  # first valid RSI index
+    if r.shape[-1] - start >= fastk_period:
+        # Window extremes one lag at a time; reducing a strided window view is much slower on a matrix
+        m = r.shape[-1] - start - fastk_period + 1
+        lowest, highest = r[..., start:start + m].copy(), r[..., start:start + m].copy()
+        for lag in range(1, fastk_period):
+            np.minimum(lowest, r[..., start + lag:start + lag + m], out=lowest)
+            np.maximum(highest, r[..., start + lag:start + lag + m], out=highest)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k = np.where(highest > lowest, (r[..., start + fastk_period - 1:] - lowest) / (highest - lowest) * 100, 0.0)
+        fastk[..., start + fastk_period - 1:] = k
+    fastd = np.full(r.shape, np.nan)
+    first_k = start + fastk_period - 1
+    if r.shape[-1] > first_k:
+        fastd[..., first_k:] = sma(fastk[..., first_k:], fastd_period)
+    return fastk, fastd
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    """Wilder's average true range."""
+    high, low, close = (np.asarray(a, dtype=np.float64) for a in (high, low, close))
+    out = np.full(close.shape, np.nan)
+    if close.shape[-1] <= period:
+        return out
+    prev_close = close[..., :-1]
+    true_range = np.maximum(
+        high[..., 1:] - low[..., 1:],
+        np.maximum(np.abs(high[..., 1:] - prev_close), np.abs(low[..., 1:] - prev_close)),
+    )
+    out[..., 1:] = _ewm(true_range, 1.0 / period, period)
+    return out
+
+
+def obv(close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """On-balance volume, starting from the first bar's volume like TA-Lib."""
+    close, volume = np.asarray(close, dtype=np.float64), np.asarray(volume, dtype=np.float64)
+    if close.shape[-1] == 0:
+        return np.zeros(close.shape)
+    signed = np.sign(np.diff(close, axis=-1)) * volume[..., 1:]
+    return np.concatenate([volume[..., :1], volume[..., :1] + np.cumsum(signed, axis=-1)], axis=-1)
+
+
+def compute_indicators(series: dict, rsi_period: int = RSI_PERIOD) -> dict:
+    """
+    Every indicator as full arrays, from one OHLCV series (numpy columns as cached by data_fetcher).
+    Columns may also be symbols x dates matrices with complete rows; see compute_panel_indicators for ragged ones.
+    """
+    close, high, low, volume = series["close"], series["high"], series["low"], series["volume"]
+    macd_line, macd_signal, macd_hist = macd(close)
+    upper, middle, lower = bbands(close)
+    fastk, fastd = stochrsi(close)
+    return {
+        "RSI": rsi(close, rsi_period),
+        "MACD": macd_line,
+        "MACD_Signal": macd_signal,
+        "MACD_Hist": macd_hist,
+        "SMA": sma(close, 20),
+        "EMA": ema(close, 20),
+        "BB_Upper": upper,
+        "BB_Middle": middle,
+        "BB_Lower": lower,
+        "StochRSI_K": fastk,
+        "StochRSI_D": fastd,
+        "ATR": atr(high, low, close),
+        "OBV": obv(close, volume),
+    }
+
+
+def _valid_span(close: np.ndarray):
+    """First and last column holding a price, per row (0, -1 for rows with none)."""
+    valid = ~np.isnan(close)
+    if valid.shape[1] == 0:
+        return np.zeros(len(valid), dtype=int), np.full(len(valid), -1)
+    has_data = valid.any(axis=1)
+    first = np.where(has_data, valid.argmax(axis=1), 0)
+    last = np.where(has_data, close.shape[1] - 1 - valid[:, ::-1].argmax(axis=1), -1)
+    return first, last
+
+
+def align_series(series_by_symbol: dict, bars: int = None) -> dict:
+    """
+    Stack daily series into a panel: {"symbols", "date", "open", ..., "volume"} with symbols x dates
+    matrices on the union of all dates. Before a symbol's first bar and after its last the cells are NaN;
+    a date missing in between (holiday on another exchange, a hole in the feed) becomes a flat bar at
+    the previous close with no volume, so it doesn't break the smoothing recurrences.
+    With `bars`, only each symbol's most recent `bars` bars are kept ("obv_offset" carries the
+    on-balance volume accumulated before them).
+    """
+    symbols = [s for s, series in series_by_symbol.items() if series and len(series["date"])]
+    series_by_symbol = {s: series_by_symbol[s] for s in symbols}
+    obv_offset = np.zeros(len(symbols))
+    if bars:
+        for i, s in enumerate(symbols):
+            series = series_by_symbol[s]
+            cut = len(series["date"]) - bars
+            if cut > 0:
+                obv_offset[i] = obv_before(series, cut)
+                series_by_symbol[s] = {col: series[col][cut:] for col in ("date",) + SERIES_COLUMNS}
+    if symbols:
+        dates = np.unique(np.concatenate([series_by_symbol[s]["date"] for s in symbols]))
+    else:
+        dates = np.array([], dtype="datetime64[D]")
+    panel = {"symbols": symbols, "date": dates, "obv_offset": obv_offset}
+    for col in SERIES_COLUMNS:
+        panel[col] = np.full((len(symbols), len(dates)), np.nan)
+    for i, s in enumerate(symbols):
+        series = series_by_symbol[s]
+        idx = np.searchsorted(dates, series["date"])
+        for col in SERIES_COLUMNS:
+            panel[col][i, idx] = series[col]
+
+    close = panel["close"]
+    first, last = _valid_span(close)
+    cols = np.arange(len(dates))[None, :]
+    gaps = np.isnan(close) & (cols > first[:, None]) & (cols < last[:, None])
+    if gaps.any():
+        carried = np.maximum.accumulate(np.where(np.isnan(close), 0, cols), axis=1)
+        prev_close = np.take_along_axis(close, carried, axis=1)
+        for col in ("open", "high", "low", "close"):
+            panel[col][gaps] = prev_close[gaps]
+        panel["volume"][gaps] = 0.0
+    return panel
+
+
+def justify_panel(panel: dict):
+    """
+    Rows of a panel start on different dates, so shift each left to start at column 0 (padded past
+    its last bar with that bar); then every row can go through the indicator functions together.
+    Returns the shifted OHLCV matrices plus each row's first and last column in the panel.
+    """
+    close = panel["close"]
+    first, last = _valid_span(close)
+    width = int((last - first + 1).max()) if len(close) else 0
+    cols = np.arange(width)[None, :]
+    left = np.minimum(cols + first[:, None], np.maximum(last, 0)[:, None])
+    shifted = {col: np.take_along_axis(panel[col], left, axis=1) for col in SERIES_COLUMNS}
+    return shifted, first, last
+
+
+def _justified_indicators(panel: dict, rsi_period: int):
+    shifted, first, last = justify_panel(panel)
+    indicators = compute_indicators(shifted, rsi_period)
+    indicators["OBV"] += panel["obv_offset"][:, None]
+    return indicators, first, last
+
+
+def compute_panel_indicators(panel: dict, rsi_period: int = RSI_PERIOD) -> dict:
+    """
+    Every indicator for every symbol of an align_series panel in one vectorised pass, as symbols x dates
+    matrices aligned with the panel. Cells outside a symbol's own history are NaN; the rest match
+    compute_indicators on that symbol's series alone.
+    """
+    justified, first, last = _justified_indicators(panel, rsi_period)
+    return _unjustify(justified, first, last, panel["close"].shape[1], np.nan)
+
+
+def _unjustify(justified: dict, first: np.ndarray, last: np.ndarray, width: int, fill) -> dict:
+    """Map matrices computed on a justify_panel layout back onto the panel's dates, `fill` outside each row's span."""
+    cols = np.arange(width)[None, :]
+    back = cols - first[:, None]
+    outside = (back < 0) | (cols > last[:, None])
+    back = np.clip(back, 0, None)
+    out = {}
+    for name, values in justified.items():
+        if values.shape[1] == 0:
+            out[name] = np.full((len(first), width), fill, dtype=values.dtype)
+            continue
+        aligned = np.take_along_axis(values, np.minimum(back, values.shape[1] - 1), axis=1)
+        aligned[outside] = fill
+        out[name] = aligned
+    return out
+
+
+def latest_panel_indicators(panel: dict, rsi_period: int = RSI_PERIOD) -> pd.DataFrame:
+    """One row per symbol: the date of its last bar and the latest value of every indicator."""
+    justified, first, last = _justified_indicators(panel, rsi_period)
+    rows = np.arange(len(panel["symbols"]))
+    at = np.maximum(last - first, 0)
+    frame = pd.DataFrame(
+        {"As Of": pd.to_datetime(panel["date"][np.maximum(last, 0)]) if len(panel["date"]) else pd.NaT},
+        index=pd.Index(panel["symbols"], name="Ticker"),
+    )
+    for name, values in justified.items():
+        frame[name] = values[rows, at] if values.size else np.nan
+    return frame
+
+
+def _seed_bars(alpha: float, period: int) -> int:
+    """Bars until the seed of an average with smoothing `alpha`, seeded over `period` bars, weighs less than SEED_WEIGHT."""
+    return period + int(np.ceil(np.log(SEED_WEIGHT) / np.log(1.0 - alpha)))
+
+
+def panel_bars(rsi_period: int = RSI_PERIOD) -> int:
+    """Bars per symbol for latest values that match a full-history run: RSI(rsi_period), ATR/StochRSI (14) and MACD (26, 9)."""
+    return max(
+        PANEL_BARS,
+        _seed_bars(1.0 / rsi_period, rsi_period),
+        _seed_bars(1.0 / 14, 14),
+        _seed_bars(2.0 / 27, 26 + 9),
+    )
+
+
+def indicator_state_key(symbol: str, interval: str, rsi_period: int) -> CacheKey:
+    """Where a symbol's streaming indicator state is saved: one per RSI period and timeframe, so switching doesn't throw the others away."""
+    return CacheKey("TIME_SERIES_DAILY", symbol, interval=interval, params=f"rsi{rsi_period}")
+
+
+def _seed_states(series_by_symbol: dict, interval: str, rsi_period: int, bars: int) -> None:
+    """Build and save the streaming state of each symbol over the same bars as the panel; run off the request thread."""
+    for sym, series in series_by_symbol.items():
+        try:
+            latest_indicators(indicator_state_key(sym, interval, rsi_period), series, rsi_period, seed_bars=bars)
+        except Exception:
+            pass  # the next batch just goes through the panel again
+
+
+def batch_technical_indicators(symbols: list, rsi_period: int = RSI_PERIOD, interval: str = "daily",
+                               bars: int = None) -> pd.DataFrame:
+    """
+    Latest indicators for a whole list of stock symbols: their daily series are fetched concurrently
+    (cache first) and resampled to `interval` if needed. Symbols with a saved streaming state only
+    fold in the bars added since; the rest are computed in one pass over the symbols x dates panel
+    of their last `bars` bars (panel_bars(rsi_period) by default), and their state is then built in
+    the background so the next batch is incremental for them too.
+    """
+    if not symbols:
+        return pd.DataFrame()
+    bars = panel_bars(rsi_period) if bars is None else bars
+    results = fetch_daily_series_many("TIME_SERIES_DAILY", symbols)
+    streamed, unseeded = {}, {}
+    for sym, res in results.items():
+        if isinstance(res, Exception):
+            st.error(f"Error fetching price history for {sym}: {res}")
+        elif res:
+            series = resampled(CacheKey("TIME_SERIES_DAILY", sym), res, interval)
+            latest = resume_indicators(indicator_state_key(sym, interval, rsi_period), series, rsi_period)
+            if latest is None:
+                unseeded[sym] = series
+            else:
+                streamed[sym] = (series["date"][-1], latest)
+
+    frames = []
+    if unseeded:
+        panel = align_series(unseeded, bars)
+        if panel["symbols"]:
+            frames.append(latest_panel_indicators(panel, rsi_period))
+        threading.Thread(target=_seed_states, args=(unseeded, interval, rsi_period, bars),
+                         name="indicator-seed", daemon=True).start()
+    if streamed:
+        frame = pd.DataFrame.from_dict({sym: latest for sym, (_, latest) in streamed.items()}, orient="index")
+        frame.insert(0, "As Of", pd.to_datetime([date for date, _ in streamed.values()]))
+        frame.index.name = "Ticker"
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    # Back in the order the symbols were asked for
+    table = pd.concat(frames)
+    return table.loc[[sym for sym in symbols if sym in table.index]]
+
+
+# Bars per symbol scanned into the pattern index (about a year of trading days)
+PATTERN_BARS = 260
+PATTERN_TREND_BARS = 5   # hammers and shooting stars need the close to have fallen/risen over this many bars
+PATTERN_AVG_BARS = 10    # "long" and "small" candle bodies are measured against this average
+PIVOT_BARS = 5           # a pivot high/low is the extreme of the bars this far either side of it
+# The index is keyed on the cache files it was built from, so this only bounds how long it stays in memory
+PATTERN_CACHE_SECONDS = 60 * 60
+
+# Pattern -> "bullish", "bearish" or "neutral"
+PATTERNS = {
+    "Doji": "neutral",
+    "Hammer": "bullish",
+    "Shooting Star": "bearish",
+    "Bullish Engulfing": "bullish",
+    "Bearish Engulfing": "bearish",
+    "Bullish Harami": "bullish",
+    "Bearish Harami": "bearish",
+    "Morning Star": "bullish",
+    "Evening Star": "bearish",
+    "Three White Soldiers": "bullish",
+    "Three Black Crows": "bearish",
+    "Support Pivot": "bullish",
+    "Resistance Pivot": "bearish",
+}
+
+
+def _shift(values: np.ndarray, bars: int) -> np.ndarray:
+    """Values from `bars` bars earlier (later for a negative count) along the last axis, NaN where there are none."""
+    out = np.full(values.shape, np.nan)
+    if bars > 0:
+        out[..., bars:] = values[..., :-bars]
+    elif bars < 0:
+        out[..., :bars] = values[..., -bars:]
+    else:
+        out[...] = values
+    return out
+
+
+def candlestick_patterns(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray) -> dict:
+    """
+    Boolean arrays marking the bar that completes each candlestick pattern, from comparisons of
+    the OHLC arrays with shifted copies of themselves. Bars with no range (e.g. gap fills) never match.
+    """
+    o, h, l, c = (np.asarray(x, dtype=np.float64) for x in (open_, high, low, close))
+    body = np.abs(c - o)
+    span = h - l
+    upper = h - np.maximum(o, c)
+    lower = np.minimum(o, c) - l
+    bull, bear = c > o, c < o
+    avg_body = _shift(sma(body, PATTERN_AVG_BARS), 1)
+    long_body = body > avg_body
+    small_body = body < 0.5 * avg_body
+    ranged = span > 0
+
+    o1, c1, o2, c2 = _shift(o, 1), _shift(c, 1), _shift(o, 2), _shift(c, 2)
+    bull1, bear1, bull2, bear2 = c1 > o1, c1 < o1, c2 > o2, c2 < o2
+    body1 = np.abs(c1 - o1)
+    long1, long2 = _shift(long_body, 1) > 0, _shift(long_body, 2) > 0
+    small1 = _shift(small_body, 1) > 0
+    falling = c1 < _shift(c, PATTERN_TREND_BARS + 1)
+    rising = c1 > _shift(c, PATTERN_TREND_BARS + 1)
+
+    with np.errstate(invalid="ignore"):
+        three_bull = bull & bull1 & bull2 & (c > c1) & (c1 > c2) & long_body & long1 & long2
+        three_bear = bear & bear1 & bear2 & (c < c1) & (c1 < c2) & long_body & long1 & long2
+        return {
+            "Doji": ranged & (body <= 0.1 * span),
+            "Hammer": ranged & (body > 0) & (lower >= 2 * body) & (upper <= 0.1 * span) & falling,
+            "Shooting Star": ranged & (body > 0) & (upper >= 2 * body) & (lower <= 0.1 * span) & rising,
+            "Bullish Engulfing": bear1 & bull & (o <= c1) & (c >= o1) & (body > body1),
+            "Bearish Engulfing": bull1 & bear & (o >= c1) & (c <= o1) & (body > body1),
+            "Bullish Harami": bear1 & long1 & bull & (o > c1) & (c < o1),
+            "Bearish Harami": bull1 & long1 & bear & (o < c1) & (c > o1),
+            "Morning Star": bear2 & long2 & small1 & (np.maximum(o1, c1) < c2) & bull & (c >= (o2 + c2) / 2),
+            "Evening Star": bull2 & long2 & small1 & (np.minimum(o1, c1) > c2) & bear & (c <= (o2 + c2) / 2),
+            # Each of the three opens inside the previous body
+            "Three White Soldiers": three_bull & (o > o1) & (o < c1) & (o1 > o2) & (o1 < c2),
+            "Three Black Crows": three_bear & (o < o1) & (o > c1) & (o1 < o2) & (o1 > c2),
+        }
+
+
+def pivots(high: np.ndarray, low: np.ndarray, bars: int = PIVOT_BARS):
+    """
+    (pivot highs, pivot lows): bars whose high (low) is above (below) every high (low) within `bars`
+    bars on either side, ties going to the earlier bar. A pivot is only known `bars` bars after it.
+    """
+    high, low = np.asarray(high, dtype=np.float64), np.asarray(low, dtype=np.float64)
+    is_high = np.ones(high.shape, dtype=bool)
+    is_low = np.ones(low.shape, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        for lag in range(1, bars + 1):
+            is_high &= (high > _shift(high, lag)) & (high >= _shift(high, -lag))
+            is_low &= (low < _shift(low, lag)) & (low <= _shift(low, -lag))
+    return is_high, is_low
+
+
+def detect_patterns(panel: dict) -> dict:
+    """
+    candlestick_patterns and pivots for every symbol of an align_series panel at once, as symbols x dates
+    boolean matrices aligned with the panel. Pivots from a symbol's last PIVOT_BARS bars are left out
+    until the bars that confirm them arrive.
+    """
+    shifted, first, last = justify_panel(panel)
+    found = candlestick_patterns(shifted["open"], shifted["high"], shifted["low"], shifted["close"])
+    found["Resistance Pivot"], found["Support Pivot"] = pivots(shifted["high"], shifted["low"])
+    confirmed = np.arange(shifted["close"].shape[1])[None, :] <= (last - first - PIVOT_BARS)[:, None]
+    found["Resistance Pivot"] &= confirmed
+    found["Support Pivot"] &= confirmed
+    return _unjustify(found, first, last, panel["close"].shape[1], False)
+
+
+def _build_pattern_index(symbols: list) -> pd.DataFrame:
+    series_by_symbol = {}
+    for sym in symbols:
+        series = load_series(CacheKey("TIME_SERIES_DAILY", sym), allow_stale=True)
+        if series is not None:
+            series_by_symbol[sym] = series
+    panel = align_series(series_by_symbol, PATTERN_BARS)
+    frames = []
+    for name, found in detect_patterns(panel).items():
+        rows, cols = np.nonzero(found)
+        if name == "Support Pivot":
+            level = panel["low"][rows, cols]
+        elif name == "Resistance Pivot":
+            level = panel["high"][rows, cols]
+        else:
+            level = panel["close"][rows, cols]
+        frames.append(pd.DataFrame({
+            "Date": pd.to_datetime(panel["date"][cols]),
+            "Ticker": np.array(panel["symbols"], dtype=object)[rows] if len(rows) else np.array([], dtype=object),
+            "Pattern": name,
+            "Signal": PATTERNS[name],
+            "Price": level,
+        }))
+    index = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        columns=["Date", "Ticker", "Pattern", "Signal", "Price"])
+    return index.sort_values(["Date", "Ticker"], kind="stable").set_index("Date")
+
+
+def pattern_index(symbols: list = None) -> pd.DataFrame:
+    """
+    Every pattern detected in the last PATTERN_BARS bars of the cached daily histories (all cached
+    symbols by default), one row per detection, indexed and sorted by date so a date range is a
+    binary search. Built from the cache only, and rebuilt when a cache file changes.
+    """
+    symbols = cached_symbols("TIME_SERIES_DAILY") if symbols is None else sorted(set(symbols))
+    version = []
+    for sym in symbols:
+        try:
+            version.append((sym, os.stat(CacheKey("TIME_SERIES_DAILY", sym).filename("npz")).st_mtime_ns))
+        except OSError:
+            pass
+    return shared_flights.do(
+        ("patterns", tuple(version)),
+        lambda: _build_pattern_index([sym for sym, _ in version]),
+        ttl=PATTERN_CACHE_SECONDS,
+    )
+
+
+def find_patterns(start=None, end=None, patterns: list = None, symbols: list = None) -> pd.DataFrame:
+    """Detections dated start..end (inclusive, either open), optionally only the given patterns and symbols."""
+    index = pattern_index()
+    found = index.loc[pd.Timestamp(start) if start is not None else None:
+                      pd.Timestamp(end) if end is not None else None]
+    if patterns:
+        found = found[found["Pattern"].isin(patterns)]
+    if symbols is not None:
+        found = found[found["Ticker"].isin(symbols)]
+    return found.reset_index()
+
+
+# Alpha Vantage indicator payloads that can be rebuilt from the daily series:
+# function -> (display name, fields in payload order)
+LOCAL_INDICATORS = {
+    "RSI": ("Relative Strength Index (RSI)", ("RSI",)),
+    "SMA": ("Simple Moving Average (SMA)", ("SMA",)),
+    "EMA": ("Exponential Moving Average (EMA)", ("EMA",)),
+    "MACD": ("Moving Average Convergence/Divergence (MACD)", ("MACD_Signal", "MACD", "MACD_Hist")),
+    "BBANDS": ("Bollinger Bands (BBANDS)", ("Real Upper Band", "Real Lower Band", "Real Middle Band")),
+    "STOCHRSI": ("Stochastic Relative Strength Index (STOCHRSI)", ("FastK", "FastD")),
+    "ATR": ("Average True Range (ATR)", ("ATR",)),
+    "OBV": ("On Balance Volume (OBV)", ("OBV",)),
+}
+
+
+def _indicator_columns(function: str, series: dict, time_period: int, series_type: str) -> dict:
+    values = series[series_type]
+    if function == "RSI":
+        return {"RSI": rsi(values, time_period)}
+    if function == "SMA":
+        return {"SMA": sma(values, time_period)}
+    if function == "EMA":
+        return {"EMA": ema(values, time_period)}
+    if function == "MACD":
+        line, signal, hist = macd(values)
+        return {"MACD_Signal": signal, "MACD": line, "MACD_Hist": hist}
+    if function == "BBANDS":
+        upper, middle, lower = bbands(values, time_period)
+        return {"Real Upper Band": upper, "Real Lower Band": lower, "Real Middle Band": middle}
+    if function == "STOCHRSI":
+        fastk, fastd = stochrsi(values, time_period)
+        return {"FastK": fastk, "FastD": fastd}
+    if function == "ATR":
+        return {"ATR": atr(series["high"], series["low"], series["close"], time_period)}
+    return {"OBV": obv(series["close"], series["volume"])}
+
+
+def indicator_payload(symbol: str, function: str, interval: str = "daily", time_period: int = 10,
+                      series_type: str = "close", priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """
+    An Alpha Vantage technical-indicator response built locally from the cached daily series,
+    resampled to weekly/monthly/quarterly as asked, so every timeframe shares one download.
+    Raises on fetch errors like fetch_daily_series.
+    """
+    series = fetch_daily_series("TIME_SERIES_DAILY", symbol, priority=priority)
+    if not series:
+        return {}
+    bars = resampled(CacheKey("TIME_SERIES_DAILY", symbol), series, interval)
+    display_name, _ = LOCAL_INDICATORS[function]
+    columns = _indicator_columns(function, bars, int(time_period), series_type)
+    valid = ~np.any([np.isnan(v) for v in columns.values()], axis=0)
+    analysis = {}
+    for i in np.flatnonzero(valid)[::-1]:  # newest first, like the API
+        analysis[str(bars["date"][i])] = {field: f"{values[i]:.4f}" for field, values in columns.items()}
+    return {
+        "Meta Data": {
+            "1: Symbol": symbol,
+            "2: Indicator": display_name,
+            "3: Last Refreshed": str(bars["date"][-1]),
+            "4: Interval": interval,
+            "5: Time Period": int(time_period),
+            "6: Series Type": series_type,
+            "7: Time Zone": "US/Eastern",
+        },
+        f"Technical Analysis: {function}": analysis,
+    }
+
+
+def parse_technical_indicators(symbol: str, rsi_period: int = RSI_PERIOD, interval: str = "daily") -> dict:
+    """
+    Fetch the daily price history for the given symbol once and derive the latest value
+    of every indicator from it locally, instead of one Alpha Vantage call per indicator.
+    Values come from the persisted streaming state, so only bars added since the last call are processed.
+    Weekly, monthly and quarterly values come from the same daily history, resampled.
+    """
+    try:
+        series = fetch_daily_series("TIME_SERIES_DAILY", symbol)
+    except Exception as e:
+        st.error(f"Error fetching price history for {symbol}: {e}")
+        return {}
+    if not series:
+        return {}
+
+    series = resampled(CacheKey("TIME_SERIES_DAILY", symbol), series, interval)
+    latest = latest_indicators(indicator_state_key(symbol, interval, rsi_period), series, rsi_period)
+    return {name: float(value) for name, value in latest.items() if not np.isnan(value)}
@@ -1,10 +1,23 @@
 import os
+import json
+import time
+import queue
+import shutil
+import hashlib
+import tempfile
+import threading
+import numpy as np
 import streamlit as st
-import PyPDF2
+import faiss
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
 from dotenv import load_dotenv
+from singleflight import shared as shared_flights
+from pdf_extract import iter_pages
+from embedding_cache import CachedEmbeddings
 
 # Load environment variables
 load_dotenv()
@@ -12,52 +25,357 @@ load_dotenv()
 # Retrieve OpenAI API key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-def create_or_load_vectorstore(force_recreate=False):
+DATA_FOLDER = "data"
+# The index, its chunks and a manifest of what they were built from live here between sessions
+VECTORSTORE_DIR = os.getenv("FINBOT_VECTORSTORE_DIR", os.path.join(".cache", "vectorstore"))
+EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+MANIFEST_VERSION = 2
+# Streaming build: chunks per embedding call, and how many items may wait between stages
+EMBED_BATCH_SIZE = 256
+PAGE_QUEUE_SIZE = 64
+CHUNK_QUEUE_SIZE = 2 * EMBED_BATCH_SIZE
+# Extracted text is split once this much of it has accumulated; only the last chunk is carried over
+SPLIT_BUFFER_CHARS = 16 * CHUNK_SIZE
+# Loaded indexes are keyed on the manifest they were saved with, so this only bounds how long one stays in memory
+VECTORSTORE_CACHE_SECONDS = 24 * 60 * 60
+
+# Builds run one at a time: two sessions updating together would both embed the same files and
+# each save an index missing the other's additions
+_build_lock = threading.Lock()
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _build_settings() -> dict:
+    """Everything besides the files themselves that the saved vectors depend on."""
+    return {"version": MANIFEST_VERSION, "model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+
+def _settings_match(manifest: dict) -> bool:
+    return manifest is not None and all(manifest.get(k) == v for k, v in _build_settings().items())
+
+def read_manifest(index_dir: str = VECTORSTORE_DIR):
+    try:
+        with open(os.path.join(index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def scan_sources(data_folder: str, manifest: dict = None, hash_files: bool = True) -> dict:
+    """
+    {file name: {"size", "mtime_ns", "sha256"}} for the PDFs in `data_folder`. A file whose size and
+    mtime match the manifest keeps its recorded hash; the rest are hashed (or get None without hash_files).
+    """
+    known = (manifest or {}).get("files", {})
+    sources = {}
+    for filename in sorted(os.listdir(data_folder)):
+        if not filename.endswith(".pdf"):
+            continue
+        stat = os.stat(os.path.join(data_folder, filename))
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        old = known.get(filename)
+        if old and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            entry["sha256"] = old["sha256"]
+        else:
+            entry["sha256"] = _file_digest(os.path.join(data_folder, filename)) if hash_files else None
+        sources[filename] = entry
+    return sources
+
+def is_stale(manifest: dict, sources: dict) -> bool:
+    """Whether an index saved with `manifest` no longer matches the settings or the source files."""
+    if not _settings_match(manifest):
+        return True
+    known = manifest.get("files", {})
+    return set(known) != set(sources) or any(known[f]["sha256"] != sources[f]["sha256"] for f in sources)
+
+def _read_index(index_dir: str, writable: bool = False):
+    """The saved FAISS index; memory-mapped read-only where this faiss build supports it, unless it is to be modified."""
+    path = os.path.join(index_dir, "index.faiss")
+    if writable:
+        return faiss.read_index(path)
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+def _assemble(index, chunks: dict):
+    """A langchain FAISS store over an ID-mapped index; search hits come back as chunk IDs."""
+    docstore = InMemoryDocstore({
+        chunk_id: Document(page_content=chunk["text"], metadata={"source": chunk["source"], "chunk_id": int(chunk_id)})
+        for chunk_id, chunk in chunks.items()
+    })
+    return FAISS(OpenAIEmbeddings(model=EMBEDDING_MODEL), index, docstore, {int(i): i for i in chunks})
+
+def _load(index_dir: str):
+    with open(os.path.join(index_dir, "chunks.json"), "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    return _assemble(_read_index(index_dir), chunks)
+
+def load_vectorstore(index_dir: str = VECTORSTORE_DIR):
     """
-    Create or load a FAISS vector store from local PDFs or an existing index.
+    The saved vector store, or None if there isn't one. Sessions share one loaded copy
+    until the index is saved again.
+    """
+    manifest = read_manifest(index_dir)
+    if manifest is None or not os.path.exists(os.path.join(index_dir, "index.faiss")):
+        return None
+    try:
+        return shared_flights.do(
+            ("vectorstore", os.path.abspath(index_dir), manifest.get("saved_at")),
+            lambda: _load(index_dir),
+            ttl=VECTORSTORE_CACHE_SECONDS,
+        )
+    except (OSError, ValueError, RuntimeError) as e:
+        st.warning(f"Could not load the saved vector store: {e}")
+        return None
+
+def _save(index_dir: str, index, chunks: list, manifest: dict) -> None:
+    """Write the index, chunks and manifest to a fresh directory, then swap it in."""
+    parent = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent, exist_ok=True)
+    name = os.path.basename(os.path.abspath(index_dir))
+    tmp_dir = tempfile.mkdtemp(prefix=f"{name}.", suffix=".tmp", dir=parent)
+    try:
+        faiss.write_index(index, os.path.join(tmp_dir, "index.faiss"))
+        with open(os.path.join(tmp_dir, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        # The manifest goes last: an index directory without one is never loaded
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    # The old index is moved inside a fresh holder directory, since a directory can't replace another one everywhere
+    holder = tempfile.mkdtemp(prefix=f"{name}.", suffix=".old", dir=parent)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, os.path.join(holder, name))
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(holder, ignore_errors=True)
+
+def _refresh_file_stats(index_dir: str, manifest: dict, sources: dict) -> None:
+    """Rewrite the manifest's size/mtime for files whose content still matches; saved_at is kept so the loaded index stays valid."""
+    files = manifest["files"]
+    if all(files[f]["size"] == sources[f]["size"] and files[f]["mtime_ns"] == sources[f]["mtime_ns"] for f in sources):
+        return
+    updated = {f: {**entry, "size": sources[f]["size"], "mtime_ns": sources[f]["mtime_ns"]} for f, entry in files.items()}
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=index_dir, prefix="manifest.",
+                                     suffix=".tmp", delete=False) as f:
+        json.dump({**manifest, "files": updated}, f, indent=2)
+    os.replace(f.name, os.path.join(index_dir, "manifest.json"))
+
+def create_or_load_vectorstore(force_recreate=False, full_rebuild=False):
+    """
+    Load the saved FAISS vector store; nothing is extracted or embedded here.
+    With force_recreate (the "Process Documents" button) the saved index is brought up to date first,
+    or rebuilt from nothing with full_rebuild.
     """
     if not force_recreate and "vector_store" in st.session_state and st.session_state['vector_store']:
         return st.session_state['vector_store']
 
-    vector_store = build_vectorstore_from_folder("data")
+    if force_recreate:
+        return build_vectorstore_from_folder(DATA_FOLDER, full_rebuild=full_rebuild)
+
+    if not OPENAI_API_KEY:
+        st.error("Missing OPENAI_API_KEY in .env.")
+        return None
+    manifest = read_manifest()
+    vector_store = load_vectorstore()
+    if vector_store is None:
+        st.info("No document index yet. Click 'Process Documents for Vector Store' to build it.")
+    elif os.path.isdir(DATA_FOLDER) and is_stale(manifest, scan_sources(DATA_FOLDER, manifest, hash_files=False)):
+        st.info("Documents have changed since they were indexed. Click 'Process Documents for Vector Store' to update.")
     return vector_store
 
-def build_vectorstore_from_folder(data_folder: str):
+def _chunk_ids(entry: dict) -> np.ndarray:
+    """Chunk IDs of one manifest file entry; each file's chunks get a contiguous block."""
+    return np.arange(entry["first_id"], entry["first_id"] + entry["count"], dtype=np.int64)
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+_STAGE_DONE = object()
+
+def _staged(items, maxsize: int):
+    """
+    Run the `items` generator on a background thread and yield its items through a queue of at most
+    `maxsize`, so a stage can run ahead of its consumer by that much and no further. Exceptions are
+    re-raised in the consumer; closing the consumer stops the producer.
+    """
+    q = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_STAGE_DONE)
+        except Exception as e:
+            put(_StageError(e))
+        finally:
+            items.close()
+
+    threading.Thread(target=produce, name="vectorstore-stage", daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+def _iter_chunks(pages, text_splitter):
     """
-    Reads local PDFs from a folder, splits text, embeds with OpenAI, and stores in a FAISS index in memory.
+    Turn the (path, page) stream of pdf_extract.iter_pages into (path, chunk), passing its end-of-file
+    and error markers through. Text is split whenever SPLIT_BUFFER_CHARS have built up; the last chunk
+    is kept to continue into the next pages, so chunks still overlap across the cut.
+    """
+    buffer, size = [], 0
+    for path, page in pages:
+        if isinstance(page, str):
+            buffer.append(page)
+            size += len(page)
+            if size >= SPLIT_BUFFER_CHARS:
+                pieces = text_splitter.split_text("".join(buffer))
+                for piece in pieces[:-1]:
+                    yield path, piece
+                buffer = pieces[-1:]
+                size = sum(len(piece) for piece in buffer)
+            continue
+        if page is None:
+            for piece in text_splitter.split_text("".join(buffer)):
+                yield path, piece
+        buffer, size = [], 0
+        yield path, page
+
+def build_vectorstore_from_folder(data_folder: str, index_dir: str = VECTORSTORE_DIR, full_rebuild: bool = False):
     """
+    Bring the saved index up to date with the PDFs in `data_folder` and return it.
+    The folder is diffed against the manifest: chunks of deleted or modified files are removed from
+    the ID-mapped index by their IDs, and only new or modified files are extracted and embedded.
+    Pages, chunks and vectors stream through the stages in bounded batches, so memory use doesn't
+    grow with the size of the files being added.
+    full_rebuild starts from an empty index; so does a change of embedding model or chunking.
+    Builds are serialised; a caller that waited for another's build finds the index already current.
+    """
+    with _build_lock:
+        return _build(data_folder, index_dir, full_rebuild)
+
+def _build(data_folder: str, index_dir: str, full_rebuild: bool):
     if not OPENAI_API_KEY:
         st.error("Missing OPENAI_API_KEY in .env.")
         return None
 
-    pdf_texts = []
-    for filename in os.listdir(data_folder):
-        if filename.endswith(".pdf"):
-            path = os.path.join(data_folder, filename)
-            try:
-                with open(path, "rb") as f:
-                    reader = PyPDF2.PdfReader(f)
-                    text = "".join(page.extract_text() or "" for page in reader.pages)
-                    pdf_texts.append(text)
-            except Exception as e:
-                st.warning(f"Error processing {filename}: {e}")
-
-    if not pdf_texts:
+    manifest = read_manifest(index_dir)
+    sources = scan_sources(data_folder, manifest)
+    if not sources and not (manifest or {}).get("files"):
         st.warning("No PDF files found or failed to extract text from PDFs.")
         return None
+    if not full_rebuild and not is_stale(manifest, sources):
+        # Same content, but a touch or checkout may have moved size/mtime; record them so startup stops re-checking
+        _refresh_file_stats(index_dir, manifest, sources)
+        return load_vectorstore(index_dir)
 
-    # Split text into chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    docs = [chunk for txt in pdf_texts for chunk in text_splitter.split_text(txt)]
+    index, chunks, files, next_id = None, {}, {}, 0
+    if not full_rebuild and _settings_match(manifest):
+        try:
+            index = _read_index(index_dir, writable=True)
+            with open(os.path.join(index_dir, "chunks.json"), "r", encoding="utf-8") as f:
+                chunks = json.load(f)
+            files, next_id = dict(manifest["files"]), manifest["next_id"]
+        except (OSError, ValueError, KeyError, RuntimeError):
+            index, chunks, files, next_id = None, {}, {}, 0
 
-    # Create embeddings using the updated OpenAIEmbeddings class
+    stale = [f for f, entry in files.items() if f not in sources or entry["sha256"] != sources[f]["sha256"]]
+    for filename in stale:
+        ids = _chunk_ids(files.pop(filename))
+        if len(ids):
+            index.remove_ids(ids)
+        for chunk_id in ids:
+            chunks.pop(str(chunk_id), None)
+
+    for filename, entry in files.items():
+        entry.update(size=sources[filename]["size"], mtime_ns=sources[filename]["mtime_ns"])
+    added = {os.path.join(data_folder, f): f for f in sources if f not in files}
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    # Text embedded before, by any build, comes from the cache instead of the API
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(model=EMBEDDING_MODEL), EMBEDDING_MODEL)
+    report, batch = [], []
+
+    def flush():
+        nonlocal index
+        if not batch:
+            return
+        vectors = np.asarray(embeddings.embed_documents([text for _, _, text in batch]), dtype=np.float32)
+        if index is None:
+            index = faiss.IndexIDMap(faiss.IndexFlatL2(vectors.shape[1]))
+        index.add_with_ids(vectors, np.array([chunk_id for _, chunk_id, _ in batch], dtype=np.int64))
+        for filename, chunk_id, text in batch:
+            chunks[str(chunk_id)] = {"source": filename, "text": text}
+        batch.clear()
+
+    # Pages -> splitter -> batched embedding -> index, with bounded queues between the stages
+    pipeline = _staged(_iter_chunks(_staged(iter_pages(list(added), report), PAGE_QUEUE_SIZE), text_splitter),
+                       CHUNK_QUEUE_SIZE)
     try:
-        embeddings = OpenAIEmbeddings()  # Automatically uses the API key from the environment
-        vector_store = FAISS.from_texts(docs, embeddings)
-        return vector_store
+        for path, item in pipeline:
+            filename = added[path]
+            if filename not in files:
+                files[filename] = {**sources[filename], "first_id": next_id, "count": 0}
+            if isinstance(item, str):
+                batch.append((filename, next_id, item))
+                files[filename]["count"] += 1
+                next_id += 1
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    flush()
+            elif isinstance(item, Exception):
+                # Recorded with no chunks, so it isn't retried until the file changes
+                st.warning(f"Error processing {filename}: {item}")
+                flush()
+                ids = _chunk_ids(files[filename])
+                if len(ids):
+                    index.remove_ids(ids)
+                for chunk_id in ids:
+                    chunks.pop(str(chunk_id), None)
+                files[filename]["count"] = 0
+        flush()
     except Exception as e:
         st.error(f"Error creating embeddings or vector store: {e}")
         return None
+    finally:
+        pipeline.close()
+    if report:
+        st.caption("Extracted " + ", ".join(
+            f"{r['file']} ({r['pages']} pages, {r['seconds']:.1f}s, {r['cpu_seconds']:.1f}s CPU)" for r in report))
+    if embeddings.hits + embeddings.misses:
+        looked_up = embeddings.hits + embeddings.misses
+        st.caption(f"Embedding cache: {embeddings.hits}/{looked_up} chunks reused ({embeddings.hits / looked_up:.0%}), "
+                   f"{embeddings.misses} sent to OpenAI")
+
+    if index is None:
+        st.warning("No PDF files found or failed to extract text from PDFs.")
+        return None
+    _save(index_dir, index, chunks, {**_build_settings(), "dim": int(index.d), "next_id": next_id,
+                                     "saved_at": time.time(), "files": files})
+    return load_vectorstore(index_dir)
 
 def similarity_search_docs(vector_store, query, k=3):
     """
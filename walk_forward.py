@@ -0,0 +1,226 @@
+"""
+Walk-forward optimisation of indicator rule parameters.
+
+History is cut into rolling windows: the parameter grid is searched on `train` bars, the best
+variant is then traded on the `test` bars that follow, and the window moves on by `step` bars.
+Only the out-of-sample test segments are stitched into the reported equity curve.
+
+Every indicator is causal, so each variant's signals are computed once over the whole history
+and every window just slices them; overlapping train windows never recompute an indicator.
+Variants are spread over a process pool, each worker keeping its own indicator cache.
+
+    python walk_forward.py IBM --train 756 --test 252 --workers 32 \\
+        --entry "RSI({period}) < {lower}" --exit "RSI({period}) > {upper}" \\
+        --grid period=5:30 lower=20,25,30,35 upper=65,70,75,80
+"""
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+# data_fetcher reads AV_API_KEY at import time, so load .env first when run from the command line
+load_dotenv()
+
+from backtest import (
+    BACKTEST_WORKERS,
+    DEFAULT_FEE_BPS,
+    DEFAULT_SLIPPAGE_BPS,
+    TASKS_PER_WORKER,
+    _prices,
+    expand_grid,
+    performance,
+    simulate,
+)
+from data_fetcher import fetch_daily_series
+from screener import Condition, ScreenerError, evaluate_series
+
+DEFAULT_TRAIN_BARS = 756   # about three years of trading days
+DEFAULT_TEST_BARS = 252    # about one year
+TEST_METRICS = ("Total Return", "CAGR", "Sharpe", "Max Drawdown", "Turnover", "Trades")
+
+
+def rolling_windows(n_bars: int, train: int, test: int, step: int = None) -> list:
+    """(train_start, test_start, test_end) bar indices; the last test window may be shorter."""
+    step = step or test
+    windows = []
+    start = 0
+    while start + train < n_bars:
+        windows.append((start, start + train, min(start + train + test, n_bars)))
+        start += step
+    return windows
+
+
+def _signals(prices: dict, rules: list, memo: dict):
+    """Entry and exit matrices (variants x bars) over the whole history."""
+    entry = np.vstack([evaluate_series(Condition(e), prices, memo) for e, _ in rules])
+    exit_ = np.vstack([evaluate_series(Condition(x), prices, memo) for _, x in rules])
+    return entry, exit_
+
+
+def _segment(prices: dict, dates: np.ndarray, entry: np.ndarray, exit_: np.ndarray, lo: int, hi: int,
+             fee_bps: float, slippage_bps: float) -> dict:
+    """Simulate bars lo..hi, starting flat on bar lo."""
+    result = simulate(prices["close"][0, lo:hi], entry[:, lo:hi], exit_[:, lo:hi], fee_bps, slippage_bps)
+    return performance(result, dates[lo:hi])
+
+
+def _score_variants(prices: dict, dates: np.ndarray, rules: list, windows: list, objective: str,
+                    fee_bps: float, slippage_bps: float, memo: dict) -> dict:
+    """
+    Train objective and test metrics for every (variant, window).
+    Returns {"train": variants x windows, metric: variants x windows for each of TEST_METRICS}.
+    """
+    entry, exit_ = _signals(prices, rules, memo)
+    out = {"train": np.full((len(rules), len(windows)), np.nan)}
+    for name in TEST_METRICS:
+        out[name] = np.full((len(rules), len(windows)), np.nan)
+    for w, (train_lo, test_lo, test_hi) in enumerate(windows):
+        out["train"][:, w] = _segment(prices, dates, entry, exit_, train_lo, test_lo, fee_bps, slippage_bps)[objective]
+        tested = _segment(prices, dates, entry, exit_, test_lo, test_hi, fee_bps, slippage_bps)
+        for name in TEST_METRICS:
+            out[name][:, w] = tested[name]
+    return out
+
+
+# Set in each pool worker by _init_worker. The memo keeps indicator arrays between the worker's tasks.
+_worker_prices = None
+_worker_dates = None
+_worker_memo = {}
+
+
+def _init_worker(prices: dict, dates: np.ndarray) -> None:
+    global _worker_prices, _worker_dates, _worker_memo
+    _worker_prices, _worker_dates, _worker_memo = prices, dates, {}
+
+
+def _score_variants_worker(rules: list, windows: list, objective: str, fee_bps: float, slippage_bps: float) -> dict:
+    return _score_variants(_worker_prices, _worker_dates, rules, windows, objective, fee_bps, slippage_bps, _worker_memo)
+
+
+def walk_forward(series: dict, entry_template: str, exit_template: str, grid: dict,
+                 train: int = DEFAULT_TRAIN_BARS, test: int = DEFAULT_TEST_BARS, step: int = None,
+                 objective: str = "Sharpe", fee_bps: float = DEFAULT_FEE_BPS,
+                 slippage_bps: float = DEFAULT_SLIPPAGE_BPS, workers: int = None):
+    """
+    Walk-forward optimise the rule templates over `grid` (see backtest.sweep for the template syntax).
+    Returns (per-window DataFrame, out-of-sample metrics dict, out-of-sample equity Series).
+    Raises ScreenerError for invalid rules and ValueError if the history is shorter than one window.
+    """
+    combos = expand_grid(grid)
+    if not combos:
+        raise ValueError("the parameter grid is empty")
+    try:
+        rules = [(entry_template.format(**c), exit_template.format(**c)) for c in combos]
+    except (KeyError, IndexError, ValueError) as e:
+        raise ScreenerError(f"rule templates don't match the grid parameters: {e}") from None
+    for text in set(r for rule in rules for r in rule):
+        Condition(text)
+
+    dates = series["date"]
+    windows = rolling_windows(len(dates), train, test, step)
+    if not windows:
+        raise ValueError(f"need more than {train} bars of history, have {len(dates)}")
+    prices = _prices(series)
+
+    workers = BACKTEST_WORKERS if workers is None else workers
+    if workers > 1 and len(rules) > 1:
+        # Contiguous chunks, so variants sharing an indicator tend to land on the same worker
+        bounds = np.linspace(0, len(rules), min(len(rules), workers * TASKS_PER_WORKER) + 1).astype(int)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(prices, dates)) as pool:
+            futures = [
+                pool.submit(_score_variants_worker, rules[lo:hi], windows, objective, fee_bps, slippage_bps)
+                for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+            ]
+            parts = [f.result() for f in futures]
+        scores = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    else:
+        scores = _score_variants(prices, dates, rules, windows, objective, fee_bps, slippage_bps, {})
+
+    train_scores = np.where(np.isnan(scores["train"]), -np.inf, scores["train"])
+    best = train_scores.argmax(axis=0)
+
+    rows, segments, oos_dates = [], [], []
+    memo = {}
+    for w, (train_lo, test_lo, test_hi) in enumerate(windows):
+        v = best[w]
+        row = {
+            "Train Start": dates[train_lo], "Test Start": dates[test_lo], "Test End": dates[test_hi - 1],
+            **combos[v], f"Train {objective}": scores["train"][v, w],
+        }
+        row.update({f"Test {name}": scores[name][v, w] for name in TEST_METRICS})
+        rows.append(row)
+
+        entry, exit_ = _signals(prices, [rules[v]], memo)
+        segments.append(simulate(prices["close"][0, test_lo:test_hi], entry[:, test_lo:test_hi],
+                                 exit_[:, test_lo:test_hi], fee_bps, slippage_bps))
+        oos_dates.append(dates[test_lo:test_hi])
+
+    # Stitch the test segments into one out-of-sample run
+    stitched = {k: np.concatenate([seg[k] for seg in segments], axis=-1) for k in ("position", "trades", "returns")}
+    stitched["equity"] = np.cumprod(1.0 + stitched["returns"], axis=-1)
+    oos_dates = np.concatenate(oos_dates)
+    oos = {k: float(v[0]) for k, v in performance(stitched, oos_dates).items()}
+    table = pd.DataFrame(rows)
+    for col in ("Train Start", "Test Start", "Test End"):
+        table[col] = pd.to_datetime(table[col])
+    return table, oos, pd.Series(stitched["equity"][0], index=pd.to_datetime(oos_dates), name="Walk-forward")
+
+
+def parse_grid(specs: list) -> dict:
+    """["period=5:30", "lower=20,25,30"] -> {"period": [5, ..., 30], "lower": [20, 25, 30]} (a:b[:step] is inclusive)."""
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if not values:
+            raise ValueError(f"grid entries look like name=1,2,3 or name=5:30[:step], got '{spec}'")
+        number = float if "." in values else int
+        if ":" in values:
+            parts = [number(p) for p in values.split(":")]
+            lo, hi, step = parts[0], parts[1], parts[2] if len(parts) > 2 else 1
+            grid[name] = list(np.arange(lo, hi + step / 2, step).astype(type(lo)).tolist())
+        else:
+            grid[name] = [number(v) for v in values.split(",") if v.strip()]
+    return grid
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Walk-forward optimise indicator rule parameters.")
+    parser.add_argument("symbol")
+    parser.add_argument("--entry", default="RSI({period}) < {lower}", help="entry rule template (screener syntax)")
+    parser.add_argument("--exit", default="RSI({period}) > {upper}", help="exit rule template (screener syntax)")
+    parser.add_argument("--grid", nargs="+", default=["period=5:30", "lower=20,25,30,35", "upper=65,70,75,80"])
+    parser.add_argument("--train", type=int, default=DEFAULT_TRAIN_BARS, help="bars per training window")
+    parser.add_argument("--test", type=int, default=DEFAULT_TEST_BARS, help="bars per test window")
+    parser.add_argument("--step", type=int, default=None, help="bars between windows (default: --test)")
+    parser.add_argument("--objective", default="Sharpe", choices=["Sharpe", "CAGR", "Total Return"])
+    parser.add_argument("--fee-bps", type=float, default=DEFAULT_FEE_BPS)
+    parser.add_argument("--slippage-bps", type=float, default=DEFAULT_SLIPPAGE_BPS)
+    parser.add_argument("--workers", type=int, default=None, help=f"worker processes (default {BACKTEST_WORKERS})")
+    args = parser.parse_args(argv)
+
+    series = fetch_daily_series("TIME_SERIES_DAILY", args.symbol.upper())
+    if not series:
+        print(f"No daily history available for {args.symbol}.", file=sys.stderr)
+        return 1
+    try:
+        table, oos, _ = walk_forward(
+            series, args.entry, args.exit, parse_grid(args.grid), args.train, args.test, args.step,
+            args.objective, args.fee_bps, args.slippage_bps, args.workers,
+        )
+    except (ScreenerError, ValueError) as e:
+        print(f"walk_forward: {e}", file=sys.stderr)
+        return 2
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(table.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    print("Out of sample: " + ", ".join(f"{k} {v:.4f}" for k, v in oos.items()))
+    latest = {k: table[k].iloc[-1].item() for k in parse_grid(args.grid)}
+    print(f"Latest window picks {latest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())